@@ -3,6 +3,19 @@ ASGI config for aicu_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+This is the production entry point (see the Procfile):
+
+    gunicorn aicu_project.asgi:application -k uvicorn_worker.UvicornWorker
+
+Each worker process runs an event loop: the async read views (``*/async/`` routes)
+wait on the database without holding a thread, so one process serves many slow
+clients concurrently. The synchronous DRF views keep working, but run one at a time
+per worker: Django runs them ``thread_sensitive``, on a single thread shared by the
+worker's requests, so run enough workers for the synchronous traffic. Streaming
+responses are consumed as async iterators (see ``api.asynchronous.iterate_in_thread``)
+so that they are not buffered whole. Keep ``CONN_MAX_AGE`` at 0 (the default): Django does not support
+persistent connections in async mode, use a pooler such as PgBouncer instead.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
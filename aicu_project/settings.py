@@ -1,6 +1,6 @@
 from pathlib import Path
 from datetime import timedelta
-from decouple import config
+from decouple import Csv, config
 import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -34,6 +34,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.db_routing.ReadYourWritesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,9 +76,81 @@ DATABASES = {
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST', default='127.0.0.1'),
         'PORT': config('DB_PORT', default='5432'),
+        # Seconds a connection is kept open between requests. Leave at 0 under ASGI and
+        # use a pooler such as PgBouncer instead (see aicu_project/asgi.py).
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=0, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas of the primary (comma-separated hosts, same credentials). Safe-method
+# requests read from them through `api.db_routing.PrimaryReplicaRouter`.
+DATABASE_REPLICAS = []
+for index, host in enumerate(config('DB_REPLICA_HOSTS', default='', cast=Csv()), start=1):
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{index}')
+
+# Mirror of `default` for the read replica tests, which enable it with override_settings:
+# it reads the test database through a connection of its own
+if 'test' in sys.argv and not DATABASE_REPLICAS:
+    DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+
+# Databases holding the health records, annotations and vitals (comma-separated hosts,
+# same credentials), each patient's on the shard picked by `api.sharding.shard_for_patient`.
+# Only ever append hosts, then run `manage.py migrate --database shard_<n>` and
+# `manage.py reshard`. Without shards all data stays in `default`.
+HEALTH_DATA_SHARDS = []
+for index, host in enumerate(config('DB_SHARD_HOSTS', default='', cast=Csv())):
+    DATABASES[f'shard_{index}'] = {**DATABASES['default'], 'HOST': host}
+    HEALTH_DATA_SHARDS.append(f'shard_{index}')
+
+# Local SQLite shards for the sharding tests, which enable them with override_settings
+if 'test' in sys.argv and not HEALTH_DATA_SHARDS:
+    for index in range(2):
+        DATABASES[f'shard_{index}'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / f'shard_{index}.sqlite3',
+        }
+
+# Threads reading the shards of a query concurrently (1 reads them one after the other)
+SHARD_FANOUT_WORKERS = config('SHARD_FANOUT_WORKERS', default=8, cast=int)
+
+DATABASE_ROUTERS = ['api.sharding.ShardRouter', 'api.db_routing.PrimaryReplicaRouter']
+
+# Seconds a user's reads stay on the primary after a write (read-your-writes)
+PRIMARY_PIN_SECONDS = config('PRIMARY_PIN_SECONDS', default=5, cast=int)
+# Seconds an unreachable replica is skipped before it is tried again
+REPLICA_RETRY_SECONDS = config('REPLICA_RETRY_SECONDS', default=30, cast=int)
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Use a shared backend (e.g. django.core.cache.backends.redis.RedisCache) in production
+# so that cached data is reused across gunicorn workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# Seconds a doctor's assigned-patient set stays cached (it is also invalidated on change)
+ASSIGNED_PATIENTS_CACHE_TIMEOUT = config('ASSIGNED_PATIENTS_CACHE_TIMEOUT', default=3600, cast=int)
+
+# Per-user cache of list responses (`api.response_cache`). Entries are invalidated by
+# data version bumps; the timeout only bounds staleness of data written without signals.
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=300, cast=int)
+# Timeout of the responses built from a replica, which may lack writes not replicated
+# yet: keep it close to the replication lag
+RESPONSE_CACHE_REPLICA_TIMEOUT = config('RESPONSE_CACHE_REPLICA_TIMEOUT', default=5, cast=int)
+# Seconds concurrent requests wait for another request building the same response
+RESPONSE_CACHE_LOCK_TIMEOUT = config('RESPONSE_CACHE_LOCK_TIMEOUT', default=10, cast=float)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -97,10 +171,12 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Set EMAIL_BACKEND=django.core.mail.backends.console.EmailBackend to print emails locally
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+
 if 'test' in sys.argv:
     EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -108,9 +184,31 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Email outbox worker (`manage.py send_outbox_emails`)
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=100, cast=int)
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+OUTBOX_RETRY_BACKOFF = config('OUTBOX_RETRY_BACKOFF', default=30, cast=int)  # seconds, doubled per attempt
+# Seconds to hold assignment emails back so they are coalesced into one digest per doctor (0 disables)
+NOTIFICATION_DIGEST_WINDOW = config('NOTIFICATION_DIGEST_WINDOW', default=0, cast=int)
+
+# Request metrics (`api.metrics`, served at /metrics). Set METRICS_DIR to a directory
+# shared by the gunicorn workers so that /metrics reports totals across all of them.
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5, cast=float)  # seconds
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.auth.authentication.RoleAwareJWTAuthentication',
+    ),
+    # orjson-backed JSON, byte-for-byte compatible with DRF's (stdlib fallback without orjson)
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
 }
 
@@ -121,8 +219,13 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': False,
     'AUTH_HEADER_TYPES': ('Bearer',),
     'BLACKLIST_APP': 'rest_framework_simplejwt.token_blacklist',
+    'TOKEN_OBTAIN_SERIALIZER': 'api.auth.serializers.RoleTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.auth.serializers.RoleTokenRefreshSerializer',
 }
 
+# Authorize read requests from the role claims of the access token, without loading the user
+JWT_STATELESS_READS = config('JWT_STATELESS_READS', default=False, cast=bool)
+
 AUTH_USER_MODEL = 'api.User'
 
 
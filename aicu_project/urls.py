@@ -17,6 +17,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from api.metrics import MetricsView
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -25,4 +27,6 @@ urlpatterns = [
     path('health_records/<int:record_id>/annotation/',  include('api.annotations.urls')),
     path('user_detail/',  include('api.users.urls')),
     path('assignments/',  include('api.assignments.urls')),
+    path('vitals/',  include('api.vitals.urls')),
+    path('metrics',  MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
@@ -1,10 +1,12 @@
 from rest_framework import serializers
+from api.fieldsets import SparseFieldsetSerializerMixin
+from api.metrics import TimedSerializerMixin
 from api.models import (
     Annotation,
 )
 
 
-class AnnotationSerializer(serializers.ModelSerializer):
+class AnnotationSerializer(TimedSerializerMixin, SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Annotation model.
     Includes a read-only doctor_name field derived from the related User model.
@@ -1,11 +1,16 @@
+from django.core.cache import cache
+from django.test import override_settings
 from rest_framework.test import APITestCase
 from django.urls import reverse
 from rest_framework import status
-from api.models import User, HealthRecord, DoctorPatientAssignment, Doctor, Patient
+from rest_framework_simplejwt.tokens import AccessToken
+from api.models import User, HealthRecord, Annotation, DoctorPatientAssignment, Doctor, Patient
+from api.testing import QueryBudgetMixin
 
-class AnnotationTests(APITestCase):
+class AnnotationTests(QueryBudgetMixin, APITestCase):
 
     def setUp(self):
+        cache.clear()
         self.doctor = User.objects.create_user(username="doc1", password="pass123", email="testd@test.com", role="doctor")
         Doctor.objects.create(user=self.doctor) 
         self.doctor.save()
@@ -37,3 +42,37 @@ class AnnotationTests(APITestCase):
         url = reverse("annotations-list", args=[self.record.id])
         response = self.client.post(url, {"comment": "New note"})
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=0)  # measure the uncached path
+    def test_list_query_budget(self):
+        url = reverse("annotations-list", args=[self.record.id])
+
+        def add_annotations():
+            for i in range(10):
+                Annotation.objects.create(record=self.record, doctor=self.doctor.doctor_profile, comment=f"Note {i}")
+
+        self.assertFlatQueryBudget(lambda: self.client.get(url), add_annotations, budget=3)
+
+    def test_sparse_fields(self):
+        Annotation.objects.create(record=self.record, doctor=self.doctor.doctor_profile, comment="Note")
+        url = reverse("annotations-list", args=[self.record.id])
+        self.client.get(url)
+
+        with self.assertQueryBudget(1) as queries:
+            response = self.client.get(url, {"fields": "comment"})
+        self.assertEqual(response.data["results"], [{"comment": "Note"}])
+        self.assertNotIn("api_user", queries.captured_queries[0]["sql"])
+
+        response = self.client.get(url, {"fields": "comment,unknown"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_async_list(self):
+        await Annotation.objects.acreate(record=self.record, doctor=self.doctor.doctor_profile, comment="Note")
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(self.doctor)}"}
+        response = await self.async_client.get(reverse("annotations-async-list", args=[self.record.id]), headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([a["comment"] for a in response.json()["results"]], ["Note"])
+
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(self.patient)}"}
+        response = await self.async_client.get(reverse("annotations-async-list", args=[self.record.id]), headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AnnotationViewSet
+from .views import AnnotationViewSet, async_annotation_detail, async_annotation_list
 
 router = DefaultRouter()
 router.register(r'', AnnotationViewSet, basename='annotations')
 
 urlpatterns = [
+    path('async/', async_annotation_list, name='annotations-async-list'),
+    path('async/<int:pk>/', async_annotation_detail, name='annotations-async-detail'),
     path('', include(router.urls)),
 ]
@@ -2,12 +2,17 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.exceptions import PermissionDenied, NotFound, ValidationError
 from rest_framework.response import Response
 
-from api.models import Annotation, HealthRecord, DoctorPatientAssignment
+from api.models import Annotation, HealthRecord
 from .serializers import AnnotationSerializer
+from api.asynchronous import async_api_view
 from api.auth.views import require_doctor
+from api.cache import get_assigned_patient_ids
+from api.fieldsets import SparseFieldsetMixin
+from api.pagination import KeysetPagination
+from api.response_cache import cached_response, doctor_scope
 
 
-class AnnotationViewSet(viewsets.ModelViewSet):
+class AnnotationViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     ViewSet to handle annotations made by doctors on patient health records.
 
@@ -21,20 +26,41 @@ class AnnotationViewSet(viewsets.ModelViewSet):
         - POST /records/{record_id}/annotations/
         - PUT /annotations/{id}/
         - DELETE /annotations/{id}/
+
+    Lists are keyset-paginated on `(created_at, id)`, and `?fields=` selects the
+    returned fields on list/detail.
     """
 
     serializer_class = AnnotationSerializer
+    pagination_class = KeysetPagination
+    stateless_auth = True
     permission_classes = [permissions.IsAuthenticated]
+    sparse_field_columns = {
+        "doctor_name": ("doctor__user__first_name", "doctor__user__last_name"),
+    }
 
     def get_queryset(self):
         """
         Filter annotations to those created by the authenticated doctor.
 
+        The doctor's user is only joined when `doctor_name` is rendered.
+
         Returns:
             QuerySet of Annotation objects.
         """
         doctor = require_doctor(self.request.user)
-        return Annotation.objects.filter(doctor=doctor)
+        queryset = Annotation.objects.filter(doctor=doctor)
+        if self.wants_field("doctor_name"):
+            queryset = queryset.select_related("doctor__user")
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """
+        List the doctor's annotations. Responses are cached per user until one of
+        the doctor's annotations changes (see `api.response_cache`).
+        """
+        scopes = [doctor_scope(require_doctor(request.user).id)]
+        return cached_response(request, scopes, lambda: super(AnnotationViewSet, self).list(request, *args, **kwargs))
 
     def perform_create(self, serializer):
         """
@@ -50,11 +76,11 @@ class AnnotationViewSet(viewsets.ModelViewSet):
             raise ValidationError({"record_id": "'record_id' parameter is missing."})
 
         try:
-            record = HealthRecord.objects.select_related("patient").get(pk=record_id)
+            record = HealthRecord.objects.get(pk=record_id)
         except HealthRecord.DoesNotExist:
             raise NotFound("Health record not found.")
 
-        if not DoctorPatientAssignment.objects.filter(doctor=doctor, patient=record.patient).exists():
+        if record.patient_id not in get_assigned_patient_ids(doctor.id):
             raise PermissionDenied("You are not assigned to this patient.")
 
         serializer.save(doctor=doctor, record=record)
@@ -80,3 +106,43 @@ class AnnotationViewSet(viewsets.ModelViewSet):
         if annotation.doctor != require_doctor(request.user):
             raise PermissionDenied("You can only delete your own annotations.")
         return super().destroy(request, *args, **kwargs)
+
+
+@async_api_view(stateless=True)
+async def async_annotation_list(request, record_id):
+    """
+    GET /health_records/{record_id}/annotation/async/
+    -------------------------------------------------
+    Async variant of the annotation list, for ASGI deployments. Like
+    `AnnotationViewSet.list`, lists the authenticated doctor's annotations.
+
+    Returns:
+        200 OK with a page of annotations,
+        403 Forbidden if the user is not a doctor.
+    """
+    doctor = require_doctor(request.user)
+    queryset = Annotation.objects.filter(doctor=doctor).select_related("doctor__user")
+    paginator = KeysetPagination()
+    page = await paginator.apaginate_queryset(queryset, request)
+    return paginator.get_paginated_data(AnnotationSerializer(page, many=True).data)
+
+
+@async_api_view(stateless=True)
+async def async_annotation_detail(request, record_id, pk):
+    """
+    GET /health_records/{record_id}/annotation/async/{id}/
+    ------------------------------------------------------
+    Async variant of `AnnotationViewSet.retrieve`.
+
+    Returns:
+        200 OK with the annotation,
+        403 Forbidden if the user is not a doctor,
+        404 Not Found if the annotation is not one of the doctor's.
+    """
+    doctor = require_doctor(request.user)
+    annotation = await (
+        Annotation.objects.filter(doctor=doctor, pk=pk).select_related("doctor__user").afirst()
+    )
+    if annotation is None:
+        raise NotFound("No Annotation matches the given query.")
+    return AnnotationSerializer(annotation).data
@@ -7,3 +7,11 @@ class ApiConfig(AppConfig):
 
     def ready(self):
         import api.notifications
+        import api.cache
+        import api.auth.tokens
+        import api.conditional
+        import api.sync
+        import api.search
+        import api.metrics
+        import api.response_cache
+        import api.sharding
@@ -1,8 +1,9 @@
 from rest_framework import serializers
-from api.models import DoctorPatientAssignment
+from api.metrics import TimedSerializerMixin
+from api.models import DoctorPatientAssignment, Doctor
 
 
-class AssignmentSerializer(serializers.ModelSerializer):
+class AssignmentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the DoctorPatientAssignment model.
     Includes read-only fields for displaying the names of the doctor and patient.
@@ -18,3 +19,34 @@ class AssignmentSerializer(serializers.ModelSerializer):
     class Meta:
         model = DoctorPatientAssignment
         fields = "__all__"
+        # Uniqueness is enforced by the database constraint on insert, see
+        # `AssignmentViewSet.perform_create`.
+        validators = []
+
+
+class BulkAssignmentSerializer(serializers.Serializer):
+    """
+    Input for assigning many patients to one doctor in a single request.
+    """
+
+    doctor = serializers.PrimaryKeyRelatedField(queryset=Doctor.objects.all())
+    patients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10000
+    )
+
+
+class TransferAssignmentsSerializer(serializers.Serializer):
+    """
+    Input for moving every patient of one doctor to another doctor.
+    """
+
+    from_doctor = serializers.PrimaryKeyRelatedField(queryset=Doctor.objects.all())
+    to_doctor = serializers.PrimaryKeyRelatedField(queryset=Doctor.objects.all())
+
+    def validate(self, attrs):
+        """
+        Ensure the caseload is moved to a different doctor.
+        """
+        if attrs["from_doctor"] == attrs["to_doctor"]:
+            raise serializers.ValidationError("'from_doctor' and 'to_doctor' must be different.")
+        return attrs
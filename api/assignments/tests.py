@@ -1,11 +1,20 @@
+from unittest import mock
+from django.core import mail
+from django.core.cache import cache
+from django.test import override_settings
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from django.urls import reverse
 from rest_framework import status
-from api.models import User, DoctorPatientAssignment, Doctor, Patient
+from api.models import User, DoctorPatientAssignment, Doctor, Patient, EmailOutbox
+from api.notifications import send_pending_emails
+from api.cache import get_assigned_patient_ids
+from api.testing import QueryBudgetMixin
 
-class AssignmentTests(APITestCase):
+class AssignmentTests(QueryBudgetMixin, APITestCase):
 
     def setUp(self):
+        cache.clear()
         self.admin = User.objects.create_superuser(username="admin", password="admin123")
         self.doctor = User.objects.create_user(username="doc", password="pass", email="testd@test.com", role="doctor")
         Doctor.objects.create(user=self.doctor) 
@@ -23,3 +32,196 @@ class AssignmentTests(APITestCase):
         data = {"doctor": self.doctor.id, "patient": self.patient.id}
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_query_budget(self):
+        DoctorPatientAssignment.objects.create(doctor=self.doctor.doctor_profile, patient=self.patient.patient_profile)
+        url = reverse("assignments-list")
+
+        def add_assignments():
+            for i in range(10):
+                user = User.objects.create_user(username=f"pat{i}", password="pass", email=f"pat{i}@test.com", role="patient")
+                patient = Patient.objects.create(user=user)
+                DoctorPatientAssignment.objects.create(doctor=self.doctor.doctor_profile, patient=patient)
+
+        self.assertFlatQueryBudget(lambda: self.client.get(url), add_assignments, budget=2)
+
+    def test_create_assignment_is_single_insert(self):
+        url = reverse("assignments-list")
+        data = {"doctor": self.doctor.doctor_profile.id, "patient": self.patient.patient_profile.id}
+        with self.assertQueryBudget(8) as context:
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(any("api_doctorpatientassignment" in q["sql"] and q["sql"].startswith("SELECT") for q in context.captured_queries))
+
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(DoctorPatientAssignment.objects.count(), 1)
+
+
+class AssignedPatientCacheTests(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = Doctor.objects.create(user=User.objects.create_user(username="doc", password="pass", email="testd@test.com", role="doctor"))
+        self.other_doctor = Doctor.objects.create(user=User.objects.create_user(username="doc2", password="pass", email="testd2@test.com", role="doctor"))
+        self.patient = Patient.objects.create(user=User.objects.create_user(username="pat", password="pass", email="testp@test.com", role="patient"))
+
+    def test_set_is_cached(self):
+        self.assertEqual(get_assigned_patient_ids(self.doctor.id), frozenset())
+        with self.assertQueryBudget(0):
+            get_assigned_patient_ids(self.doctor.id)
+
+    def test_invalidated_on_save_and_delete(self):
+        get_assigned_patient_ids(self.doctor.id)
+        assignment = DoctorPatientAssignment.objects.create(doctor=self.doctor, patient=self.patient)
+        self.assertEqual(get_assigned_patient_ids(self.doctor.id), {self.patient.id})
+
+        assignment.delete()
+        self.assertEqual(get_assigned_patient_ids(self.doctor.id), frozenset())
+
+    def test_reassignment_invalidates_both_doctors(self):
+        assignment = DoctorPatientAssignment.objects.create(doctor=self.doctor, patient=self.patient)
+        self.assertEqual(get_assigned_patient_ids(self.doctor.id), {self.patient.id})
+        self.assertEqual(get_assigned_patient_ids(self.other_doctor.id), frozenset())
+
+        assignment.doctor = self.other_doctor
+        assignment.save()
+        self.assertEqual(get_assigned_patient_ids(self.doctor.id), frozenset())
+        self.assertEqual(get_assigned_patient_ids(self.other_doctor.id), {self.patient.id})
+
+
+class EmailOutboxTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username="admin", password="admin123")
+        self.doctor = Doctor.objects.create(user=User.objects.create_user(username="doc", password="pass", email="testd@test.com", role="doctor"))
+        self.patient = Patient.objects.create(user=User.objects.create_user(username="pat", password="pass", email="testp@test.com", role="patient", first_name="Ana", last_name="Diaz"))
+        self.client.force_authenticate(self.admin)
+
+    def test_assignment_queues_email_without_sending(self):
+        response = self.client.post(reverse("assignments-list"), {"doctor": self.doctor.id, "patient": self.patient.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(mail.outbox), 0)
+
+        email = EmailOutbox.objects.get()
+        self.assertEqual(email.to_email, "testd@test.com")
+        self.assertIn("Ana Diaz", email.body)
+
+        self.assertEqual(send_pending_emails(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["testd@test.com"])
+        email.refresh_from_db()
+        self.assertEqual(email.status, "sent")
+
+    def test_failed_send_is_retried_with_backoff(self):
+        DoctorPatientAssignment.objects.create(doctor=self.doctor, patient=self.patient)
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("SMTP down")):
+            self.assertEqual(send_pending_emails(max_attempts=2), (0, 1))
+
+        email = EmailOutbox.objects.get()
+        self.assertEqual((email.status, email.attempts), ("pending", 1))
+        self.assertGreater(email.next_attempt_at, timezone.now())
+        self.assertEqual(send_pending_emails(), (0, 0))
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("SMTP down")):
+            send_pending_emails(max_attempts=2)
+        email.refresh_from_db()
+        self.assertEqual(email.status, "failed")
+
+    @override_settings(NOTIFICATION_DIGEST_WINDOW=60)
+    def test_assignments_are_coalesced_per_doctor(self):
+        other_doctor = Doctor.objects.create(user=User.objects.create_user(username="doc2", password="pass", email="testd2@test.com", role="doctor"))
+        for i in range(5):
+            patient = Patient.objects.create(user=User.objects.create_user(username=f"pat{i}", password="pass", email=f"pat{i}@test.com", role="patient", first_name=f"Pat{i}", last_name="Test"))
+            DoctorPatientAssignment.objects.create(doctor=self.doctor, patient=patient)
+        DoctorPatientAssignment.objects.create(doctor=other_doctor, patient=self.patient)
+
+        self.assertEqual(send_pending_emails(), (0, 0))
+
+        EmailOutbox.objects.filter(digest_item="Pat0 Test").update(next_attempt_at=timezone.now())
+        EmailOutbox.objects.filter(digest_item="Ana Diaz").update(next_attempt_at=timezone.now())
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.open") as open_connection:
+            self.assertEqual(send_pending_emails(), (2, 0))
+        open_connection.assert_called_once()
+
+        self.assertEqual(len(mail.outbox), 2)
+        digest = next(m for m in mail.outbox if m.to == ["testd@test.com"])
+        self.assertEqual(digest.subject, "5 new patients assigned")
+        self.assertIn("- Pat4 Test", digest.body)
+        self.assertFalse(EmailOutbox.objects.filter(status="pending").exists())
+
+
+
+class BulkAssignmentTests(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username="admin", password="admin123")
+        self.doctor = Doctor.objects.create(user=User.objects.create_user(username="doc", password="pass", email="testd@test.com", role="doctor"))
+        self.other_doctor = Doctor.objects.create(user=User.objects.create_user(username="doc2", password="pass", email="testd2@test.com", role="doctor"))
+        self.patients = [
+            Patient.objects.create(user=User.objects.create_user(username=f"pat{i}", password="pass", email=f"pat{i}@test.com", role="patient", first_name=f"Pat{i}", last_name="Test"))
+            for i in range(6)
+        ]
+        self.client.force_authenticate(self.admin)
+
+    def test_bulk_assign_skips_existing(self):
+        DoctorPatientAssignment.objects.create(doctor=self.doctor, patient=self.patients[0])
+        EmailOutbox.objects.all().delete()
+        get_assigned_patient_ids(self.doctor.id)
+
+        with self.assertQueryBudget(12):
+            response = self.client.post(
+                reverse("assignments-bulk"),
+                {"doctor": self.doctor.id, "patients": [p.id for p in self.patients]},
+                format="json",
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"created": 5, "skipped": 1})
+        self.assertEqual(get_assigned_patient_ids(self.doctor.id), {p.id for p in self.patients})
+        self.assertEqual(EmailOutbox.objects.get().subject, "5 new patients assigned")
+
+    def test_overlapping_bulk_assignments_notify_once(self):
+        EmailOutbox.objects.all().delete()
+        url = reverse("assignments-bulk")
+        response = self.client.post(url, {"doctor": self.doctor.id, "patients": [p.id for p in self.patients[:3]]}, format="json")
+        self.assertEqual(response.data, {"created": 3, "skipped": 0})
+
+        # Patients assigned by the earlier request are skipped and not notified again
+        response = self.client.post(url, {"doctor": self.doctor.id, "patients": [p.id for p in self.patients[1:4]]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"created": 1, "skipped": 2})
+        self.assertEqual(DoctorPatientAssignment.objects.filter(doctor=self.doctor).count(), 4)
+        digest = EmailOutbox.objects.exclude(subject="3 new patients assigned").get()
+        self.assertIn("Pat3 Test", digest.body)
+        self.assertNotIn("Pat1 Test", digest.body)
+
+    def test_bulk_assign_rejects_unknown_patients(self):
+        response = self.client.post(
+            reverse("assignments-bulk"), {"doctor": self.doctor.id, "patients": [self.patients[0].id, 999]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(DoctorPatientAssignment.objects.exists())
+
+    def test_transfer_caseload(self):
+        for patient in self.patients[:4]:
+            DoctorPatientAssignment.objects.create(doctor=self.doctor, patient=patient)
+        DoctorPatientAssignment.objects.create(doctor=self.other_doctor, patient=self.patients[0])
+        EmailOutbox.objects.all().delete()
+        get_assigned_patient_ids(self.other_doctor.id)
+
+        response = self.client.post(
+            reverse("assignments-transfer"), {"from_doctor": self.doctor.id, "to_doctor": self.other_doctor.id}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"created": 3, "skipped": 1})
+        self.assertEqual(get_assigned_patient_ids(self.doctor.id), frozenset())
+        self.assertEqual(get_assigned_patient_ids(self.other_doctor.id), {p.id for p in self.patients[:4]})
+        self.assertEqual(EmailOutbox.objects.get().to_email, "testd2@test.com")
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(self.doctor.user)
+        response = self.client.post(reverse("assignments-bulk"), {"doctor": self.doctor.id, "patients": [1]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
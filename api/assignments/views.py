@@ -1,9 +1,15 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-from api.models import DoctorPatientAssignment
-from .serializers import AssignmentSerializer
+from api.models import Doctor, DoctorPatientAssignment, Patient
+from .serializers import AssignmentSerializer, BulkAssignmentSerializer, TransferAssignmentsSerializer
+from api.cache import invalidate_assigned_patient_ids
+from api.notifications import queue_assignment_digest
+from api.pagination import AssignmentPagination
 
 
 class AssignmentViewSet(viewsets.ModelViewSet):
@@ -17,27 +23,34 @@ class AssignmentViewSet(viewsets.ModelViewSet):
         - GET /assignments/
         - POST /assignments/
         - DELETE /assignments/{id}/
+        - POST /assignments/bulk/
+        - POST /assignments/transfer/
+
+    Lists are keyset-paginated on `(assigned_at, id)`.
     """
 
-    queryset = DoctorPatientAssignment.objects.all()
+    queryset = DoctorPatientAssignment.objects.select_related("doctor__user", "patient__user")
     serializer_class = AssignmentSerializer
+    pagination_class = AssignmentPagination
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
 
     def perform_create(self, serializer):
         """
         Prevent duplicate doctor-patient assignments.
 
+        The insert is attempted directly and the `unique_doctor_patient_assignment`
+        constraint rejects duplicates, so there is no separate existence check that
+        concurrent requests could race past.
+
         Raises:
             ValidationError: if the same doctor is already assigned to the patient.
         """
-        doctor = serializer.validated_data.get("doctor")
-        patient = serializer.validated_data.get("patient")
-
-        if DoctorPatientAssignment.objects.filter(doctor=doctor, patient=patient).exists():
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
             raise ValidationError("This doctor is already assigned to this patient.")
 
-        serializer.save()
-
     def destroy(self, request, *args, **kwargs):
         """
         Delete a doctor-patient assignment.
@@ -48,3 +61,104 @@ class AssignmentViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         self.perform_destroy(instance)
         return Response({"message": "Assignment deleted successfully"}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Assign many patients to one doctor in a single set-based insert.
+
+        Request body:
+            - doctor: Doctor id
+            - patients: list of Patient ids
+
+        Patients already assigned to the doctor are skipped. The doctor receives one
+        notification listing every newly assigned patient. Concurrent requests for the
+        same doctor are serialized on the doctor's row.
+
+        Returns:
+            200 OK with `created` and `skipped` counts,
+            400 Bad Request if the input is invalid or references unknown patients.
+        """
+        serializer = BulkAssignmentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        doctor = serializer.validated_data["doctor"]
+        patient_ids = set(serializer.validated_data["patients"])
+
+        names = {
+            patient_id: f"{first_name} {last_name}".strip()
+            for patient_id, first_name, last_name in Patient.objects.filter(
+                id__in=patient_ids
+            ).values_list("id", "user__first_name", "user__last_name")
+        }
+        missing = sorted(patient_ids - names.keys())
+        if missing:
+            raise ValidationError({"patients": f"Unknown patient ids: {missing}"})
+
+        with transaction.atomic():
+            # Serialize bulk assignments to the same doctor: a concurrent request could
+            # otherwise insert rows between the read below and the insert, and both
+            # would report (and notify) those patients as created
+            Doctor.objects.select_for_update().get(pk=doctor.pk)
+            existing = set(
+                DoctorPatientAssignment.objects.filter(
+                    doctor=doctor, patient_id__in=patient_ids
+                ).values_list("patient_id", flat=True)
+            )
+            new_ids = sorted(patient_ids - existing)
+            DoctorPatientAssignment.objects.bulk_create(
+                [DoctorPatientAssignment(doctor=doctor, patient_id=patient_id) for patient_id in new_ids],
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+            invalidate_assigned_patient_ids(doctor.id)
+            queue_assignment_digest(doctor.id, doctor.user.email, [names[i] for i in new_ids])
+
+        return Response(
+            {"created": len(new_ids), "skipped": len(patient_ids) - len(new_ids)},
+            status=status.HTTP_200_OK,
+        )
+
+    @action(detail=False, methods=["post"])
+    def transfer(self, request):
+        """
+        Move every patient of one doctor to another doctor in one transaction.
+
+        Request body:
+            - from_doctor: Doctor id whose caseload is moved
+            - to_doctor: Doctor id receiving the caseload
+
+        Assignments of patients the target doctor already has are removed instead of
+        moved. The target doctor receives one notification listing the moved patients.
+
+        Returns:
+            200 OK with `created` (moved) and `skipped` (already assigned) counts,
+            400 Bad Request if the input is invalid.
+        """
+        serializer = TransferAssignmentsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        from_doctor = serializer.validated_data["from_doctor"]
+        to_doctor = serializer.validated_data["to_doctor"]
+
+        with transaction.atomic():
+            # Serialized with bulk assignments to either doctor, locked in id order
+            list(Doctor.objects.select_for_update().filter(pk__in=[from_doctor.pk, to_doctor.pk]).order_by("pk"))
+            already_assigned = DoctorPatientAssignment.objects.filter(doctor=to_doctor).values("patient_id")
+            caseload = DoctorPatientAssignment.objects.filter(doctor=from_doctor)
+
+            skipped, _ = caseload.filter(patient_id__in=already_assigned).delete()
+            moved = list(
+                caseload.select_for_update(of=("self",)).values_list(
+                    "id", "patient__user__first_name", "patient__user__last_name"
+                )
+            )
+            DoctorPatientAssignment.objects.filter(id__in=[row[0] for row in moved]).update(
+                doctor=to_doctor, assigned_at=timezone.now()
+            )
+            invalidate_assigned_patient_ids(from_doctor.id, to_doctor.id)
+            queue_assignment_digest(
+                to_doctor.id,
+                to_doctor.user.email,
+                [f"{first_name} {last_name}".strip() for _, first_name, last_name in moved],
+            )
+
+        return Response({"created": len(moved), "skipped": skipped}, status=status.HTTP_200_OK)
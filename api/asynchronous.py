@@ -0,0 +1,97 @@
+import functools
+import itertools
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.http.response import HttpResponseBase
+from rest_framework import exceptions
+from rest_framework.request import Request
+
+from api.auth.authentication import RoleAwareJWTAuthentication
+from api.renderers import FastJSONRenderer
+
+
+def render_json(data, status=200, headers=None):
+    """
+    Render data the way the API's JSON renderer does, into a plain HttpResponse.
+    """
+    return HttpResponse(
+        FastJSONRenderer().render(data),
+        status=status,
+        content_type="application/json",
+        headers=headers,
+    )
+
+
+def async_api_view(stateless=False):
+    """
+    Turn an async function into a read-only API view served without threads under ASGI.
+
+    DRF's dispatch is synchronous, so these views bypass it: the request is
+    authenticated with `RoleAwareJWTAuthentication.aauthenticate` and wrapped in a DRF
+    `Request` (for `query_params` and serializer contexts) before calling the view.
+    The view returns either data, rendered as JSON, or a response. `APIException`s
+    are rendered like DRF's exception handler does.
+
+    Params:
+        stateless (bool): Authorize from the token's role claims alone when
+            `JWT_STATELESS_READS` is enabled, like `stateless_auth` on DRF views.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method != "GET":
+                return render_json(
+                    {"detail": f'Method "{request.method}" not allowed.'}, 405, {"Allow": "GET"}
+                )
+
+            authenticator = RoleAwareJWTAuthentication()
+            try:
+                authenticated = await authenticator.aauthenticate(request, stateless=stateless)
+                if authenticated is None:
+                    raise exceptions.NotAuthenticated()
+                drf_request = Request(request)
+                drf_request.user, drf_request.auth = authenticated
+                response = await view(drf_request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                headers = None
+                if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                    headers = {"WWW-Authenticate": authenticator.authenticate_header(request)}
+                detail = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+                return render_json(detail, exc.status_code, headers)
+
+            if isinstance(response, HttpResponseBase):
+                return response
+            return render_json(response)
+
+        return wrapper
+
+    return decorator
+
+
+async def iterate_in_thread(iterable, batch_size):
+    """
+    Iterate a synchronous iterable (e.g. a generator reading a server-side cursor) from
+    async code, without blocking the event loop and without buffering it whole.
+
+    Under ASGI, `StreamingHttpResponse` consumes a synchronous iterator with
+    `sync_to_async(list)`, building the whole body before sending its first byte;
+    given this async iterator instead, it sends each batch as soon as it is produced.
+    Batches are pulled on the request's thread-sensitive thread, so database
+    connections and cursors stay on the thread that opened them.
+
+    Params:
+        iterable (iterable): The synchronous stream.
+        batch_size (int): Items pulled per switch to the thread.
+    Yields:
+        The items of `iterable`.
+    """
+    iterator = iter(iterable)
+    take = sync_to_async(lambda: list(itertools.islice(iterator, batch_size)))
+    while True:
+        batch = await take()
+        if not batch:
+            return
+        for item in batch:
+            yield item
@@ -0,0 +1,198 @@
+from django.conf import settings
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from api.models import Patient, Doctor
+
+
+# Claims added to tokens by `api.auth.tokens.add_role_claims`
+ROLE_CLAIM = "role"
+PATIENT_ID_CLAIM = "patient_id"
+DOCTOR_ID_CLAIM = "doctor_id"
+PROFILE_VERSION_CLAIM = "profile_version"
+
+
+class ResolvedRole:
+    """
+    The role of an authenticated user together with its already loaded profile.
+
+    Attributes:
+        name (str | None): "patient", "doctor" or None.
+        patient (Patient | None): The patient profile, if any.
+        doctor (Doctor | None): The doctor profile, if any.
+    """
+
+    __slots__ = ("name", "patient", "doctor")
+
+    def __init__(self, patient=None, doctor=None):
+        self.patient = patient
+        self.doctor = doctor
+        if patient is not None:
+            self.name = "patient"
+        elif doctor is not None:
+            self.name = "doctor"
+        else:
+            self.name = None
+
+    @classmethod
+    def for_user(cls, user):
+        """
+        Build the role from the user's profile relations.
+        Costs no query when the profiles were loaded with `select_related`.
+        """
+        return cls(
+            patient=getattr(user, "patient_profile", None),
+            doctor=getattr(user, "doctor_profile", None),
+        )
+
+
+class RoleTokenUser(TokenUser):
+    """
+    Stateless user backed by the role claims of a validated access token.
+    Its profiles are unsaved-looking instances that only carry primary keys.
+    """
+
+    @cached_property
+    def resolved_role(self):
+        patient_id = self.token.get(PATIENT_ID_CLAIM)
+        doctor_id = self.token.get(DOCTOR_ID_CLAIM)
+        return ResolvedRole(
+            patient=Patient(id=patient_id, user_id=self.id) if patient_id is not None else None,
+            doctor=Doctor(id=doctor_id, user_id=self.id) if doctor_id is not None else None,
+        )
+
+
+def resolve_role(user):
+    """
+    Return the `ResolvedRole` of a user, computing and caching it on first use.
+
+    Users authenticated by `RoleAwareJWTAuthentication` already carry it, so this
+    never hits the database for them.
+    """
+    role = getattr(user, "resolved_role", None)
+    if role is None:
+        role = ResolvedRole.for_user(user)
+        if getattr(user, "is_authenticated", False):
+            user.resolved_role = role
+    return role
+
+
+class RoleAwareJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that loads the user together with its patient and doctor
+    profiles in a single query and attaches the resolved role as
+    `request.user.resolved_role`.
+
+    When `JWT_STATELESS_READS` is enabled, safe-method requests to views that set
+    `stateless_auth = True` are authorized from the token's role claims alone and
+    perform no database lookup.
+    """
+
+    def authenticate(self, request):
+        if not self._allows_stateless(request):
+            return super().authenticate(request)
+
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        if ROLE_CLAIM not in validated_token:
+            # Issued before role claims existed, fall back to a database lookup
+            return self.get_user(validated_token), validated_token
+
+        return RoleTokenUser(validated_token), validated_token
+
+    def _allows_stateless(self, request):
+        if not settings.JWT_STATELESS_READS or request.method not in SAFE_METHODS:
+            return False
+        view = (getattr(request, "parser_context", None) or {}).get("view")
+        return getattr(view, "stateless_auth", False)
+
+    async def aauthenticate(self, request, stateless=False):
+        """
+        Async counterpart of `authenticate` for async views, loading the user with the
+        async ORM instead of blocking a thread.
+
+        Params:
+            request (HttpRequest): The current request.
+            stateless (bool): Whether the view allows stateless reads, like
+                `stateless_auth` on DRF views.
+        Raises:
+            InvalidToken, AuthenticationFailed: If the token or its user is invalid.
+        Returns:
+            (User, Token) or None if the request carries no token.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        if (
+            stateless
+            and settings.JWT_STATELESS_READS
+            and request.method in SAFE_METHODS
+            and ROLE_CLAIM in validated_token
+        ):
+            return RoleTokenUser(validated_token), validated_token
+        return await self.aget_user(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        """
+        Find the user of the token, joining both profile relations.
+        Mirrors the checks of `JWTAuthentication.get_user`.
+        """
+        try:
+            user = self.user_model.objects.select_related(
+                "patient_profile", "doctor_profile"
+            ).get(**{api_settings.USER_ID_FIELD: self._user_id(validated_token)})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        return self._check_user(user, validated_token)
+
+    async def aget_user(self, validated_token):
+        """
+        Async counterpart of `get_user`.
+        """
+        try:
+            user = await self.user_model.objects.select_related(
+                "patient_profile", "doctor_profile"
+            ).aget(**{api_settings.USER_ID_FIELD: self._user_id(validated_token)})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        return self._check_user(user, validated_token)
+
+    def _user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def _check_user(self, user, validated_token):
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(
+                api_settings.REVOKE_TOKEN_CLAIM
+            ) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        user.resolved_role = ResolvedRole.for_user(user)
+        return user
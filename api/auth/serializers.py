@@ -2,7 +2,12 @@ from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from api.models import User, Patient, Doctor
+from .authentication import PROFILE_VERSION_CLAIM
+from .tokens import add_role_claims
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -56,3 +61,34 @@ class UserSerializer(serializers.ModelSerializer):
             Doctor.objects.create(user=user)
 
         return user
+
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Issues token pairs that carry the user's role, profile ids and profile version,
+    so read endpoints can authorize from the token alone.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        return add_role_claims(super().get_token(user), user)
+
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refreshes access tokens, rejecting refresh tokens whose profile version differs
+    from the user's current one (i.e. issued before a role change).
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs["refresh"])
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        current_version = (
+            User.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+            .values_list("profile_version", flat=True)
+            .first()
+        )
+        token_version = refresh.payload.get(PROFILE_VERSION_CLAIM)
+        if token_version is not None and current_version is not None and token_version != current_version:
+            raise InvalidToken("Token role claims are outdated, please log in again.")
+        return super().validate(attrs)
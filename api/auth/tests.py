@@ -1,7 +1,13 @@
 from rest_framework.test import APITestCase
 from django.urls import reverse
 from rest_framework import status
-from api.models import User
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+from api.models import User, Patient, Doctor, HealthRecord
+from api.auth.authentication import RoleAwareJWTAuthentication
+from api.auth.views import require_doctor, require_patient
+from api.testing import QueryBudgetMixin
 from rest_framework_simplejwt.tokens import RefreshToken
 
 class AuthTests(APITestCase):
@@ -35,3 +41,70 @@ class AuthTests(APITestCase):
         url = reverse('logout')
         response = self.client.post(url, {"refresh": "invalidtoken"})
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RoleAwareAuthenticationTests(QueryBudgetMixin, APITestCase):
+
+    def _request_for(self, user):
+        token = RefreshToken.for_user(user).access_token
+        return APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_doctor_resolved_in_one_query(self):
+        user = User.objects.create_user(username="doc", password="pass", email="testd@test.com", role="doctor")
+        doctor = Doctor.objects.create(user=user)
+        request = self._request_for(user)
+
+        with self.assertQueryBudget(1):
+            authenticated, _ = RoleAwareJWTAuthentication().authenticate(request)
+            self.assertEqual(authenticated.resolved_role.name, "doctor")
+            self.assertEqual(require_doctor(authenticated), doctor)
+            self.assertFalse(hasattr(authenticated, "patient_profile"))
+
+    def test_patient_resolved_in_one_query(self):
+        user = User.objects.create_user(username="pat", password="pass", email="testp@test.com", role="patient")
+        patient = Patient.objects.create(user=user)
+        request = self._request_for(user)
+
+        with self.assertQueryBudget(1):
+            authenticated, _ = RoleAwareJWTAuthentication().authenticate(request)
+            self.assertEqual(require_patient(authenticated), patient)
+
+
+@override_settings(JWT_STATELESS_READS=True)
+class StatelessReadTests(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="pat", password="pass12345", email="testp@test.com", role="patient")
+        self.patient = Patient.objects.create(user=self.user)
+        HealthRecord.objects.create(patient=self.patient, data="Record")
+
+    def _login(self):
+        response = self.client.post(reverse("token_obtain_pair"), {"username": "pat", "password": "pass12345"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_read_without_auth_queries(self):
+        tokens = self._login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        with self.assertQueryBudget(3) as context:
+            response = self.client.get(reverse("healthrecords-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertFalse(any('FROM "api_user"' in q["sql"] for q in context.captured_queries))
+
+    def test_writes_still_load_the_user(self):
+        tokens = self._login()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        response = self.client.post(reverse("healthrecords-list"), {"data": "New record"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_role_change_rejects_refresh(self):
+        tokens = self._login()
+        response = self.client.post(reverse("token_refresh"), {"refresh": tokens["refresh"]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.patient.delete()
+        Doctor.objects.create(user=self.user)
+        response = self.client.post(reverse("token_refresh"), {"refresh": tokens["refresh"]})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
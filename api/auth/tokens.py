@@ -0,0 +1,47 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.models import User, Patient, Doctor
+from .authentication import (
+    DOCTOR_ID_CLAIM,
+    PATIENT_ID_CLAIM,
+    PROFILE_VERSION_CLAIM,
+    ROLE_CLAIM,
+    resolve_role,
+)
+
+
+def add_role_claims(token, user):
+    """
+    Embed the user's role, profile ids and profile version in a token.
+
+    Params:
+        token (Token): The simplejwt token to extend.
+        user (User): The user the token is issued for.
+    Returns:
+        The same token.
+    """
+    role = resolve_role(user)
+    token[ROLE_CLAIM] = role.name
+    token[PATIENT_ID_CLAIM] = role.patient.id if role.patient is not None else None
+    token[DOCTOR_ID_CLAIM] = role.doctor.id if role.doctor is not None else None
+    token[PROFILE_VERSION_CLAIM] = user.profile_version
+    return token
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Patient)
+@receiver(post_delete, sender=Doctor)
+def bump_profile_version(sender, instance, created=True, raw=False, **kwargs):
+    """
+    Bump the owning user's `profile_version` when a role profile is created or deleted,
+    so refresh tokens carrying the previous role claims are rejected.
+    """
+    # post_delete passes no `created`, so deletions always bump
+    if raw or not created:
+        return
+    User.objects.filter(pk=instance.user_id).update(profile_version=F("profile_version") + 1)
+    if sender.user.is_cached(instance):
+        instance.user.profile_version += 1
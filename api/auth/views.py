@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from .authentication import resolve_role
 from .serializers import UserSerializer
 
 
@@ -20,9 +21,10 @@ def require_patient(user):
     Returns:
         PatientProfile instance
     """
-    if not hasattr(user, 'patient_profile'):
+    patient = resolve_role(user).patient
+    if patient is None:
         raise PermissionDenied("User does not have patient permissions.")
-    return user.patient_profile
+    return patient
 
 
 def require_doctor(user):
@@ -34,9 +36,10 @@ def require_doctor(user):
     Returns:
         DoctorProfile instance
     """
-    if not hasattr(user, 'doctor_profile'):
+    doctor = resolve_role(user).doctor
+    if doctor is None:
         raise PermissionDenied("User does not have doctor permissions.")
-    return user.doctor_profile
+    return doctor
 
 
 # ────────────────
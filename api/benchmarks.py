@@ -0,0 +1,277 @@
+import json
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import Annotation, Doctor, DoctorPatientAssignment, Patient, User
+from api.sharding import shards
+from api.synthetic import HEART_RATE_CODE, SYNTHETIC_PASSWORD
+
+
+# URL names that are not part of the API (browsable API roots, Django admin)
+IGNORED_ROUTES = {"api-root"}
+
+
+class Scenario:
+    """
+    One benchmarked request.
+
+    Params:
+        name (str): Unique scenario name, used as the baseline key.
+        route (str): URL name of the benchmarked route.
+        method (str): HTTP method.
+        user (str): Which fixture user sends the request: "patient", "doctor", "admin"
+            or None for anonymous requests.
+        url (callable): Builds the URL from the fixtures.
+        body (callable): Optional, builds the JSON body from the fixtures and the
+            iteration number.
+        cached (bool): Whether the response cache is used. Scenarios run with it
+            disabled by default, so that they measure the uncached path.
+    """
+
+    def __init__(self, name, route, method, user, url, body=None, cached=False):
+        self.name = name
+        self.route = route
+        self.method = method
+        self.user = user
+        self.url = url
+        self.body = body
+        self.cached = cached
+
+
+def _route(name, **kwargs):
+    return lambda fixtures: reverse(name, kwargs={key: fixtures[value] for key, value in kwargs.items()})
+
+
+SCENARIOS = [
+    Scenario("register", "register", "post", None, _route("register"), lambda f, i: {
+        "username": f"bench-{i}", "email": f"bench-{i}@example.com", "password": "Bench-pass-123",
+        "first_name": "Bench", "last_name": "User", "role": "patient",
+    }),
+    Scenario("login", "token_obtain_pair", "post", None, _route("token_obtain_pair"), lambda f, i: {
+        "username": f["patient_username"], "password": SYNTHETIC_PASSWORD,
+    }),
+    Scenario("refresh", "token_refresh", "post", None, _route("token_refresh"), lambda f, i: {
+        "refresh": f["patient_refresh"],
+    }),
+    Scenario("logout", "logout", "post", "patient", _route("logout"), lambda f, i: {
+        "refresh": f["patient_refresh"],
+    }),
+    Scenario("records.list.patient", "healthrecords-list", "get", "patient", _route("healthrecords-list")),
+    Scenario("records.list.doctor", "healthrecords-list", "get", "doctor", _route("healthrecords-list")),
+    Scenario("records.list.patient.cached", "healthrecords-list", "get", "patient", _route("healthrecords-list"),
+             cached=True),
+    Scenario("records.list.doctor.cached", "healthrecords-list", "get", "doctor", _route("healthrecords-list"),
+             cached=True),
+    Scenario("records.list.slim", "healthrecords-list", "get", "doctor",
+             lambda f: reverse("healthrecords-list") + "?fields=id,created_at"),
+    Scenario("records.create", "healthrecords-list", "post", "patient", _route("healthrecords-list"),
+             lambda f, i: {"data": f"Heart rate {60 + i % 40} bpm"}),
+    Scenario("records.bulk", "healthrecords-bulk", "post", "patient", _route("healthrecords-bulk"),
+             lambda f, i: {"records": [{"data": f"Glucose {i}.{n} mmol/L"} for n in range(100)]}),
+    Scenario("records.changes", "healthrecords-changes", "get", "doctor", _route("healthrecords-changes")),
+    Scenario("records.export", "healthrecords-export", "get", "doctor",
+             lambda f: reverse("healthrecords-export") + f"?patient={f['patient_id']}"),
+    Scenario("records.search", "healthrecords-search", "get", "doctor",
+             lambda f: reverse("healthrecords-search") + "?q=glucose"),
+    Scenario("records.retrieve", "healthrecords-detail", "get", "doctor", _route("healthrecords-detail", pk="record_id")),
+    Scenario("records.list.async", "healthrecords-async-list", "get", "doctor", _route("healthrecords-async-list")),
+    Scenario("records.retrieve.async", "healthrecords-async-detail", "get", "doctor",
+             _route("healthrecords-async-detail", pk="record_id")),
+    Scenario("records.update", "healthrecords-detail", "put", "patient", _route("healthrecords-detail", pk="record_id"),
+             lambda f, i: {"data": f"Updated reading {i}"}),
+    Scenario("records.delete", "healthrecords-detail", "delete", "patient", _route("healthrecords-detail", pk="record_id")),
+    Scenario("annotations.list", "annotations-list", "get", "doctor", _route("annotations-list", record_id="record_id")),
+    Scenario("annotations.list.cached", "annotations-list", "get", "doctor",
+             _route("annotations-list", record_id="record_id"), cached=True),
+    Scenario("annotations.create", "annotations-list", "post", "doctor", _route("annotations-list", record_id="record_id"),
+             lambda f, i: {"comment": f"Benchmark note {i}"}),
+    Scenario("annotations.retrieve", "annotations-detail", "get", "doctor",
+             _route("annotations-detail", record_id="record_id", pk="annotation_id")),
+    Scenario("annotations.list.async", "annotations-async-list", "get", "doctor",
+             _route("annotations-async-list", record_id="record_id")),
+    Scenario("annotations.retrieve.async", "annotations-async-detail", "get", "doctor",
+             _route("annotations-async-detail", record_id="record_id", pk="annotation_id")),
+    Scenario("annotations.update", "annotations-detail", "put", "doctor",
+             _route("annotations-detail", record_id="record_id", pk="annotation_id"), lambda f, i: {"comment": "Edited"}),
+    Scenario("annotations.delete", "annotations-detail", "delete", "doctor",
+             _route("annotations-detail", record_id="record_id", pk="annotation_id")),
+    Scenario("user.retrieve", "user_detail", "get", "patient", _route("user_detail")),
+    Scenario("user.retrieve.async", "user_detail_async", "get", "patient", _route("user_detail_async")),
+    Scenario("user.update", "user_detail", "put", "patient", _route("user_detail"), lambda f, i: {"first_name": "Bench"}),
+    Scenario("assignments.list", "assignments-list", "get", "admin", _route("assignments-list")),
+    Scenario("assignments.create", "assignments-list", "post", "admin", _route("assignments-list"),
+             lambda f, i: {"doctor": f["other_doctor_id"], "patient": f["patient_id"]}),
+    Scenario("assignments.bulk", "assignments-bulk", "post", "admin", _route("assignments-bulk"),
+             lambda f, i: {"doctor": f["other_doctor_id"], "patients": f["patient_ids"]}),
+    Scenario("assignments.transfer", "assignments-transfer", "post", "admin", _route("assignments-transfer"),
+             lambda f, i: {"from_doctor": f["doctor_id"], "to_doctor": f["other_doctor_id"]}),
+    Scenario("assignments.retrieve", "assignments-detail", "get", "admin", _route("assignments-detail", pk="assignment_id")),
+    Scenario("assignments.delete", "assignments-detail", "delete", "admin", _route("assignments-detail", pk="assignment_id")),
+    Scenario("vitals.ingest", "vitals-list", "post", "patient", _route("vitals-list"), lambda f, i: {
+        "observations": [
+            {"code": HEART_RATE_CODE, "timestamp": f"2020-01-01T{n // 60:02d}:{n % 60:02d}:{i % 60:02d}Z", "value": 60 + n % 40}
+            for n in range(1000)
+        ],
+    }),
+    Scenario("vitals.series", "vitals-series", "get", "doctor",
+             lambda f: reverse("vitals-series") + f"?patient={f['patient_id']}&code={HEART_RATE_CODE}&start=2000-01-01T00:00:00Z"),
+    Scenario("metrics", "metrics", "get", "admin", _route("metrics")),
+]
+
+
+def api_routes():
+    """
+    Return the names of every API route declared in `aicu_project/urls.py`.
+    """
+    def walk(patterns):
+        for pattern in patterns:
+            if hasattr(pattern, "url_patterns"):
+                if getattr(pattern, "app_name", None) == "admin":
+                    continue
+                yield from walk(pattern.url_patterns)
+            elif pattern.name and pattern.name not in IGNORED_ROUTES:
+                yield pattern.name
+
+    return set(walk(get_resolver().url_patterns))
+
+
+def uncovered_routes(scenarios=SCENARIOS):
+    """
+    Return the API routes no scenario exercises.
+    """
+    return sorted(api_routes() - {scenario.route for scenario in scenarios})
+
+
+def load_fixtures():
+    """
+    Pick the users and objects the scenarios act on from the existing data: an
+    assigned patient with annotated records, one of their doctors, a doctor not
+    assigned to them and a superuser.
+
+    Raises:
+        LookupError: If the database holds no such data (run `generate_dataset` first).
+    """
+    annotation = Annotation.objects.select_related("record", "doctor__user").order_by("id").first()
+    admin = User.objects.filter(is_superuser=True).order_by("id").first()
+    if annotation is None or admin is None:
+        raise LookupError("No annotated records or superuser found; run `manage.py generate_dataset` first.")
+
+    record = annotation.record
+    patient = Patient.objects.select_related("user").get(pk=record.patient_id)
+    doctor = annotation.doctor
+    assignment = DoctorPatientAssignment.objects.filter(doctor=doctor, patient=patient).first()
+    other_doctor = Doctor.objects.exclude(assigned_patients__patient=patient).order_by("id").first()
+    if assignment is None or other_doctor is None:
+        raise LookupError("The annotating doctor must be assigned and a doctor not assigned to the patient must exist.")
+
+    return {
+        "users": {"patient": patient.user, "doctor": doctor.user, "admin": admin},
+        "patient_username": patient.user.username,
+        "patient_refresh": str(RefreshToken.for_user(patient.user)),
+        "patient_id": patient.pk,
+        "patient_ids": list(
+            DoctorPatientAssignment.objects.filter(doctor=doctor).values_list("patient_id", flat=True)[:100]
+        ),
+        "doctor_id": doctor.pk,
+        "other_doctor_id": other_doctor.pk,
+        "record_id": record.pk,
+        "annotation_id": annotation.pk,
+        "assignment_id": assignment.pk,
+    }
+
+
+def percentile(values, fraction):
+    """
+    Return the `fraction` percentile of `values` (nearest-rank).
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+def run_scenario(scenario, fixtures, iterations, warmup=2):
+    """
+    Send a scenario's request `warmup + iterations` times and measure it.
+
+    Every request runs in a transaction (one per database, shards included) that is
+    rolled back, so write scenarios do not change the dataset and every iteration sees
+    the same data. Unless the scenario is `cached`, the response cache is emptied first
+    and disabled during the run, so list scenarios measure a cache miss every time.
+
+    Returns:
+        dict: `status` of the last response, `p50_ms`/`p95_ms`/`p99_ms` latency,
+        `queries` per request (the maximum seen) and `throughput` (requests/s).
+    """
+    client = Client()
+    user = fixtures["users"].get(scenario.user)
+    headers = {}
+    if user is not None:
+        headers["HTTP_AUTHORIZATION"] = f"Bearer {RefreshToken.for_user(user).access_token}"
+    url = scenario.url(fixtures)
+    databases = [DEFAULT_DB_ALIAS, *shards()]
+
+    latencies, queries, status = [], [], None
+    if not scenario.cached:
+        cache.clear()
+    for iteration in range(warmup + iterations):
+        kwargs = dict(headers)
+        if scenario.body is not None:
+            kwargs.update(data=json.dumps(scenario.body(fixtures, iteration)), content_type="application/json")
+        with ExitStack() as stack:
+            if not scenario.cached:
+                stack.enter_context(override_settings(RESPONSE_CACHE_TIMEOUT=0, RESPONSE_CACHE_REPLICA_TIMEOUT=0))
+            for alias in databases:
+                stack.enter_context(transaction.atomic(using=alias))
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in [*databases, *settings.DATABASE_REPLICAS]
+            ]
+            start = time.perf_counter()
+            response = getattr(client, scenario.method)(url, **kwargs)
+            if getattr(response, "streaming", False):
+                b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+            for alias in databases:
+                transaction.set_rollback(True, using=alias)
+        status = response.status_code
+        if iteration >= warmup:
+            latencies.append(elapsed)
+            queries.append(sum(len(context) for context in captured))
+
+    return {
+        "status": status,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "queries": max(queries),
+        "throughput": round(len(latencies) / sum(latencies), 1),
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    List the regressions of `results` against a stored baseline.
+
+    A scenario regresses if its p95 latency exceeds the baseline by more than
+    `tolerance` (a fraction), or if it issues more queries than the baseline.
+
+    Returns:
+        list[str]: One message per regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']} ms > baseline {expected['p95_ms']} ms")
+        if result["queries"] > expected["queries"]:
+            regressions.append(f"{name}: {result['queries']} queries > baseline {expected['queries']}")
+    return regressions
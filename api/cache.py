@@ -0,0 +1,100 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from api.models import DoctorPatientAssignment
+
+
+ASSIGNED_PATIENTS_KEY = "api:assigned_patients:{doctor_id}"
+
+
+def _assigned_patients_key(doctor_id):
+    return ASSIGNED_PATIENTS_KEY.format(doctor_id=doctor_id)
+
+
+def get_assigned_patient_ids(doctor_id):
+    """
+    Return the ids of the patients assigned to a doctor.
+
+    The set is stored in Django's cache framework, so with a shared backend (e.g. Redis)
+    every worker reuses it until an assignment change invalidates it.
+
+    Params:
+        doctor_id (int): Primary key of the Doctor.
+    Returns:
+        frozenset of Patient primary keys.
+    """
+    key = _assigned_patients_key(doctor_id)
+    patient_ids = cache.get(key)
+    if patient_ids is None:
+        # Read from the primary: a lagging replica would re-cache a just invalidated set
+        patient_ids = frozenset(
+            DoctorPatientAssignment.objects.using(DEFAULT_DB_ALIAS)
+            .filter(doctor_id=doctor_id)
+            .values_list("patient_id", flat=True)
+        )
+        cache.set(key, patient_ids, settings.ASSIGNED_PATIENTS_CACHE_TIMEOUT)
+    return patient_ids
+
+
+async def aget_assigned_patient_ids(doctor_id):
+    """
+    Async counterpart of `get_assigned_patient_ids`, sharing its cache entries.
+    """
+    key = _assigned_patients_key(doctor_id)
+    patient_ids = await cache.aget(key)
+    if patient_ids is None:
+        patient_ids = frozenset(
+            [
+                patient_id
+                async for patient_id in DoctorPatientAssignment.objects.using(DEFAULT_DB_ALIAS)
+                .filter(doctor_id=doctor_id)
+                .values_list("patient_id", flat=True)
+            ]
+        )
+        await cache.aset(key, patient_ids, settings.ASSIGNED_PATIENTS_CACHE_TIMEOUT)
+    return patient_ids
+
+
+def invalidate_assigned_patient_ids(*doctor_ids):
+    """
+    Drop the cached assigned-patient sets of the given doctors.
+
+    The keys are deleted immediately and again once the surrounding transaction
+    commits, so a concurrent reader cannot re-cache the pre-commit state.
+    """
+    keys = [_assigned_patients_key(doctor_id) for doctor_id in set(doctor_ids)]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(pre_save, sender=DoctorPatientAssignment)
+def remember_previous_doctor(sender, instance, raw=False, **kwargs):
+    """
+    Remember the doctor an existing assignment belonged to, so that moving it to
+    another doctor also invalidates the previous doctor's set.
+    """
+    if raw or instance.pk is None:
+        return
+    instance._previous_doctor_id = (
+        DoctorPatientAssignment.objects.filter(pk=instance.pk)
+        .values_list("doctor_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=DoctorPatientAssignment)
+@receiver(post_delete, sender=DoctorPatientAssignment)
+def invalidate_assignment_cache(sender, instance, **kwargs):
+    """
+    Invalidate the assigned-patient set of the doctor(s) touched by an assignment change.
+    """
+    doctor_ids = [instance.doctor_id]
+    previous_doctor_id = getattr(instance, "_previous_doctor_id", None)
+    if previous_doctor_id is not None:
+        doctor_ids.append(previous_doctor_id)
+    invalidate_assigned_patient_ids(*doctor_ids)
@@ -0,0 +1,138 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from api.models import Annotation, HealthRecord
+
+
+def make_etag(*parts):
+    """
+    Build a strong, quoted ETag from the given parts.
+    """
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8"))
+    return quote_etag(digest.hexdigest()[:32])
+
+
+VALIDATOR_AGGREGATES = {
+    "last_updated": Max("updated_at"),
+    "records": Count("id", distinct=True),
+    "last_annotated": Max("annotations__created_at"),
+}
+
+
+def record_validators(request, queryset):
+    """
+    Compute the ETag and Last-Modified of a health record with one aggregate query,
+    without loading or serializing the record.
+
+    The validators cover the record's `updated_at` and latest annotation timestamp,
+    plus the caller and the full path.
+
+    Params:
+        request (Request): The current request.
+        queryset (QuerySet): The health record the response is built from.
+    Returns:
+        (str | None, datetime | None): ETag and last modification time, or
+        (None, None) if the queryset is empty.
+    """
+    return _validators_from_stats(request, queryset.order_by().aggregate(**VALIDATOR_AGGREGATES))
+
+
+async def arecord_validators(request, queryset):
+    """
+    Async counterpart of `record_validators`.
+    """
+    return _validators_from_stats(request, await queryset.order_by().aaggregate(**VALIDATOR_AGGREGATES))
+
+
+def _validators_from_stats(request, stats):
+    if not stats["records"]:
+        return None, None
+
+    last_modified = max(filter(None, [stats["last_updated"], stats["last_annotated"]]))
+    etag = make_etag(
+        request.user.pk,
+        request.get_full_path(),
+        stats["last_updated"].isoformat(),
+        stats["records"],
+        stats["last_annotated"].isoformat() if stats["last_annotated"] else "",
+    )
+    return etag, last_modified
+
+
+def validator_page(queryset, paginator):
+    """
+    Restrict a health record queryset to the columns `page_etag` and the paginator
+    read, without prefetches, so the page is validated with one indexed query.
+    """
+    return queryset.prefetch_related(None).only(*paginator.ordering, "updated_at")
+
+
+def page_etag(request, paginator, page):
+    """
+    Compute the ETag of a page of health records from the page's own rows, so the cost
+    does not grow with the number of visible records.
+
+    The ETag covers the ids and `updated_at` of the page's records (annotation changes
+    bump `updated_at`), whether there are previous and next pages, the caller and the
+    full path: deleting a record of the page, or the one after it, changes it too. List
+    responses have no Last-Modified, which cannot reflect deletes.
+
+    Params:
+        request (Request): The current request.
+        paginator (KeysetPagination): The paginator that returned `page`.
+        page (list[HealthRecord]): The page, with `updated_at` loaded.
+    Returns:
+        str | None: The ETag, or None for an empty page.
+    """
+    if not page:
+        return None
+    return make_etag(
+        request.user.pk,
+        request.get_full_path(),
+        paginator.has_previous,
+        paginator.has_next,
+        *(f"{record.pk}@{record.updated_at.isoformat()}" for record in page),
+    )
+
+
+def not_modified_response(request, etag, last_modified=None):
+    """
+    Return a 304 response if the request's `If-None-Match`/`If-Modified-Since`
+    headers match the validators, else None.
+    """
+    if etag is None:
+        return None
+    return get_conditional_response(
+        request._request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+
+
+def set_validators(response, etag, last_modified=None):
+    """
+    Attach the ETag and Last-Modified headers to a response.
+    """
+    if etag is not None:
+        response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    return response
+
+
+@receiver(post_save, sender=Annotation)
+@receiver(post_delete, sender=Annotation)
+def touch_annotated_record(sender, instance, raw=False, **kwargs):
+    """
+    Bump the record's `updated_at` when one of its annotations changes, so the
+    record's validators change even though annotations have no `updated_at` of their own.
+    """
+    if raw:
+        return
+    HealthRecord.objects.using(instance._state.db).filter(pk=instance.record_id).update(updated_at=timezone.now())
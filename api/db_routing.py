@@ -0,0 +1,195 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import jwt
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.settings import api_settings
+
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = "primary_until"
+PIN_KEY = "api:primary_pin:{user_id}"
+
+_state = ContextVar("db_routing", default=None)
+
+# Replica alias -> monotonic time until which it is considered down (per process)
+_replica_down_until = {}
+
+
+class RoutingState:
+    """
+    Routing decision of the request being processed.
+
+    Attributes:
+        use_replicas (bool): Whether reads may go to a replica.
+        replica (str | None): The replica chosen for this request, picked on the first
+            read so that all reads of a request see the same replica.
+    """
+
+    __slots__ = ("use_replicas", "replica")
+
+    def __init__(self, use_replicas):
+        self.use_replicas = use_replicas
+        self.replica = None
+
+
+@contextmanager
+def use_primary():
+    """
+    Send the reads of the wrapped block to the primary, e.g. to fill a cache that
+    must not be filled from a lagging replica.
+    """
+    state = _state.get()
+    if state is None:
+        yield
+        return
+    previous = state.use_replicas
+    state.use_replicas = False
+    try:
+        yield
+    finally:
+        state.use_replicas = previous
+
+
+def reads_use_replicas():
+    """
+    Whether the reads of the current request may go to a replica.
+    """
+    state = _state.get()
+    return state is not None and state.use_replicas and bool(settings.DATABASE_REPLICAS)
+
+
+def _replica_is_healthy(alias):
+    if _replica_down_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except Exception:
+        logger.warning("Database replica %s is unavailable, reading from the primary.", alias, exc_info=True)
+        _replica_down_until[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+        return False
+    _replica_down_until.pop(alias, None)
+    return True
+
+
+class PrimaryReplicaRouter:
+    """
+    Send writes to the primary and the reads of safe-method requests to a replica
+    listed in `DATABASE_REPLICAS`.
+
+    Reads go to the primary outside of requests (management commands, workers),
+    during unsafe-method requests, within `use_primary()`, and for
+    `PRIMARY_PIN_SECONDS` after the same user wrote (see `ReadYourWritesMiddleware`).
+    A replica that cannot be connected to is skipped for `REPLICA_RETRY_SECONDS`;
+    without a healthy replica reads fall back to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replicas or not settings.DATABASE_REPLICAS:
+            # Not None: Django would fall back to the database of the `instance` hint,
+            # which may be a shard (see `api.sharding`)
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            healthy = [alias for alias in settings.DATABASE_REPLICAS if _replica_is_healthy(alias)]
+            state.replica = random.choice(healthy) if healthy else DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        # Also keeps objects read from a replica from being saved back to it
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def _token_user_id(request):
+    """
+    Read the user id claim of the request's bearer token without verifying it: it only
+    decides where reads go, so a forged token can at worst pin itself to the primary.
+    """
+    header = request.META.get(api_settings.AUTH_HEADER_NAME, "").split()
+    if len(header) != 2 or header[0] not in api_settings.AUTH_HEADER_TYPES:
+        return None
+    try:
+        return jwt.decode(header[1], options={"verify_signature": False}).get(api_settings.USER_ID_CLAIM)
+    except jwt.InvalidTokenError:
+        return None
+
+
+class ReadYourWritesMiddleware:
+    """
+    Let the reads of safe-method requests go to replicas, except for users who wrote
+    less than `PRIMARY_PIN_SECONDS` ago, so that users always read their own writes.
+
+    A successful unsafe-method request pins its user to the primary with two markers:
+    a `primary_until` cookie (browsers) and a cache entry keyed by the user id claim
+    of the bearer token (API clients, also across token refreshes).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _state.set(RoutingState(self._may_use_replicas(request)))
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._pin_after_write(request, response)
+
+    async def __acall__(self, request):
+        token = _state.set(RoutingState(self._may_use_replicas(request)))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._pin_after_write(request, response)
+
+    def _may_use_replicas(self, request):
+        if request.method not in SAFE_METHODS or not settings.DATABASE_REPLICAS:
+            return False
+        try:
+            if float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time():
+                return False
+        except ValueError:
+            pass
+        user_id = _token_user_id(request)
+        return user_id is None or cache.get(PIN_KEY.format(user_id=user_id)) is None
+
+    def _pin_after_write(self, request, response):
+        if request.method in SAFE_METHODS or response.status_code >= 400 or not settings.DATABASE_REPLICAS:
+            return response
+        window = settings.PRIMARY_PIN_SECONDS
+        response.set_cookie(
+            PIN_COOKIE, str(int(time.time() + window)), max_age=window, httponly=True, samesite="Lax"
+        )
+        user_id = _token_user_id(request)
+        if user_id is not None:
+            cache.set(PIN_KEY.format(user_id=user_id), 1, window)
+        return response
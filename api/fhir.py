@@ -0,0 +1,253 @@
+import gzip
+import json
+
+from django.contrib.auth.hashers import make_password
+
+from api import sharding
+from api.models import HealthRecord, ImportCheckpoint, Patient, User
+from api.response_cache import bump_versions, patient_scope
+from api.search import index_created_records
+from api.sync import log_record_changes
+
+
+SUPPORTED_RESOURCES = ("Patient", "Observation")
+
+
+def open_ndjson(path):
+    """
+    Open an NDJSON file (optionally gzipped) in binary mode, so byte offsets can be
+    used as checkpoints.
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def resource_type(path):
+    """
+    Return the `resourceType` of the first resource in a FHIR Bulk Data file, or None
+    for an empty file. Bulk Data exports hold one resource type per file.
+    """
+    with open_ndjson(path) as stream:
+        for line in stream:
+            if line.strip():
+                return json.loads(line).get("resourceType")
+    return None
+
+
+def patient_username(fhir_id):
+    """
+    Username of the user created for a FHIR Patient, used to resolve references.
+    """
+    return f"fhir-{fhir_id}"
+
+
+def reference_id(reference):
+    """
+    Return the id part of a `Patient/<id>` or `urn:uuid:<id>` reference.
+    """
+    if reference.startswith("urn:uuid:"):
+        return reference[len("urn:uuid:"):]
+    return reference.rsplit("/", 1)[-1]
+
+
+def map_patient(resource):
+    """
+    Map a FHIR Patient resource onto `User` and `Patient` field values.
+
+    Imported users get an unusable password and must reset it to log in; users
+    without an email get a placeholder address derived from their FHIR id.
+
+    Returns:
+        (dict, dict): Keyword arguments for `User` and for `Patient`.
+    """
+    names = resource.get("name") or [{}]
+    name = next((n for n in names if n.get("use") == "official"), names[0])
+    emails = [
+        telecom["value"]
+        for telecom in resource.get("telecom", [])
+        if telecom.get("system") == "email" and telecom.get("value")
+    ]
+    identifiers = [i["value"] for i in resource.get("identifier", []) if i.get("value")]
+
+    user = {
+        "username": patient_username(resource["id"]),
+        "email": emails[0] if emails else f"{resource['id']}@fhir-import.invalid",
+        "first_name": " ".join(name.get("given", []))[:150],
+        "last_name": name.get("family", "")[:150],
+        "role": "patient",
+        "password": make_password(None),
+    }
+    patient = {"health_insurance_number": identifiers[0][:20] if identifiers else ""}
+    return user, patient
+
+
+def _codeable_text(concept):
+    codings = concept.get("coding", [])
+    return concept.get("text") or next((c["display"] for c in codings if c.get("display")), None) or next(
+        (c["code"] for c in codings if c.get("code")), ""
+    )
+
+
+def _observation_value(resource):
+    if "valueQuantity" in resource:
+        quantity = resource["valueQuantity"]
+        return f"{quantity.get('value', '')} {quantity.get('unit', quantity.get('code', ''))}".strip()
+    if "valueCodeableConcept" in resource:
+        return _codeable_text(resource["valueCodeableConcept"])
+    for key in ("valueString", "valueBoolean", "valueInteger", "valueDateTime"):
+        if key in resource:
+            return str(resource[key])
+    components = [
+        f"{_codeable_text(component.get('code', {}))} {_observation_value(component)}".strip()
+        for component in resource.get("component", [])
+    ]
+    return ", ".join(components)
+
+
+def map_observation(resource):
+    """
+    Render a FHIR Observation as the text of a health record.
+
+    Returns:
+        (str, str): FHIR id of the subject patient and the record text.
+    Raises:
+        KeyError: If the observation has no subject reference.
+    """
+    text = _codeable_text(resource.get("code", {}))
+    value = _observation_value(resource)
+    if value:
+        text = f"{text}: {value}"
+    effective = resource.get("effectiveDateTime") or resource.get("effectivePeriod", {}).get("start")
+    if effective:
+        text = f"{text} ({effective})"
+    return reference_id(resource["subject"]["reference"]), text
+
+
+def import_patients(resources):
+    """
+    Create users and patient profiles for FHIR Patients, skipping ones that already
+    exist (by username) or whose email is taken.
+
+    Returns:
+        (int, int): Number of imported and skipped resources.
+    """
+    # Keep the last occurrence of a patient listed twice in the same chunk
+    mapped = list({resource["id"]: map_patient(resource) for resource in resources if "id" in resource}.values())
+    User.objects.bulk_create([User(**user) for user, _ in mapped], ignore_conflicts=True)
+
+    # ignore_conflicts does not return primary keys: look the users up again
+    user_ids = dict(
+        User.objects.filter(username__in=[user["username"] for user, _ in mapped], role="patient")
+        .values_list("username", "id")
+    )
+    existing = set(Patient.objects.filter(user_id__in=user_ids.values()).values_list("user_id", flat=True))
+    profiles = [
+        Patient(user_id=user_ids[user["username"]], **patient)
+        for user, patient in mapped
+        if user["username"] in user_ids and user_ids[user["username"]] not in existing
+    ]
+    Patient.objects.bulk_create(profiles)
+    return len(profiles), len(resources) - len(profiles)
+
+
+def import_observations(resources):
+    """
+    Create health records for FHIR Observations of already imported patients.
+
+    Returns:
+        (int, int): Number of imported and skipped resources.
+    """
+    mapped = []
+    for resource in resources:
+        try:
+            mapped.append(map_observation(resource))
+        except KeyError:
+            continue
+
+    patient_ids = dict(
+        Patient.objects.filter(
+            user__username__in={patient_username(fhir_id) for fhir_id, _ in mapped}
+        ).values_list("user__username", "id")
+    )
+    records = [
+        HealthRecord(patient_id=patient_ids[patient_username(fhir_id)], data=text)
+        for fhir_id, text in mapped
+        if patient_username(fhir_id) in patient_ids
+    ]
+    HealthRecord.objects.bulk_create(records)
+    # bulk_create bypasses the signals maintaining the change log, search index and
+    # response cache versions
+    log_record_changes(records)
+    index_created_records(records)
+    bump_versions(*{patient_scope(record.patient_id) for record in records})
+    return len(records), len(resources) - len(records)
+
+
+IMPORTERS = {
+    "Patient": import_patients,
+    "Observation": import_observations,
+}
+
+
+def import_file(path, chunk_size=1000, restart=False):
+    """
+    Stream a FHIR Bulk Data NDJSON file into the database in chunks.
+
+    Only `chunk_size` resources are held in memory at a time. Each chunk is written in
+    its own transaction together with the file's `ImportCheckpoint`, so after a crash
+    the import resumes at the first uncommitted line without duplicating records.
+
+    Params:
+        path (str): Path of the `.ndjson` (or `.ndjson.gz`) file.
+        chunk_size (int): Resources per transaction.
+        restart (bool): Ignore a previous checkpoint and start from the beginning.
+    Returns:
+        (int, int): Number of imported and skipped resources in this run.
+    """
+    checkpoint, _ = ImportCheckpoint.objects.get_or_create(path=path)
+    if restart:
+        checkpoint.offset, checkpoint.imported, checkpoint.skipped, checkpoint.completed = 0, 0, 0, False
+        checkpoint.save()
+    if checkpoint.completed:
+        return 0, 0
+
+    imported = skipped = 0
+    offset = checkpoint.offset
+
+    def flush(chunk, invalid):
+        nonlocal imported, skipped
+        counts = [0, invalid]
+        with sharding.atomic():
+            for kind in SUPPORTED_RESOURCES:
+                resources = [resource for resource in chunk if resource.get("resourceType") == kind]
+                if resources:
+                    done, failed = IMPORTERS[kind](resources)
+                    counts[0] += done
+                    counts[1] += failed
+            counts[1] += sum(1 for r in chunk if r.get("resourceType") not in SUPPORTED_RESOURCES)
+            checkpoint.offset = offset
+            checkpoint.imported += counts[0]
+            checkpoint.skipped += counts[1]
+            checkpoint.save(update_fields=["offset", "imported", "skipped", "updated_at"])
+        imported += counts[0]
+        skipped += counts[1]
+
+    with open_ndjson(path) as stream:
+        stream.seek(offset)
+        chunk, invalid = [], 0
+        for line in stream:
+            offset += len(line)
+            if line.strip():
+                try:
+                    chunk.append(json.loads(line))
+                except ValueError:
+                    invalid += 1
+            if len(chunk) >= chunk_size:
+                flush(chunk, invalid)
+                chunk, invalid = [], 0
+        flush(chunk, invalid)
+
+    checkpoint.completed = True
+    checkpoint.save(update_fields=["completed", "updated_at"])
+    return imported, skipped
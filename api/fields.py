@@ -0,0 +1,213 @@
+import lzma
+import struct
+import zlib
+from collections import Counter
+
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+from django.utils.module_loading import import_string
+
+
+# First byte of every stored value, identifying how the rest was encoded
+RAW = b"\x00"
+ZLIB = b"\x01"
+LZMA = b"\x02"
+ZLIB_DICT = b"\x03"
+
+
+def train_zlib_dictionary(samples, size=32 * 1024, min_length=8):
+    """
+    Build a zlib preset dictionary from sample texts.
+
+    Keeps the substrings (lines and words) that occur most often across samples,
+    with the most frequent ones last since zlib favours the end of the dictionary.
+
+    Params:
+        samples (iterable[str]): Representative values.
+        size (int): Maximum dictionary size in bytes (zlib uses at most 32 KB).
+        min_length (int): Ignore shorter substrings.
+    Returns:
+        bytes: The dictionary.
+    """
+    counts = Counter()
+    for sample in samples:
+        tokens = set(sample.splitlines()) | set(sample.split())
+        counts.update(token for token in tokens if len(token) >= min_length)
+
+    chosen, used = [], 0
+    for token, count in counts.most_common():
+        if count < 2:
+            break
+        encoded = token.encode("utf-8") + b"\n"
+        if used + len(encoded) > size:
+            continue
+        chosen.append(encoded)
+        used += len(encoded)
+    return b"".join(reversed(chosen))
+
+
+class CompressedValue:
+    """
+    Still-compressed value loaded from the database, decoded on first access.
+    """
+
+    __slots__ = ("raw",)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+
+class CompressedTextDescriptor(DeferredAttribute):
+    """
+    Decompresses the stored bytes the first time the attribute is read.
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, CompressedValue):
+            value = self.field.decompress(value.raw)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # Being a data descriptor makes attribute reads go through `__get__`
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.TextField):
+    """
+    Text field stored compressed in a binary column.
+
+    Values are compressed on write with zlib or lzma (optionally with a trained zlib
+    dictionary) and only decompressed when the attribute is read, so rows loaded but
+    not displayed never pay the decode cost. Content lookups such as `icontains` are
+    not supported since the database only sees compressed bytes, and `values()` /
+    `values_list()` return `CompressedValue` objects rather than text.
+
+    Params:
+        algorithm (str): "zlib" or "lzma".
+        level (int): Compression level passed to the codec.
+        min_length (int): Values shorter than this (in bytes) are stored uncompressed.
+        dictionary (str): Optional dotted path to a bytes zlib preset dictionary.
+    """
+
+    descriptor_class = CompressedTextDescriptor
+
+    def __init__(self, *args, algorithm="zlib", level=6, min_length=64, dictionary=None, **kwargs):
+        if algorithm not in ("zlib", "lzma"):
+            raise ValueError("algorithm must be 'zlib' or 'lzma'.")
+        self.algorithm = algorithm
+        self.level = level
+        self.min_length = min_length
+        self.dictionary = dictionary
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.algorithm != "zlib":
+            kwargs["algorithm"] = self.algorithm
+        if self.level != 6:
+            kwargs["level"] = self.level
+        if self.min_length != 64:
+            kwargs["min_length"] = self.min_length
+        if self.dictionary is not None:
+            kwargs["dictionary"] = self.dictionary
+        return name, path, args, kwargs
+
+    def get_internal_type(self):
+        return "BinaryField"
+
+    # ────────────────
+    # Codec
+    # ────────────────
+
+    def _load_dictionary(self):
+        if self.dictionary is None:
+            return None
+        if not hasattr(self, "_dictionary_bytes"):
+            dictionary = import_string(self.dictionary)
+            self._dictionary_bytes = dictionary() if callable(dictionary) else dictionary
+            self._dictionary_id = struct.pack(">I", zlib.crc32(self._dictionary_bytes))
+        return self._dictionary_bytes
+
+    def compress(self, text):
+        """
+        Encode text into the tagged binary format.
+        """
+        data = text.encode("utf-8")
+        if len(data) < self.min_length:
+            return RAW + data
+
+        dictionary = self._load_dictionary()
+        if dictionary is not None:
+            compressor = zlib.compressobj(self.level, zdict=dictionary)
+            encoded = ZLIB_DICT + self._dictionary_id + compressor.compress(data) + compressor.flush()
+        elif self.algorithm == "lzma":
+            encoded = LZMA + lzma.compress(data, preset=self.level)
+        else:
+            encoded = ZLIB + zlib.compress(data, self.level)
+
+        if len(encoded) >= len(data) + 1:
+            return RAW + data
+        return encoded
+
+    def decompress(self, raw):
+        """
+        Decode a tagged binary value back to text, whatever codec wrote it.
+        """
+        raw = bytes(raw)
+        tag, payload = raw[:1], raw[1:]
+        if tag == RAW:
+            data = payload
+        elif tag == ZLIB:
+            data = zlib.decompress(payload)
+        elif tag == LZMA:
+            data = lzma.decompress(payload)
+        elif tag == ZLIB_DICT:
+            dictionary = self._load_dictionary()
+            if dictionary is None or payload[:4] != self._dictionary_id:
+                raise ValueError("Value was compressed with a different dictionary.")
+            decompressor = zlib.decompressobj(zdict=dictionary)
+            data = decompressor.decompress(payload[4:]) + decompressor.flush()
+        else:
+            raise ValueError("Unknown compression tag.")
+        return data.decode("utf-8")
+
+    # ────────────────
+    # Field API
+    # ────────────────
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return CompressedValue(bytes(value))
+
+    def to_python(self, value):
+        if isinstance(value, CompressedValue):
+            return self.decompress(value.raw)
+        return super().to_python(value)
+
+    def pre_save(self, model_instance, add):
+        # Read the raw slot so that an untouched value is not decompressed just to be saved
+        if self.attname in model_instance.__dict__:
+            return model_instance.__dict__[self.attname]
+        return getattr(model_instance, self.attname)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        if isinstance(value, CompressedValue):
+            return value.raw
+        return self.compress(str(value))
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None:
+            return None
+        return connection.Database.Binary(value)
+
+    def value_from_object(self, obj):
+        return getattr(obj, self.attname)
@@ -0,0 +1,125 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Serializer mixin accepting a `fields` argument that restricts the rendered fields.
+
+    Params:
+        fields (iterable[str] | None): Names of the fields to keep, None for all.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class SparseFieldsetMixin:
+    """
+    ViewSet mixin adding `?fields=` and `?expand=` to read actions.
+
+    - Without either parameter the full representation is returned.
+    - `fields` is a comma-separated list of the fields to return.
+    - Fields listed in the serializer's `Meta.expandable_fields` (e.g. nested
+      relations) are only returned when named in `expand` once either parameter is
+      used, so `?expand=` alone gives the slim default representation.
+
+    The selected fields also prune the SQL: the queryset is restricted with `.only()`
+    to the columns the fields read, and views skip prefetches/joins of fields that are
+    not rendered (see `wants_field`).
+
+    Attributes:
+        sparse_actions (tuple[str]): Actions the parameters apply to.
+        sparse_field_columns (dict): Columns loaded for a serializer field, for fields
+            whose source is not a model field (e.g. `doctor.user.get_full_name`).
+    """
+
+    sparse_actions = ("list", "retrieve")
+    sparse_field_columns = {}
+    fields_query_param = "fields"
+    expand_query_param = "expand"
+
+    def get_fieldset(self):
+        """
+        Return the names of the serializer fields to render, or None for all of them.
+
+        Raises:
+            ValidationError: If a parameter names an unknown or non-expandable field.
+        """
+        if not hasattr(self, "_fieldset"):
+            self._fieldset = self._parse_fieldset()
+        return self._fieldset
+
+    def _parse_fieldset(self):
+        if self.action not in self.sparse_actions:
+            return None
+        fields = self._parse_names(self.fields_query_param)
+        expand = self._parse_names(self.expand_query_param)
+        if fields is None and expand is None:
+            return None
+
+        serializer_class = self.get_serializer_class()
+        available = list(serializer_class().fields)
+        expandable = set(getattr(serializer_class.Meta, "expandable_fields", ()))
+
+        unknown = sorted(set(fields or ()) - set(available))
+        if unknown:
+            raise ValidationError({self.fields_query_param: f"Unknown field(s): {', '.join(unknown)}."})
+        unknown = sorted(set(expand or ()) - expandable)
+        if unknown:
+            raise ValidationError({self.expand_query_param: f"Cannot expand: {', '.join(unknown)}."})
+
+        if fields is None:
+            fields = [name for name in available if name not in expandable]
+        return set(fields) | set(expand or ())
+
+    def _parse_names(self, param):
+        value = self.request.query_params.get(param)
+        if value is None:
+            return None
+        return [name.strip() for name in value.split(",") if name.strip()]
+
+    def wants_field(self, name):
+        """
+        Return whether the serializer field `name` is rendered by this request.
+        """
+        fieldset = self.get_fieldset()
+        return fieldset is None or name in fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        fieldset = self.get_fieldset()
+        if fieldset is not None:
+            kwargs.setdefault("fields", fieldset)
+        return super().get_serializer(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        """
+        Restrict the loaded columns to the ones the selected fields need.
+        """
+        queryset = super().filter_queryset(queryset)
+        fieldset = self.get_fieldset()
+        if fieldset is None:
+            return queryset
+
+        model = queryset.model
+        serializer_fields = self.get_serializer_class()().fields
+        columns = {model._meta.pk.name}
+        # Keyset pagination reads the ordering values of the last row to build cursors
+        columns.update(getattr(self.paginator, "ordering", ()))
+
+        for name in fieldset:
+            if name in self.sparse_field_columns:
+                columns.update(self.sparse_field_columns[name])
+                continue
+            source = serializer_fields[name].source.split(".")[0]
+            try:
+                field = model._meta.get_field(source)
+            except FieldDoesNotExist:
+                # Computed from something we cannot map to columns: load everything
+                return queryset
+            if field.concrete:
+                columns.add(field.name)
+        return queryset.only(*columns)
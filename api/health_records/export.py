@@ -0,0 +1,40 @@
+import zlib
+
+from api.renderers import FastJSONRenderer
+
+
+def ndjson_lines(queryset, serializer_class, chunk_size):
+    """
+    Yield one JSON line per object, reading the queryset in chunks.
+
+    `QuerySet.iterator()` uses a server-side cursor where the database supports it and
+    applies prefetches per chunk, so memory stays bounded by `chunk_size` objects.
+
+    Params:
+        queryset (QuerySet): Objects to export, already ordered.
+        serializer_class (Serializer): Serializer used for each object.
+        chunk_size (int): Number of rows fetched per round trip.
+    Yields:
+        bytes: A JSON document followed by a newline.
+    """
+    renderer = FastJSONRenderer()
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield renderer.render(serializer_class(obj).data) + b"\n"
+
+
+def gzip_stream(chunks, level=6):
+    """
+    Gzip a stream of byte chunks incrementally.
+
+    Params:
+        chunks (iterable[bytes]): The uncompressed stream.
+        level (int): zlib compression level.
+    Yields:
+        bytes: Compressed data as soon as zlib emits it.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,12 +1,15 @@
 from rest_framework import serializers
 from api.annotations.serializers import AnnotationSerializer
+from api.fieldsets import SparseFieldsetSerializerMixin
+from api.metrics import TimedSerializerMixin
 from api.models import HealthRecord
 
 
-class HealthRecordSerializer(serializers.ModelSerializer):
+class HealthRecordSerializer(TimedSerializerMixin, SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the HealthRecord model.
-    Includes related annotations as a nested read-only field.
+    Includes related annotations as a nested read-only field, which is
+    expandable (see `SparseFieldsetMixin`).
     """
 
     annotations = AnnotationSerializer(many=True, read_only=True)
@@ -14,3 +17,4 @@ class HealthRecordSerializer(serializers.ModelSerializer):
     class Meta:
         model = HealthRecord
         fields = ["id", "data", "created_at", "updated_at", "annotations"]
+        expandable_fields = ["annotations"]
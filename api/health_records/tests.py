@@ -0,0 +1,686 @@
+import gzip
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from django.urls import reverse
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from api.models import User, HealthRecord, Annotation, DoctorPatientAssignment, Doctor, Patient, ImportCheckpoint, RecordChange
+from api import fhir
+from api.fields import CompressedTextField, CompressedValue, train_zlib_dictionary
+from api.testing import QueryBudgetMixin
+from api.health_records.views import HealthRecordViewSet
+
+
+class HealthRecordCrudTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="patient1", password="test123", email="patient1@test.com", role="patient")
+        Patient.objects.create(user=self.user)
+        self.client.force_authenticate(self.user)
+        self.record = HealthRecord.objects.create(
+            patient=self.user.patient_profile, data="Initial health record content"
+        )
+
+    def test_list_health_records(self):
+        url = reverse("healthrecords-list")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(len(response.data["results"]) >= 1)
+
+    def test_create_health_record(self):
+        url = reverse("healthrecords-list")
+        response = self.client.post(url, {"data": "New record"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_update_health_record(self):
+        url = reverse("healthrecords-detail", args=[self.record.id])
+        response = self.client.put(url, {"data": "Updated record"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_delete_health_record(self):
+        url = reverse("healthrecords-detail", args=[self.record.id])
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+
+class HealthRecordQueryBudgetTests(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user(username="doc1", password="pass123", email="testd@test.com", role="doctor", first_name="Greg", last_name="House")
+        Doctor.objects.create(user=self.doctor)
+
+        self.patient = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        Patient.objects.create(user=self.patient)
+
+        DoctorPatientAssignment.objects.create(
+            doctor=self.doctor.doctor_profile, patient=self.patient.patient_profile
+        )
+        self._add_records(2)
+
+    def _add_records(self, count, annotations_per_record=3):
+        for i in range(count):
+            record = HealthRecord.objects.create(patient=self.patient.patient_profile, data=f"Record {i}")
+            for j in range(annotations_per_record):
+                Annotation.objects.create(record=record, doctor=self.doctor.doctor_profile, comment=f"Note {j}")
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=0)  # measure the uncached path
+    def test_patient_list_query_budget(self):
+        self.client.force_authenticate(self.patient)
+        url = reverse("healthrecords-list")
+        self.assertFlatQueryBudget(lambda: self.client.get(url), lambda: self._add_records(10), budget=4)
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=0)  # measure the uncached path
+    def test_doctor_list_query_budget(self):
+        self.client.force_authenticate(self.doctor)
+        url = reverse("healthrecords-list")
+        self.assertFlatQueryBudget(lambda: self.client.get(url), lambda: self._add_records(10), budget=4)
+
+    def test_detail_query_budget(self):
+        self.client.force_authenticate(self.doctor)
+        record = HealthRecord.objects.first()
+        url = reverse("healthrecords-detail", args=[record.id])
+        with self.assertQueryBudget(5):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["annotations"][0]["doctor_name"], "Greg House")
+
+
+class HealthRecordPaginationTests(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.patient = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        Patient.objects.create(user=self.patient)
+        self.records = [
+            HealthRecord.objects.create(patient=self.patient.patient_profile, data=f"Record {i}")
+            for i in range(5)
+        ]
+        # Share a timestamp so that the `id` tiebreaker is exercised.
+        HealthRecord.objects.filter(pk__in=[r.pk for r in self.records[1:4]]).update(
+            created_at=self.records[1].created_at
+        )
+        self.client.force_authenticate(self.patient)
+
+    def _walk(self, url, link):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(item["id"] for item in response.data["results"])
+            url = response.data[link]
+        return ids
+
+    def test_forward_and_backward_pages(self):
+        expected = [r.id for r in self.records]
+        forward = self._walk(reverse("healthrecords-list") + "?page_size=2", "next")
+        self.assertEqual(forward, expected)
+
+        last_page = self.client.get(reverse("healthrecords-list") + "?page_size=2")
+        while last_page.data["next"]:
+            last_page = self.client.get(last_page.data["next"])
+        backward = self._walk(last_page.data["previous"], "previous")
+        self.assertEqual(sorted(backward), expected[:4])
+
+    def test_pages_do_not_count(self):
+        first = self.client.get(reverse("healthrecords-list") + "?page_size=2")
+        with self.assertQueryBudget(4) as context:
+            self.client.get(first.data["next"])
+        self.assertFalse(any("COUNT(*)" in q["sql"] for q in context.captured_queries))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("healthrecords-list") + "?cursor=garbage")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class HealthRecordExportTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user(username="doc1", password="pass123", email="testd@test.com", role="doctor")
+        Doctor.objects.create(user=self.doctor)
+        self.patient = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        Patient.objects.create(user=self.patient)
+        for i in range(7):
+            record = HealthRecord.objects.create(patient=self.patient.patient_profile, data=f"Record {i}")
+            Annotation.objects.create(record=record, doctor=self.doctor.doctor_profile, comment=f"Note {i}")
+
+    def _lines(self, response):
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_patient_export(self):
+        self.client.force_authenticate(self.patient)
+        response = self.client.get(reverse("healthrecords-export"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = self._lines(response)
+        self.assertEqual([line["data"] for line in lines], [f"Record {i}" for i in range(7)])
+        self.assertEqual(lines[0]["annotations"][0]["comment"], "Note 0")
+
+    def test_gzip_export(self):
+        self.client.force_authenticate(self.patient)
+        response = self.client.get(reverse("healthrecords-export"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        lines = gzip.decompress(b"".join(response.streaming_content)).splitlines()
+        self.assertEqual(len(lines), 7)
+
+    def test_doctor_export_requires_assignment(self):
+        self.client.force_authenticate(self.doctor)
+        url = reverse("healthrecords-export")
+        patient_id = self.patient.patient_profile.id
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {"patient": patient_id}).status_code, status.HTTP_403_FORBIDDEN)
+
+        DoctorPatientAssignment.objects.create(doctor=self.doctor.doctor_profile, patient=self.patient.patient_profile)
+        response = self.client.get(url, {"patient": patient_id})
+        self.assertEqual(len(self._lines(response)), 7)
+
+    async def test_export_streams_under_asgi(self):
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(self.patient)}"}
+        with mock.patch.object(HealthRecordViewSet, "export_chunk_size", 2):
+            response = await self.async_client.get(reverse("healthrecords-export"), headers=headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            # An async iterator is streamed as it is produced rather than buffered whole
+            self.assertTrue(response.is_async)
+            body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual([json.loads(line)["data"] for line in body.splitlines()], [f"Record {i}" for i in range(7)])
+
+
+class HealthRecordConditionalGetTests(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user(username="doc1", password="pass123", email="testd@test.com", role="doctor")
+        Doctor.objects.create(user=self.doctor)
+        self.patient = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        Patient.objects.create(user=self.patient)
+        self.record = HealthRecord.objects.create(patient=self.patient.patient_profile, data="Record")
+        self.client.force_authenticate(self.patient)
+
+    def test_list_not_modified(self):
+        url = reverse("healthrecords-list")
+        response = self.client.get(url)
+        etag = response["ETag"]
+        # It could not reflect deletes
+        self.assertFalse(response.has_header("Last-Modified"))
+
+        with self.assertQueryBudget(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        HealthRecord.objects.create(patient=self.patient.patient_profile, data="Another record")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_list_etag_reflects_deletes(self):
+        other = HealthRecord.objects.create(patient=self.patient.patient_profile, data="Another record")
+        url = reverse("healthrecords-list")
+        etag = self.client.get(url)["ETag"]
+
+        other.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 1)
+        # Clients only sending If-Modified-Since see the delete as well
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_validators_read_only_the_page(self):
+        for i in range(3):
+            HealthRecord.objects.create(patient=self.patient.patient_profile, data=f"Record {i}")
+        url = reverse("healthrecords-list") + "?page_size=2"
+        etag = self.client.get(url)["ETag"]
+
+        cache.clear()
+        with self.assertQueryBudget(2) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        select = queries.captured_queries[-1]["sql"]
+        self.assertIn("LIMIT 3", select)
+        self.assertNotIn("COUNT", select)
+        self.assertNotIn('"api_healthrecord"."data"', select)
+
+    def test_detail_changes_with_annotations(self):
+        url = reverse("healthrecords-detail", args=[self.record.id])
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Annotation.objects.create(record=self.record, doctor=self.doctor.doctor_profile, comment="Note")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["annotations"]), 1)
+
+    def test_missing_record_is_not_found(self):
+        response = self.client.get(reverse("healthrecords-detail", args=[self.record.id + 1]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class HealthRecordAsyncTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user(username="doc1", password="pass123", email="testd@test.com", role="doctor")
+        Doctor.objects.create(user=self.doctor)
+        self.patient = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        Patient.objects.create(user=self.patient)
+        self.record = HealthRecord.objects.create(patient=self.patient.patient_profile, data="Record")
+        Annotation.objects.create(record=self.record, doctor=self.doctor.doctor_profile, comment="Note")
+        HealthRecord.objects.create(patient=self.patient.patient_profile, data="Another record")
+
+    def auth(self, user):
+        return {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+
+    async def test_list_matches_sync_view(self):
+        response = await self.async_client.get(reverse("healthrecords-async-list"), headers=self.auth(self.patient))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Queries of the async ORM run on another thread but are still counted
+        self.assertNotIn('desc="0 queries"', response["Server-Timing"])
+
+        self.client.force_authenticate(self.patient)
+        expected = (await sync_to_async(self.client.get)(reverse("healthrecords-list"))).json()
+        self.assertEqual(response.json(), expected)
+        self.assertEqual(len(expected["results"][0]["annotations"]), 1)
+
+    async def test_detail_conditional_get(self):
+        url = reverse("healthrecords-async-detail", args=[self.record.id])
+        response = await self.async_client.get(url, headers=self.auth(self.patient))
+        self.assertEqual(response.json()["data"], "Record")
+
+        response = await self.async_client.get(
+            url, headers={**self.auth(self.patient), "If-None-Match": response["ETag"]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_unassigned_doctor_gets_not_found(self):
+        url = reverse("healthrecords-async-detail", args=[self.record.id])
+        response = await self.async_client.get(url, headers=self.auth(self.doctor))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_requires_valid_token(self):
+        url = reverse("healthrecords-async-list")
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn("WWW-Authenticate", response)
+
+        response = await self.async_client.get(url, headers={"Authorization": "Bearer invalid"})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json()["code"], "token_not_valid")
+
+    async def test_read_only(self):
+        response = await self.async_client.post(reverse("healthrecords-async-list"), headers=self.auth(self.patient))
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class HealthRecordChangesTests(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user(username="doc1", password="pass123", email="testd@test.com", role="doctor")
+        Doctor.objects.create(user=self.doctor)
+        self.patient = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        Patient.objects.create(user=self.patient)
+        self.records = [
+            HealthRecord.objects.create(patient=self.patient.patient_profile, data=f"Record {i}") for i in range(3)
+        ]
+        self.url = reverse("healthrecords-changes")
+        self.client.force_authenticate(self.patient)
+
+    def test_initial_and_incremental_sync(self):
+        response = self.client.get(self.url)
+        self.assertEqual([r["id"] for r in response.data["records"]], [r.id for r in self.records])
+        token = response.data["sync_token"]
+
+        response = self.client.get(self.url, {"since": token})
+        self.assertEqual((response.data["records"], response.data["deleted"]), ([], []))
+
+        Annotation.objects.create(record=self.records[0], doctor=self.doctor.doctor_profile, comment="Note")
+        deleted_id = self.records[1].id
+        self.records[1].delete()
+        new_record = HealthRecord.objects.create(patient=self.patient.patient_profile, data="New")
+
+        response = self.client.get(self.url, {"since": token})
+        self.assertEqual([r["id"] for r in response.data["records"]], [self.records[0].id, new_record.id])
+        self.assertEqual(response.data["records"][0]["annotations"][0]["comment"], "Note")
+        self.assertEqual(response.data["deleted"], [deleted_id])
+
+    def test_limit_pages_through_changes(self):
+        response = self.client.get(self.url, {"limit": 2})
+        self.assertTrue(response.data["has_more"])
+        response = self.client.get(self.url, {"since": response.data["sync_token"], "limit": 2})
+        self.assertEqual([r["id"] for r in response.data["records"]], [self.records[2].id])
+        self.assertFalse(response.data["has_more"])
+
+    def test_doctor_sees_only_assigned_patients(self):
+        self.client.force_authenticate(self.doctor)
+        self.assertEqual(self.client.get(self.url).data["records"], [])
+
+        DoctorPatientAssignment.objects.create(doctor=self.doctor.doctor_profile, patient=self.patient.patient_profile)
+        records = self.client.get(self.url).data["records"]
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0]["patient"], self.patient.patient_profile.id)
+
+    def test_assignment_change_resets_the_sync(self):
+        other = User.objects.create_user(username="pat2", password="pass123", email="testp2@test.com", role="patient")
+        Patient.objects.create(user=other)
+        HealthRecord.objects.create(patient=other.patient_profile, data="Other record")
+        DoctorPatientAssignment.objects.create(doctor=self.doctor.doctor_profile, patient=self.patient.patient_profile)
+        self.client.force_authenticate(self.doctor)
+        response = self.client.get(self.url)
+        self.assertFalse(response.data["reset"])
+        token = response.data["sync_token"]
+
+        # Records older than the token are delivered for a newly assigned patient
+        assignment = DoctorPatientAssignment.objects.create(doctor=self.doctor.doctor_profile, patient=other.patient_profile)
+        response = self.client.get(self.url, {"since": token})
+        self.assertTrue(response.data["reset"])
+        self.assertEqual(len(response.data["records"]), 4)
+
+        # And dropped by the reset for an unassigned one
+        assignment.delete()
+        response = self.client.get(self.url, {"since": response.data["sync_token"]})
+        self.assertTrue(response.data["reset"])
+        self.assertEqual(len(response.data["records"]), 3)
+        response = self.client.get(self.url, {"since": response.data["sync_token"]})
+        self.assertEqual((response.data["records"], response.data["reset"]), ([], False))
+
+        self.assertEqual(self.client.get(self.url, {"since": "garbage"}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_changes_of_open_transactions_are_not_skipped(self):
+        token = self.client.get(self.url).data["sync_token"]
+        late = HealthRecord.objects.create(patient=self.patient.patient_profile, data="Late")
+        early = HealthRecord.objects.create(patient=self.patient.patient_profile, data="Early")
+        # `late` got the lower change id, but its transaction is still open while the
+        # one of `early` already committed
+        RecordChange.objects.filter(record_id=late.id).update(transaction_id=5)
+        RecordChange.objects.filter(record_id=early.id).update(transaction_id=10)
+
+        with mock.patch("api.sync._horizon", return_value=5):
+            response = self.client.get(self.url, {"since": token})
+        self.assertEqual(response.data["records"], [])
+
+        with mock.patch("api.sync._horizon", return_value=11):
+            response = self.client.get(self.url, {"since": response.data["sync_token"]})
+        self.assertEqual([r["id"] for r in response.data["records"]], [late.id, early.id])
+
+
+class HealthRecordSparseFieldsetTests(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user(username="doc1", password="pass123", email="testd@test.com", role="doctor", first_name="Greg", last_name="House")
+        Doctor.objects.create(user=self.doctor)
+        self.patient = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        Patient.objects.create(user=self.patient)
+        self.record = HealthRecord.objects.create(patient=self.patient.patient_profile, data="Record " * 100)
+        Annotation.objects.create(record=self.record, doctor=self.doctor.doctor_profile, comment="Note")
+        self.url = reverse("healthrecords-list")
+        self.client.force_authenticate(self.patient)
+        self.client.get(self.url)
+
+    def test_fields_prune_columns_and_prefetches(self):
+        with self.assertQueryBudget(2) as queries:
+            response = self.client.get(self.url, {"fields": "id,created_at"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data["results"][0]), ["id", "created_at"])
+        select = queries.captured_queries[-1]["sql"]
+        self.assertNotIn('"api_healthrecord"."data"', select)
+        self.assertNotIn("api_annotation", select)
+
+    def test_expand_is_opt_in(self):
+        response = self.client.get(self.url, {"expand": ""})
+        self.assertEqual(list(response.data["results"][0]), ["id", "data", "created_at", "updated_at"])
+
+        response = self.client.get(self.url, {"fields": "id", "expand": "annotations"})
+        self.assertEqual(response.data["results"][0]["annotations"][0]["doctor_name"], "Greg House")
+
+        response = self.client.get(self.url)
+        self.assertIn("annotations", response.data["results"][0])
+
+    def test_detail_and_invalid_params(self):
+        detail = reverse("healthrecords-detail", args=[self.record.id])
+        response = self.client.get(detail, {"fields": "data"})
+        self.assertEqual(response.data, {"data": "Record " * 100})
+
+        response = self.client.get(self.url, {"fields": "password"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {"expand": "data"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class HealthRecordSearchTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user(username="doc1", password="pass123", email="testd@test.com", role="doctor")
+        Doctor.objects.create(user=self.doctor)
+        self.patient = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        Patient.objects.create(user=self.patient)
+        other = User.objects.create_user(username="pat2", password="pass123", email="testp2@test.com", role="patient")
+        Patient.objects.create(user=other)
+
+        self.in_data = HealthRecord.objects.create(patient=self.patient.patient_profile, data="Started metformin 500 mg twice daily")
+        self.in_comment = HealthRecord.objects.create(patient=self.patient.patient_profile, data="Routine check-up")
+        Annotation.objects.create(record=self.in_comment, doctor=self.doctor.doctor_profile, comment="Consider metformin")
+        HealthRecord.objects.create(patient=other.patient_profile, data="Metformin intolerance")
+        self.url = reverse("healthrecords-search")
+
+    def test_patient_search_is_ranked_and_scoped(self):
+        self.client.force_authenticate(self.patient)
+        response = self.client.get(self.url, {"q": "metformin"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r["id"] for r in response.data["results"]], [self.in_data.id, self.in_comment.id])
+
+        response = self.client.get(self.url, {"q": "metformin daily", "fields": "id"})
+        self.assertEqual(response.data["results"], [{"id": self.in_data.id, "rank": response.data["results"][0]["rank"]}])
+
+    def test_index_follows_changes(self):
+        self.client.force_authenticate(self.patient)
+        self.in_data.data = "Switched to insulin"
+        self.in_data.save()
+        self.in_comment.delete()
+        self.assertEqual(self.client.get(self.url, {"q": "metformin"}).data["results"], [])
+        self.assertEqual(len(self.client.get(self.url, {"q": "insulin"}).data["results"]), 1)
+
+    def test_doctor_sees_only_assigned_patients(self):
+        self.client.force_authenticate(self.doctor)
+        self.assertEqual(self.client.get(self.url, {"q": "metformin"}).data["results"], [])
+
+        DoctorPatientAssignment.objects.create(doctor=self.doctor.doctor_profile, patient=self.patient.patient_profile)
+        self.assertEqual(len(self.client.get(self.url, {"q": "metformin"}).data["results"]), 2)
+
+    def test_invalid_queries(self):
+        self.client.force_authenticate(self.patient)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {"q": '"unbalanced AND ('})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class HealthRecordBulkTests(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.patient = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        Patient.objects.create(user=self.patient)
+        other = User.objects.create_user(username="pat2", password="pass123", email="testp2@test.com", role="patient")
+        Patient.objects.create(user=other)
+        self.others_record = HealthRecord.objects.create(patient=other.patient_profile, data="Not yours")
+        self.url = reverse("healthrecords-bulk")
+        self.client.force_authenticate(self.patient)
+
+    def test_queries_grow_per_batch_not_per_item(self):
+        self.client.post(self.url, {"records": [{"data": "Warm-up"}]}, format="json")
+        # SQLite caps parameters per statement, so 400 rows take two INSERTs of each kind
+        with self.assertQueryBudget(10):
+            response = self.client.post(self.url, {"records": [{"data": "BP 120/80"}] * 400}, format="json")
+        self.assertEqual(response.data["created"], 400)
+        self.assertEqual(HealthRecord.objects.filter(patient=self.patient.patient_profile).count(), 401)
+
+    def test_per_item_results(self):
+        record = HealthRecord.objects.create(patient=self.patient.patient_profile, data="Old reading")
+        response = self.client.post(
+            self.url,
+            {
+                "records": [
+                    {"data": "Glucose 5.4 mmol/L"},
+                    {"id": record.id, "data": "Corrected reading"},
+                    {"id": self.others_record.id, "data": "Overwrite"},
+                    {},
+                    "not an object",
+                ]
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data["created"], response.data["updated"], response.data["failed"]), (1, 1, 3))
+        self.assertEqual(
+            [r["status"] for r in response.data["results"]],
+            ["created", "updated", "invalid", "invalid", "invalid"],
+        )
+        self.assertIn("data", response.data["results"][3]["errors"])
+
+        record.refresh_from_db()
+        self.assertEqual(record.data, "Corrected reading")
+        self.assertEqual(HealthRecord.objects.get(pk=self.others_record.pk).data, "Not yours")
+
+        # Bulk writes are visible to delta sync and search like single ones
+        changes = self.client.get(reverse("healthrecords-changes")).data
+        self.assertIn(response.data["results"][0]["id"], [r["id"] for r in changes["records"]])
+        hits = self.client.get(reverse("healthrecords-search"), {"q": "corrected"}).data["results"]
+        self.assertEqual([r["id"] for r in hits], [record.id])
+
+    def test_rejects_non_list_and_non_patients(self):
+        self.assertEqual(self.client.post(self.url, {"records": "x"}, format="json").status_code, status.HTTP_400_BAD_REQUEST)
+        doctor = User.objects.create_user(username="doc1", password="pass123", email="testd@test.com", role="doctor")
+        Doctor.objects.create(user=doctor)
+        self.client.force_authenticate(doctor)
+        response = self.client.post(self.url, {"records": [{"data": "x"}]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class FhirImportTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patients = [
+            {"resourceType": "Patient", "id": "p1", "name": [{"given": ["Ada"], "family": "Lovelace"}],
+             "telecom": [{"system": "email", "value": "ada@example.com"}], "identifier": [{"value": "INS-1"}]},
+            {"resourceType": "Patient", "id": "p2", "name": [{"given": ["Alan"], "family": "Turing"}]},
+        ]
+        observations = [
+            {"resourceType": "Observation", "id": f"o{i}", "subject": {"reference": "Patient/p1"},
+             "code": {"text": "Heart rate"}, "valueQuantity": {"value": 60 + i, "unit": "bpm"},
+             "effectiveDateTime": "2024-01-01T10:00:00Z"}
+            for i in range(5)
+        ]
+        observations.append({"resourceType": "Observation", "id": "o-x", "subject": {"reference": "Patient/unknown"}})
+        self.patients = self._write("Patient.ndjson", patients)
+        self.observations = self._write("Observation.ndjson", observations)
+
+    def _write(self, name, resources):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as stream:
+            stream.write("\n".join(json.dumps(resource) for resource in resources) + "\n")
+        return path
+
+    def test_import_directory(self):
+        call_command("import_fhir", self.directory.name, "--chunk-size", "2", stdout=open(os.devnull, "w"))
+
+        user = User.objects.get(username="fhir-p1")
+        self.assertEqual((user.email, user.get_full_name(), user.has_usable_password()), ("ada@example.com", "Ada Lovelace", False))
+        self.assertEqual(user.patient_profile.health_insurance_number, "INS-1")
+        self.assertEqual(User.objects.get(username="fhir-p2").email, "p2@fhir-import.invalid")
+
+        records = HealthRecord.objects.filter(patient=user.patient_profile).order_by("id")
+        self.assertEqual(records.count(), 5)
+        self.assertEqual(records[0].data, "Heart rate: 60 bpm (2024-01-01T10:00:00Z)")
+        checkpoint = ImportCheckpoint.objects.get(path=self.observations)
+        self.assertEqual((checkpoint.imported, checkpoint.skipped, checkpoint.completed), (5, 1, True))
+
+        # Completed files are not imported twice
+        call_command("import_fhir", self.directory.name, stdout=open(os.devnull, "w"))
+        self.assertEqual(HealthRecord.objects.count(), 5)
+
+    def test_resume_after_crash(self):
+        fhir.import_file(self.patients)
+        real = fhir.IMPORTERS["Observation"]
+        calls = []
+
+        def crash_on_second_chunk(resources):
+            calls.append(len(resources))
+            if len(calls) == 2:
+                raise RuntimeError("Crash")
+            return real(resources)
+
+        with mock.patch.dict(fhir.IMPORTERS, {"Observation": crash_on_second_chunk}):
+            with self.assertRaises(RuntimeError):
+                fhir.import_file(self.observations, chunk_size=2)
+        self.assertEqual(HealthRecord.objects.count(), 2)
+
+        self.assertEqual(fhir.import_file(self.observations, chunk_size=2), (3, 1))
+        self.assertEqual(
+            sorted(record.data for record in HealthRecord.objects.all()),
+            [f"Heart rate: {60 + i} bpm (2024-01-01T10:00:00Z)" for i in range(5)],
+        )
+
+
+TEST_DICTIONARY = train_zlib_dictionary(["Glucose, fasting\nHbA1c 5.1 %", "Glucose, fasting\nHbA1c 6.0 %"])
+
+
+class CompressedRecordDataTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        patient = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        self.patient = Patient.objects.create(user=patient)
+        self.field = HealthRecord._meta.get_field("data")
+        self.text = "Glucose, fasting    92 mg/dL ref 70-130\n" * 50
+
+    def test_round_trip_and_lazy_decode(self):
+        record = HealthRecord.objects.create(patient=self.patient, data=self.text)
+        loaded = HealthRecord.objects.get(pk=record.pk)
+        self.assertIsInstance(loaded.__dict__["data"], CompressedValue)
+        self.assertEqual(loaded.data, self.text)
+        self.assertEqual(loaded.__dict__["data"], self.text)
+
+        stored = HealthRecord.objects.values_list("data", flat=True).get(pk=record.pk)
+        self.assertLess(len(stored.raw), len(self.text) // 10)
+
+    def test_untouched_value_is_saved_without_decoding(self):
+        record = HealthRecord.objects.create(patient=self.patient, data=self.text)
+        loaded = HealthRecord.objects.get(pk=record.pk)
+        loaded.save()
+        self.assertIsInstance(loaded.__dict__["data"], CompressedValue)
+        self.assertEqual(HealthRecord.objects.get(pk=record.pk).data, self.text)
+
+    def test_codecs(self):
+        short = self.field.compress("Short")
+        self.assertEqual(short[:1], b"\x00")
+        self.assertEqual(self.field.decompress(short), "Short")
+
+        lzma_field = CompressedTextField(algorithm="lzma")
+        self.assertEqual(lzma_field.decompress(lzma_field.compress(self.text)), self.text)
+        # Values written by one codec stay readable by a field configured with another
+        self.assertEqual(self.field.decompress(lzma_field.compress(self.text)), self.text)
+
+    def test_trained_dictionary(self):
+        self.assertIn(b"Glucose, fasting", TEST_DICTIONARY)
+        field = CompressedTextField(dictionary="api.health_records.tests.TEST_DICTIONARY")
+        encoded = field.compress(self.text)
+        self.assertEqual(encoded[:1], b"\x03")
+        self.assertEqual(field.decompress(encoded), self.text)
+        with self.assertRaises(ValueError):
+            self.field.decompress(encoded)
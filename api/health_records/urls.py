@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import HealthRecordViewSet
+from .views import HealthRecordViewSet, async_health_record_detail, async_health_record_list
 
 router = DefaultRouter()
 router.register('', HealthRecordViewSet, basename='healthrecords')
 
 urlpatterns = [
+    path('async/', async_health_record_list, name='healthrecords-async-list'),
+    path('async/<int:pk>/', async_health_record_detail, name='healthrecords-async-detail'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
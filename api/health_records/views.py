@@ -1,22 +1,62 @@
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied, ValidationError, NotFound
+from rest_framework.response import Response
 
-from api.models import HealthRecord
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.http import StreamingHttpResponse
+
+from api import sharding
+from api.models import HealthRecord, Annotation
 from .serializers import HealthRecordSerializer
+from .export import gzip_stream, ndjson_lines
+from api.pagination import KeysetPagination
 from api.permissions import IsPatientOwner
+from api.auth.authentication import resolve_role
 from api.auth.views import require_patient
+from api.asynchronous import async_api_view, iterate_in_thread, render_json
+from api.cache import aget_assigned_patient_ids, get_assigned_patient_ids
+from api.fieldsets import SparseFieldsetMixin
+from api.conditional import (
+    arecord_validators,
+    not_modified_response,
+    page_etag,
+    record_validators,
+    set_validators,
+    validator_page,
+)
+from api.response_cache import bump_versions, cached_response, doctor_scope, patient_scope
+from api.search import index_created_records, index_records, search_records
+from api.sync import get_changes, log_record_changes
 
 
-class HealthRecordViewSet(viewsets.ModelViewSet):
+class HealthRecordViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     ViewSet to manage CRUD operations for health records.
 
     - Patients can create, view, update, and delete **only their own** records.
     - Doctors can view records of their **assigned patients**.
+    - Lists are keyset-paginated on `(created_at, id)`.
+    - `?fields=` and `?expand=annotations` select the returned fields on list/detail.
+    - `GET /health_records/export/` streams a patient's full history as NDJSON.
+    - `GET /health_records/changes/` returns records changed since a sync token.
+    - `GET /health_records/search/?q=` ranks records by full-text matches.
+    - `POST /health_records/bulk/` creates or updates many records at once.
     """
 
     serializer_class = HealthRecordSerializer
+    pagination_class = KeysetPagination
+    stateless_auth = True
     permission_classes = [permissions.IsAuthenticated]
+    export_chunk_size = 500
+    changes_page_size = 500
+    search_page_size = 20
+    max_search_page_size = 100
+    sparse_actions = ("list", "retrieve", "search")
+    bulk_max_records = 5000
+    bulk_batch_size = 500
 
     def get_queryset(self):
         """
@@ -24,18 +64,326 @@ class HealthRecordViewSet(viewsets.ModelViewSet):
         - Patients see their own records.
         - Doctors see records of assigned patients.
         - Others get nothing.
+
+        Annotations are only prefetched when they are rendered.
         """
-        user = self.request.user
+        role = resolve_role(self.request.user)
 
-        if hasattr(user, "patient_profile"):
-            return HealthRecord.objects.filter(patient=user.patient_profile)
+        if role.patient is not None:
+            return self._with_annotations(
+                HealthRecord.objects.filter(patient=role.patient)
+            )
 
-        if hasattr(user, "doctor_profile"):
-            assigned_patients = user.doctor_profile.assigned_patients.values_list("patient", flat=True)
-            return HealthRecord.objects.filter(patient__in=assigned_patients)
+        if role.doctor is not None:
+            assigned_patients = get_assigned_patient_ids(role.doctor.id)
+            return self._with_annotations(
+                HealthRecord.objects.filter(patient_id__in=assigned_patients)
+            )
 
         return HealthRecord.objects.none()
 
+    def list(self, request, *args, **kwargs):
+        """
+        List health records, answering 304 Not Modified when the client's ETag is
+        still current. The ETag is computed from the rows of the requested page
+        alone (see `api.conditional.page_etag`), so deep pages stay cheap.
+
+        Responses are cached per user until a record, annotation or assignment of
+        one of the listed patients changes (see `api.response_cache`).
+        """
+        return cached_response(
+            request, self._cache_scopes(), lambda: self._list(request, *args, **kwargs)
+        )
+
+    def _cache_scopes(self):
+        role = resolve_role(self.request.user)
+        if role.patient is not None:
+            return [patient_scope(role.patient.id)]
+        if role.doctor is not None:
+            return [doctor_scope(role.doctor.id)] + [
+                patient_scope(patient_id) for patient_id in get_assigned_patient_ids(role.doctor.id)
+            ]
+        return []
+
+    def _list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(validator_page(self.filter_queryset(self.get_queryset()), self.paginator))
+        etag = page_etag(request, self.paginator, page)
+        not_modified = not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(super().list(request, *args, **kwargs), etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieve a health record, with the same conditional GET handling as `list`.
+        """
+        try:
+            queryset = self.get_queryset().filter(pk=int(kwargs.get("pk")))
+        except (TypeError, ValueError):
+            return super().retrieve(request, *args, **kwargs)
+
+        etag, last_modified = record_validators(request, queryset)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(super().retrieve(request, *args, **kwargs), etag, last_modified)
+
+    def _with_annotations(self, queryset):
+        """
+        Prefetch annotations together with their doctor's user so that the nested
+        `AnnotationSerializer` does not issue one query per annotation.
+        """
+        if not self.wants_field("annotations"):
+            return queryset
+        return queryset.prefetch_related(
+            Prefetch(
+                "annotations",
+                queryset=Annotation.objects.select_related("doctor__user"),
+            )
+        )
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Stream a patient's complete history as newline-delimited JSON.
+
+        Records are read in chunks through a server-side cursor and written to the
+        response as they are serialized, so memory use and time-to-first-byte do not
+        depend on the size of the history. The body is gzip-encoded when the client
+        sends `Accept-Encoding: gzip`.
+
+        Query params:
+            - patient: Patient id, required for doctors (must be an assigned patient).
+
+        Returns:
+            200 OK with an `application/x-ndjson` stream,
+            400 Bad Request if a doctor omits `patient`,
+            403 Forbidden if the doctor is not assigned to the patient.
+        """
+        role = resolve_role(request.user)
+        queryset = self.get_queryset()
+
+        if role.patient is None:
+            patient_id = request.query_params.get("patient")
+            if not patient_id:
+                raise ValidationError({"patient": "'patient' parameter is missing."})
+            try:
+                patient_id = int(patient_id)
+            except ValueError:
+                raise ValidationError({"patient": "'patient' must be an integer."})
+            if role.doctor is None or patient_id not in get_assigned_patient_ids(role.doctor.id):
+                raise PermissionDenied("You are not assigned to this patient.")
+            queryset = queryset.filter(patient_id=patient_id)
+
+        stream = ndjson_lines(
+            queryset.order_by("created_at", "id"), self.get_serializer_class(), self.export_chunk_size
+        )
+        response_headers = {"Vary": "Accept-Encoding"}
+        if "gzip" in request.META.get("HTTP_ACCEPT_ENCODING", ""):
+            stream = gzip_stream(stream)
+            response_headers["Content-Encoding"] = "gzip"
+        if isinstance(request._request, ASGIRequest):
+            stream = iterate_in_thread(stream, self.export_chunk_size)
+
+        return StreamingHttpResponse(
+            stream, content_type="application/x-ndjson", headers=response_headers
+        )
+
+    @action(detail=False, methods=["get"])
+    def changes(self, request):
+        """
+        Delta sync: return the records created, updated or deleted after a sync token.
+
+        A change to an annotation is reported as a change of its record, which is
+        returned with its current annotations. Deleted records are listed by id.
+        When the caller's assigned patients changed since the token was issued,
+        `reset` is true and the changes are returned from the start: the client must
+        drop its copy and rebuild it from this and the following responses.
+
+        Query params:
+            - since: Sync token from a previous response (defaults to everything).
+            - limit: Maximum number of change-log entries to consume per call.
+
+        Returns:
+            200 OK with `records`, `deleted`, the next `sync_token`, `has_more` and `reset`,
+            400 Bad Request if `since` is not a valid sync token or `limit` not a
+            valid integer.
+        """
+        patient_ids = self._visible_patient_ids()
+
+        try:
+            limit = int(request.query_params.get("limit", self.changes_page_size))
+        except ValueError:
+            raise ValidationError({"detail": "'limit' must be an integer."})
+        if limit <= 0:
+            raise ValidationError({"detail": "'limit' must be > 0."})
+        limit = min(limit, self.changes_page_size)
+
+        try:
+            changed, deleted, sync_token, has_more, reset = get_changes(
+                patient_ids, request.query_params.get("since", ""), limit
+            )
+        except ValueError:
+            raise ValidationError({"since": "Invalid sync token."})
+        records = list(
+            self._with_annotations(
+                HealthRecord.objects.filter(pk__in=changed, patient_id__in=patient_ids)
+            ).order_by("id")
+        )
+        # Records changed and deleted within the window only need their tombstone
+        deleted += sorted(set(changed) - {record.id for record in records})
+
+        serializer_class = self.get_serializer_class()
+        return Response(
+            {
+                "records": [
+                    dict(serializer_class(record).data, patient=record.patient_id)
+                    for record in records
+                ],
+                "deleted": deleted,
+                "sync_token": sync_token,
+                "has_more": has_more,
+                "reset": reset,
+            }
+        )
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """
+        Full-text search over the caller's visible records and their annotations.
+
+        Matches in the record itself rank above matches in its annotations. Uses a
+        GIN-indexed `tsvector` on PostgreSQL and an FTS5 table on SQLite (see
+        `api.search`). Supports `?fields=`/`?expand=` like `list`.
+
+        Query params:
+            - q: Text to search for; every word must match.
+            - limit: Maximum number of results (default 20, at most 100).
+
+        Returns:
+            200 OK with `results`, best match first, each with its `rank`,
+            400 Bad Request if `q` is missing or `limit` is invalid.
+        """
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            raise ValidationError({"q": "'q' parameter is missing."})
+        try:
+            limit = int(request.query_params.get("limit", self.search_page_size))
+        except ValueError:
+            raise ValidationError({"limit": "'limit' must be an integer."})
+        if limit <= 0:
+            raise ValidationError({"limit": "'limit' must be > 0."})
+        limit = min(limit, self.max_search_page_size)
+
+        hits = search_records(self._visible_patient_ids(), query, limit)
+        records = self.filter_queryset(self.get_queryset()).in_bulk([record_id for record_id, _ in hits])
+
+        results = []
+        for record_id, rank in hits:
+            if record_id in records:
+                results.append(dict(self.get_serializer(records[record_id]).data, rank=rank))
+        return Response({"results": results})
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Create or update many of the authenticated patient's records in one request.
+
+        Every item is validated first; the valid ones are then written with
+        `bulk_create`/`bulk_update` in batches of `bulk_batch_size` inside one
+        transaction, so the number of queries does not grow with the item count.
+        Invalid items are reported and skipped without failing the others.
+
+        Request body:
+            - records: list of objects with `data`, plus `id` to update an
+              existing record instead of creating one.
+
+        Returns:
+            200 OK with `created`, `updated` and `failed` counts and one result per
+            item (`index`, `status` and the record `id` or the `errors`),
+            400 Bad Request if `records` is not a list or is too long,
+            403 Forbidden if the user is not a patient.
+        """
+        patient = require_patient(request.user)
+        items = request.data.get("records") if isinstance(request.data, dict) else None
+        if not isinstance(items, list):
+            raise ValidationError({"records": "Expected a list of records."})
+        if len(items) > self.bulk_max_records:
+            raise ValidationError({"records": f"At most {self.bulk_max_records} records per request."})
+
+        # One serializer instance validates every item
+        serializer = self.get_serializer()
+        results = [None] * len(items)
+        to_create, to_update = [], {}
+        for index, item in enumerate(items):
+            try:
+                validated = serializer.run_validation(item)
+                record_id = item.get("id")
+                if record_id is not None and (isinstance(record_id, bool) or not isinstance(record_id, int)):
+                    raise ValidationError({"id": ["A valid integer is required."]})
+            except ValidationError as exc:
+                results[index] = {"index": index, "status": "invalid", "errors": exc.detail}
+                continue
+            if record_id is None:
+                to_create.append((index, HealthRecord(patient=patient, **validated)))
+            else:
+                to_update[index] = (record_id, validated)
+
+        owned = HealthRecord.objects.filter(
+            patient=patient, pk__in={record_id for record_id, _ in to_update.values()}
+        ).only("id", "patient_id").in_bulk()
+        updated, now = [], timezone.now()
+        for index, (record_id, validated) in to_update.items():
+            record = owned.get(record_id)
+            if record is None:
+                results[index] = {"index": index, "status": "invalid", "errors": {"id": ["Health record not found."]}}
+                continue
+            for field, value in validated.items():
+                setattr(record, field, value)
+            record.updated_at = now
+            updated.append((index, record))
+
+        created_records = [record for _, record in to_create]
+        updated_records = list({record.pk: record for _, record in updated}.values())
+        with sharding.atomic([patient.id]):
+            HealthRecord.objects.bulk_create(created_records, batch_size=self.bulk_batch_size)
+            HealthRecord.objects.bulk_update(
+                updated_records, ["data", "updated_at"], batch_size=self.bulk_batch_size
+            )
+            # Bulk writes bypass the signals maintaining the change log, search index
+            # and response cache versions
+            log_record_changes(created_records + updated_records)
+            index_created_records(created_records)
+            index_records([record.pk for record in updated_records], using=sharding.shard_for_patient(patient.id))
+            if created_records or updated_records:
+                bump_versions(patient_scope(patient.id))
+
+        for index, record in to_create:
+            results[index] = {"index": index, "status": "created", "id": record.pk}
+        for index, record in updated:
+            results[index] = {"index": index, "status": "updated", "id": record.pk}
+
+        return Response(
+            {
+                "created": len(to_create),
+                "updated": len(updated),
+                "failed": len(items) - len(to_create) - len(updated),
+                "results": results,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+    def _visible_patient_ids(self):
+        """
+        Ids of the patients whose records the caller may read.
+        """
+        role = resolve_role(self.request.user)
+        if role.patient is not None:
+            return [role.patient.id]
+        if role.doctor is not None:
+            return get_assigned_patient_ids(role.doctor.id)
+        return []
+
     def perform_create(self, serializer):
         """
         Assigns the authenticated patient to the new health record.
@@ -87,3 +435,72 @@ class HealthRecordViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("You can only manage your own records.")
 
         return record
+
+
+async def _async_record_queryset(user):
+    """
+    Async counterpart of `HealthRecordViewSet.get_queryset`, always prefetching annotations.
+    """
+    role = resolve_role(user)
+    if role.patient is not None:
+        queryset = HealthRecord.objects.filter(patient=role.patient)
+    elif role.doctor is not None:
+        queryset = HealthRecord.objects.filter(
+            patient_id__in=await aget_assigned_patient_ids(role.doctor.id)
+        )
+    else:
+        return HealthRecord.objects.none()
+    return queryset.prefetch_related(
+        Prefetch("annotations", queryset=Annotation.objects.select_related("doctor__user"))
+    )
+
+
+@async_api_view(stateless=True)
+async def async_health_record_list(request):
+    """
+    GET /health_records/async/
+    --------------------------
+    Async variant of the health record list, for ASGI deployments. Same visibility
+    rules, keyset pagination and conditional GET handling as `HealthRecordViewSet.list`.
+
+    Returns:
+        200 OK with a page of records,
+        304 Not Modified if the client's validators are current,
+        401 Unauthorized without a valid token.
+    """
+    queryset = await _async_record_queryset(request.user)
+    paginator = KeysetPagination()
+    page = await paginator.apaginate_queryset(validator_page(queryset, paginator), request)
+    etag = page_etag(request, paginator, page)
+    not_modified = not_modified_response(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    page = await paginator.apaginate_queryset(queryset, request)
+    serializer = HealthRecordSerializer(page, many=True, context={"request": request})
+    return set_validators(render_json(paginator.get_paginated_data(serializer.data)), etag)
+
+
+@async_api_view(stateless=True)
+async def async_health_record_detail(request, pk):
+    """
+    GET /health_records/async/{id}/
+    -------------------------------
+    Async variant of `HealthRecordViewSet.retrieve`.
+
+    Returns:
+        200 OK with the record,
+        304 Not Modified if the client's validators are current,
+        404 Not Found if the record does not exist or is not visible to the user.
+    """
+    queryset = (await _async_record_queryset(request.user)).filter(pk=pk)
+    etag, last_modified = await arecord_validators(request, queryset)
+    not_modified = not_modified_response(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    record = await queryset.afirst()
+    if record is None:
+        raise NotFound("No HealthRecord matches the given query.")
+    serializer = HealthRecordSerializer(record, context={"request": request})
+    return set_validators(render_json(serializer.data), etag, last_modified)
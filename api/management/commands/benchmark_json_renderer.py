@@ -0,0 +1,106 @@
+import io
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.health_records.serializers import HealthRecordSerializer
+from api.models import Annotation, Doctor, HealthRecord, User
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer, orjson
+from api.synthetic import COMMENTS, FIRST_NAMES, LAST_NAMES, synthetic_record
+
+
+class Command(BaseCommand):
+    """
+    Compare DRF's stdlib JSON renderer/parser with `FastJSONRenderer`/`FastJSONParser`
+    on a serialized page of health records with nested annotations, and check that
+    both render identical bytes.
+
+    The records are built in memory, so no database is needed.
+
+    Usage:
+        python manage.py benchmark_json_renderer
+        python manage.py benchmark_json_renderer --records 500 --annotations 5
+    """
+
+    help = "Benchmark the JSON renderer and parser on health record payloads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records", type=int, default=200, help="Records per payload.")
+        parser.add_argument("--annotations", type=int, default=3, help="Annotations per record.")
+        parser.add_argument("--iterations", type=int, default=50, help="Timed repetitions.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write("orjson is not installed: FastJSONRenderer uses the stdlib encoder.")
+
+        payload = {
+            "next": "https://api.example.com/health_records/?cursor=eyJyIjowLCJwIjpbXX0%3D",
+            "previous": None,
+            "results": self._records(options),
+        }
+        reference = JSONRenderer().render(payload)
+        rendered = FastJSONRenderer().render(payload)
+        if rendered != reference:
+            raise CommandError("FastJSONRenderer output differs from JSONRenderer.")
+        self.stdout.write(
+            f"Payload: {options['records']} records, {options['annotations']} annotations each, "
+            f"{len(reference) / 1024:.0f} KB; outputs are identical."
+        )
+
+        iterations = options["iterations"]
+        self.stdout.write(f"{'operation':<10} {'stdlib ms':>10} {'fast ms':>10} {'speedup':>8}")
+        for operation, baseline, fast in (
+            ("render", lambda: JSONRenderer().render(payload), lambda: FastJSONRenderer().render(payload)),
+            (
+                "parse",
+                lambda: JSONParser().parse(io.BytesIO(reference)),
+                lambda: FastJSONParser().parse(io.BytesIO(reference)),
+            ),
+        ):
+            baseline_ms = self._time(baseline, iterations)
+            fast_ms = self._time(fast, iterations)
+            self.stdout.write(
+                f"{operation:<10} {baseline_ms:>10.2f} {fast_ms:>10.2f} {baseline_ms / fast_ms:>7.1f}x"
+            )
+
+    def _records(self, options):
+        """
+        Serialize unsaved records whose annotations are attached as if prefetched.
+        """
+        rng = random.Random(options["seed"])
+        now = timezone.now()
+        doctors = [
+            Doctor(id=i, user=User(first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES)))
+            for i in range(5)
+        ]
+        records = []
+        for i in range(options["records"]):
+            created_at = now - timedelta(days=i, microseconds=rng.randrange(10**6))
+            record = HealthRecord(id=i + 1, data=synthetic_record(rng), created_at=created_at, updated_at=now)
+            record._prefetched_objects_cache = {
+                "annotations": [
+                    Annotation(
+                        record=record,
+                        doctor=rng.choice(doctors),
+                        comment=rng.choice(COMMENTS),
+                        created_at=created_at + timedelta(hours=j),
+                    )
+                    for j in range(options["annotations"])
+                ]
+            }
+            records.append(record)
+        return HealthRecordSerializer(records, many=True).data
+
+    def _time(self, function, iterations):
+        function()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        return (time.perf_counter() - start) * 1000 / iterations
@@ -0,0 +1,82 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.fields import CompressedTextField, train_zlib_dictionary
+from api.models import HealthRecord
+from api.synthetic import synthetic_record
+
+
+# Dictionary trained by the current run, referenced by dotted path like a real one would be
+TRAINED_DICTIONARY = b""
+
+
+class Command(BaseCommand):
+    """
+    Report storage saved and encode/decode cost of the compressed `HealthRecord.data` field.
+
+    Usage:
+        python manage.py benchmark_record_compression
+        python manage.py benchmark_record_compression --synthetic --samples 5000
+    """
+
+    help = "Benchmark zlib, lzma and dictionary compression on health record data."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=1000, help="Number of records to sample.")
+        parser.add_argument("--synthetic", action="store_true", help="Use generated records instead of the database.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for synthetic data.")
+
+    def handle(self, *args, **options):
+        global TRAINED_DICTIONARY
+        texts = [] if options["synthetic"] else self._database_samples(options["samples"])
+        if not texts:
+            rng = random.Random(options["seed"])
+            texts = [synthetic_record(rng) for _ in range(options["samples"])]
+            self.stdout.write(f"Using {len(texts)} synthetic records.")
+        else:
+            self.stdout.write(f"Using {len(texts)} records from the database.")
+
+        # Train the dictionary on one half and measure on the other
+        half = max(len(texts) // 2, 1)
+        training, measured = texts[:half], texts[half:] or texts
+        TRAINED_DICTIONARY = train_zlib_dictionary(training)
+
+        fields = {
+            "zlib": CompressedTextField(),
+            "zlib-9": CompressedTextField(level=9),
+            "lzma": CompressedTextField(algorithm="lzma"),
+            "zlib+dict": CompressedTextField(dictionary=f"{__name__}.TRAINED_DICTIONARY"),
+        }
+
+        original = sum(len(text.encode("utf-8")) for text in measured)
+        kilobytes = original / 1024
+        self.stdout.write(
+            f"{'codec':<10} {'stored':>10} {'saved':>7} {'encode us/KB':>13} {'decode us/KB':>13}"
+        )
+        self.stdout.write(f"{'none':<10} {original:>10} {'0.0%':>7} {'-':>13} {'-':>13}")
+
+        for name, field in fields.items():
+            start = time.perf_counter()
+            encoded = [field.compress(text) for text in measured]
+            encode_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for raw in encoded:
+                field.decompress(raw)
+            decode_time = time.perf_counter() - start
+
+            stored = sum(len(raw) for raw in encoded)
+            saved = 100 * (1 - stored / original)
+            self.stdout.write(
+                f"{name:<10} {stored:>10} {saved:>6.1f}% "
+                f"{encode_time * 1e6 / kilobytes:>13.1f} {decode_time * 1e6 / kilobytes:>13.1f}"
+            )
+
+    def _database_samples(self, count):
+        field = HealthRecord._meta.get_field("data")
+        return [
+            field.decompress(value.raw)
+            for value in HealthRecord.objects.order_by("-id").values_list("data", flat=True)[:count]
+        ]
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import User
+from api.synthetic import SYNTHETIC_PASSWORD, generate_dataset
+
+
+class Command(BaseCommand):
+    """
+    Generate a reproducible synthetic clinical dataset for benchmarks.
+
+    Usage:
+        python manage.py generate_dataset                                   # small default
+        python manage.py generate_dataset --patients 100000 --doctors 2000 --records 10000000
+        python manage.py generate_dataset --patients 10 --vitals-per-patient 525600  # a year per minute
+    """
+
+    help = "Bulk-insert synthetic doctors, patients, assignments, records and annotations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patients", type=int, default=1000)
+        parser.add_argument("--doctors", type=int, default=50)
+        parser.add_argument("--records", type=int, default=20000)
+        parser.add_argument("--annotations-per-record", type=float, default=0.5)
+        parser.add_argument("--doctors-per-patient", type=int, default=2)
+        parser.add_argument("--vitals-per-patient", type=int, default=0, help="Per-minute heart rate readings.")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per bulk insert.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--prefix", default="synth", help="Username prefix of the generated users.")
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=f"{options['prefix']}-").exists():
+            raise CommandError(f"A dataset with prefix {options['prefix']!r} already exists; pick another --prefix.")
+
+        counts = generate_dataset(
+            patients=options["patients"],
+            doctors=options["doctors"],
+            records=options["records"],
+            annotations_per_record=options["annotations_per_record"],
+            doctors_per_patient=options["doctors_per_patient"],
+            vitals_per_patient=options["vitals_per_patient"],
+            batch_size=options["batch_size"],
+            seed=options["seed"],
+            prefix=options["prefix"],
+            log=self.stdout.write,
+        )
+        self.stdout.write(", ".join(f"{count} {name}" for name, count in counts.items()))
+        self.stdout.write(f"Users log in with the password {SYNTHETIC_PASSWORD!r}.")
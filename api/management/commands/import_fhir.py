@@ -0,0 +1,81 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.fhir import SUPPORTED_RESOURCES, import_file, resource_type
+
+
+def _init_worker():
+    # Needed with the "spawn" start method; a no-op for forked workers
+    django.setup()
+
+
+def _import(path, chunk_size, restart):
+    return path, import_file(path, chunk_size=chunk_size, restart=restart)
+
+
+class Command(BaseCommand):
+    """
+    Load a FHIR Bulk Data export (NDJSON) into users, patients and health records.
+
+    Patient files are imported before Observation files, since observations are
+    attached to the patients they reference. Progress is checkpointed per file, so
+    re-running the command after a crash resumes where it stopped.
+
+    Usage:
+        python manage.py import_fhir export/                      # every *.ndjson[.gz] in a directory
+        python manage.py import_fhir Patient.ndjson Observation.ndjson --workers 4
+    """
+
+    help = "Stream FHIR Bulk Data NDJSON files into the database, resuming from checkpoints."
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="NDJSON files or directories containing them.")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Resources written per transaction.")
+        parser.add_argument("--workers", type=int, default=1, help="Files imported in parallel processes.")
+        parser.add_argument("--restart", action="store_true", help="Ignore checkpoints and import from scratch.")
+
+    def handle(self, *args, **options):
+        files = {kind: [] for kind in SUPPORTED_RESOURCES}
+        for path in self._collect(options["paths"]):
+            kind = resource_type(path)
+            if kind in files:
+                files[kind].append(path)
+            else:
+                self.stderr.write(f"Skipping {path}: unsupported resource type {kind!r}.")
+
+        for kind in SUPPORTED_RESOURCES:
+            for path, (imported, skipped) in self._run(files[kind], options):
+                self.stdout.write(f"{path}: imported {imported} {kind} resource(s), skipped {skipped}.")
+
+    def _collect(self, paths):
+        for path in paths:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    if name.endswith((".ndjson", ".ndjson.gz")):
+                        yield os.path.abspath(os.path.join(path, name))
+            elif os.path.isfile(path):
+                yield os.path.abspath(path)
+            else:
+                raise CommandError(f"{path} does not exist.")
+
+    def _run(self, paths, options):
+        arguments = [(path, options["chunk_size"], options["restart"]) for path in paths]
+        workers = options["workers"]
+        if workers > 1 and connections["default"].vendor == "sqlite":
+            self.stderr.write("SQLite allows a single writer, importing files one at a time.")
+            workers = 1
+        if workers <= 1 or len(paths) <= 1:
+            for argument in arguments:
+                yield _import(*argument)
+            return
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [pool.submit(_import, *argument) for argument in arguments]
+            for future in futures:
+                yield future.result()
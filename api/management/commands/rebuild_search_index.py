@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from api.models import HealthRecord
+from api.search import index_records
+
+
+class Command(BaseCommand):
+    """
+    (Re)index every health record for full-text search, e.g. after migration 0008.
+
+    Usage:
+        python manage.py rebuild_search_index
+        python manage.py rebuild_search_index --batch-size 5000
+    """
+
+    help = "Index all health records and their annotations for full-text search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Records indexed per batch.")
+
+    def handle(self, *args, **options):
+        last_id, indexed = 0, 0
+        while True:
+            ids = list(
+                HealthRecord.objects.filter(pk__gt=last_id)
+                .order_by("pk")
+                .values_list("pk", flat=True)[: options["batch_size"]]
+            )
+            if not ids:
+                break
+            index_records(ids)
+            last_id = ids[-1]
+            indexed += len(ids)
+            self.stdout.write(f"Indexed {indexed} record(s).")
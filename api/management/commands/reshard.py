@@ -0,0 +1,132 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models.constants import OnConflict
+
+from api.models import Annotation, HealthRecord, VitalObservation, VitalRollup
+from api.search import index_records, remove_records
+from api.sharding import reserve_id_range, shard_for_patient, shards
+
+
+VITALS_CHUNK_SIZE = 10000
+
+
+class Command(BaseCommand):
+    """
+    Move health records, annotations and vitals to the shard of their patient: to
+    shard an existing database, or after appending a shard to `HEALTH_DATA_SHARDS`.
+
+    Rows keep their ids and timestamps, and records move with their search index entries. Each
+    batch of patients is copied in a transaction on the target, committed before the
+    one deleting them at the source, so the command can be interrupted and re-run:
+    rows left on both databases are not copied twice. While it runs, the rows of the
+    patients not moved yet cannot be read: run it during a maintenance window.
+
+    Usage:
+        python manage.py reshard --dry-run
+        python manage.py reshard --batch-size 100
+    """
+
+    help = "Move health records, annotations and vitals to the shard of their patient."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Patients moved per transaction.")
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be moved.")
+
+    def handle(self, *args, **options):
+        aliases = shards()
+        if not aliases:
+            raise CommandError("HEALTH_DATA_SHARDS is empty: there is nothing to reshard.")
+        if not options["dry_run"]:
+            for alias in aliases:
+                reserve_id_range(alias)
+
+        batch_size = options["batch_size"]
+        for source in [DEFAULT_DB_ALIAS, *aliases]:
+            patient_ids = set()
+            for model in (HealthRecord, VitalObservation):
+                patient_ids.update(
+                    model.objects.using(source).order_by().values_list("patient_id", flat=True).distinct()
+                )
+            misplaced = defaultdict(list)
+            for patient_id in sorted(patient_ids):
+                target = shard_for_patient(patient_id)
+                if target != source:
+                    misplaced[target].append(patient_id)
+
+            for target, patient_ids in misplaced.items():
+                records = annotations = vitals = 0
+                for start in range(0, len(patient_ids), batch_size):
+                    batch = patient_ids[start:start + batch_size]
+                    if options["dry_run"]:
+                        records += HealthRecord.objects.using(source).filter(patient_id__in=batch).count()
+                        annotations += (
+                            Annotation.objects.using(source).filter(record__patient_id__in=batch).count()
+                        )
+                        vitals += VitalObservation.objects.using(source).filter(patient_id__in=batch).count()
+                    else:
+                        moved = self._move(source, target, batch)
+                        records += moved[0]
+                        annotations += moved[1]
+                        vitals += moved[2]
+                verb = "Would move" if options["dry_run"] else "Moved"
+                self.stdout.write(
+                    f"{verb} {records} record(s), {annotations} annotation(s) and {vitals} vital observation(s) "
+                    f"of {len(patient_ids)} patient(s) from {source} to {target}."
+                )
+
+    def _move(self, source, target, patient_ids):
+        """
+        Copy the records, annotations, vitals and vital rollups of patients from `source` to `target`, then
+        delete them at the source. Raw inserts and deletes bypass `auto_now` and the
+        signals: the data does not change, only where it is stored.
+
+        Returns:
+            (int, int, int): Number of moved records, annotations and vital observations.
+        """
+        # The copies commit before the deletes: if the process dies in between, the
+        # rows are on both databases until a re-run copies nothing twice and deletes them
+        with transaction.atomic(using=source):
+            with transaction.atomic(using=target):
+                records = list(HealthRecord.objects.using(source).filter(patient_id__in=patient_ids))
+                annotations = list(Annotation.objects.using(source).filter(record__patient_id__in=patient_ids))
+                record_ids = [record.pk for record in records]
+                self._copy(HealthRecord, records, target)
+                self._copy(Annotation, annotations, target)
+                index_records(record_ids, using=target)
+
+                # A patient can have hundreds of thousands of readings: copy them in chunks
+                moved = {}
+                for model in (VitalObservation, VitalRollup):
+                    moved[model], last_id = 0, 0
+                    queryset = model.objects.using(source).filter(patient_id__in=patient_ids).order_by("pk")
+                    while True:
+                        chunk = list(queryset.filter(pk__gt=last_id)[:VITALS_CHUNK_SIZE])
+                        if not chunk:
+                            break
+                        self._copy(model, chunk, target)
+                        moved[model], last_id = moved[model] + len(chunk), chunk[-1].pk
+
+            remove_records(record_ids, using=source)
+            Annotation.objects.using(source).filter(pk__in=[annotation.pk for annotation in annotations])._raw_delete(
+                source
+            )
+            HealthRecord.objects.using(source).filter(pk__in=record_ids)._raw_delete(source)
+            VitalObservation.objects.using(source).filter(patient_id__in=patient_ids)._raw_delete(source)
+            VitalRollup.objects.using(source).filter(patient_id__in=patient_ids)._raw_delete(source)
+        return len(records), len(annotations), moved[VitalObservation]
+
+    def _copy(self, model, objs, target):
+        """
+        Insert rows at `target` as they are, skipping those already there (copied by an
+        interrupted run).
+        """
+        if not objs:
+            return
+        fields = model._meta.local_concrete_fields
+        size = connections[target].ops.bulk_batch_size(fields, objs)
+        for start in range(0, len(objs), size):
+            model._base_manager.using(target)._insert(
+                objs[start:start + size], fields=fields, using=target, raw=True, on_conflict=OnConflict.IGNORE
+            )
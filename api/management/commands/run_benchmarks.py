@@ -0,0 +1,69 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment
+
+from api.benchmarks import SCENARIOS, compare_to_baseline, load_fixtures, run_scenario, uncovered_routes
+
+
+class Command(BaseCommand):
+    """
+    Benchmark every API route in-process through the Django test client.
+
+    Run it against a database filled by `generate_dataset`. Write requests are rolled
+    back, so runs are repeatable. With `--baseline`, the command fails when a scenario
+    is slower (p95) than the baseline allows or issues more queries.
+
+    Usage:
+        python manage.py run_benchmarks --iterations 50 --save-baseline benchmarks.json
+        python manage.py run_benchmarks --baseline benchmarks.json --tolerance 0.25
+    """
+
+    help = "Measure p50/p95/p99 latency, queries per request and throughput of every route."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20, help="Measured requests per scenario.")
+        parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests per scenario.")
+        parser.add_argument("--only", nargs="*", default=None, help="Scenario names to run.")
+        parser.add_argument("--baseline", help="JSON file of results to compare against.")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown (fraction).")
+        parser.add_argument("--save-baseline", help="Write the results to this JSON file.")
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        missing = uncovered_routes()
+        if missing:
+            raise CommandError(f"Routes without a benchmark scenario: {', '.join(missing)}")
+        try:
+            fixtures = load_fixtures()
+        except LookupError as exc:
+            raise CommandError(str(exc))
+
+        # Allows the test client's host and keeps emails in memory
+        setup_test_environment()
+
+        scenarios = [s for s in SCENARIOS if options["only"] is None or s.name in options["only"]]
+        results = {}
+        self.stdout.write(
+            f"{'scenario':<28} {'status':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'req/s':>8}"
+        )
+        for scenario in scenarios:
+            result = results[scenario.name] = run_scenario(
+                scenario, fixtures, options["iterations"], options["warmup"]
+            )
+            self.stdout.write(
+                f"{scenario.name:<28} {result['status']:>6} {result['p50_ms']:>9} {result['p95_ms']:>9} "
+                f"{result['p99_ms']:>9} {result['queries']:>8} {result['throughput']:>8}"
+            )
+
+        for path in filter(None, [options["output"], options["save_baseline"]]):
+            with open(path, "w") as stream:
+                json.dump(results, stream, indent=2, sort_keys=True)
+
+        if options["baseline"]:
+            with open(options["baseline"]) as stream:
+                baseline = json.load(stream)
+            regressions = compare_to_baseline(results, baseline, options["tolerance"])
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
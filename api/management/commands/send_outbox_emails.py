@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.notifications import send_pending_emails
+
+
+class Command(BaseCommand):
+    """
+    Worker that drains the email outbox in batches.
+
+    Usage:
+        python manage.py send_outbox_emails            # run forever
+        python manage.py send_outbox_emails --once     # drain what is due, then exit
+    """
+
+    help = "Deliver queued outbox emails in batches, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Emails per batch.")
+        parser.add_argument("--max-attempts", type=int, default=None, help="Attempts before an email is marked as failed.")
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument("--once", action="store_true", help="Exit once no due emails are left.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_pending_emails(
+                batch_size=options["batch_size"], max_attempts=options["max_attempts"]
+            )
+            if sent or failed:
+                self.stdout.write(f"Sent {sent} email(s), {failed} failed attempt(s).")
+                continue
+
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,469 @@
+import bisect
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from rest_framework import permissions
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.views import APIView
+
+from api.auth.authentication import RoleAwareJWTAuthentication
+from api.response_cache import response_cache_stats
+
+try:
+    import fcntl
+except ImportError:  # Optional: without it, snapshots of exited workers are never merged
+    fcntl = None
+
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Snapshot of exited workers, merged together (see `MetricsRegistry.collect`)
+AGGREGATE_FILE = "aggregate.json"
+# Worker snapshots, `<pid>-<token>.json`; `<pid>.json` is the format of older releases
+_SNAPSHOT_NAME = re.compile(r"(\d+)(?:-(\w+))?\.json")
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    """
+    Timings of the request being processed, filled in by the query wrapper and
+    `TimedSerializerMixin`.
+    """
+
+    __slots__ = ("queries", "db_time", "serializer_time", "serializer_depth")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # `connection.execute_wrapper` hook: count and time every query
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    """
+    Install the query wrapper feeding the current request's metrics on a connection.
+
+    The wrapper stays installed for the connection's lifetime and finds the request
+    through a context variable, so queries run by `sync_to_async` on another thread's
+    connection (async views, the async ORM) are counted too. It is inserted first so
+    that `execute_wrapper` blocks, which pop the last wrapper, never remove it.
+    """
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+class TimedSerializerMixin:
+    """
+    Serializer mixin adding the time spent in `to_representation` to the current
+    request's metrics. Nested serializers are only counted once, by the outermost one.
+    """
+
+    def to_representation(self, instance):
+        metrics = _current.get()
+        if metrics is None or metrics.serializer_depth:
+            return super().to_representation(instance)
+        metrics.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - start
+            metrics.serializer_depth -= 1
+
+
+def _empty_series():
+    return {
+        "count": 0,
+        "duration": 0.0,
+        "buckets": [0] * len(LATENCY_BUCKETS),
+        "queries": 0,
+        "db_time": 0.0,
+        "serializer_time": 0.0,
+    }
+
+
+def _add_series(totals, snapshot):
+    for key, series in snapshot.items():
+        total = totals.setdefault(key, _empty_series())
+        for field in ("count", "duration", "queries", "db_time", "serializer_time"):
+            total[field] += series[field]
+        total["buckets"] = [a + b for a, b in zip(total["buckets"], series["buckets"])]
+
+
+def _read_json(path):
+    try:
+        with open(path) as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    # Atomically, so that readers never see a partial file
+    with open(f"{path}.tmp", "w") as stream:
+        json.dump(data, stream)
+    os.replace(f"{path}.tmp", path)
+
+
+def _worker_snapshot(path, token):
+    """
+    Read a worker snapshot as `(started, series)`, or None if it cannot be read.
+    Snapshots of older releases (without a token) are bare series.
+    """
+    data = _read_json(path)
+    if data is None:
+        return None
+    if token is None:
+        return None, data
+    return data["started"], data["series"]
+
+
+def _process_start_time(pid):
+    """
+    Return the start time of process `pid` (in clock ticks since boot, from Linux's
+    /proc), which tells it apart from later processes reusing its pid, or None.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as stream:
+            # The command name is parenthesized and may contain spaces; the start time
+            # is the 20th field after it
+            return stream.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def _is_running(pid, started):
+    """
+    Return whether worker `pid`, started at `started` (see `_process_start_time`),
+    still runs.
+    """
+    if os.path.exists("/proc/self/stat"):
+        return started is not None and _process_start_time(pid) == started
+    # Without /proc a reused pid looks running: its snapshot is only merged once the
+    # new process exits too
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def _directory_lock(directory):
+    """
+    Hold an exclusive lock on `directory` across processes; yields False (without
+    locking) where `fcntl` is not available.
+    """
+    if fcntl is None:
+        yield False
+        return
+    with open(os.path.join(directory, ".lock"), "a") as stream:
+        fcntl.flock(stream, fcntl.LOCK_EX)
+        try:
+            yield True
+        finally:
+            fcntl.flock(stream, fcntl.LOCK_UN)
+
+
+class MetricsRegistry:
+    """
+    In-process aggregate of request metrics, keyed by `(method, route, status)`.
+
+    Each gunicorn worker has its own registry. When `METRICS_DIR` is set, every worker
+    periodically writes its snapshot to `<METRICS_DIR>/<pid>-<token>.json`
+    (atomically, by rename), and `collect` sums the snapshots of all workers, so
+    whichever worker serves `/metrics` reports totals for the whole server without an
+    external collector. The random token keeps a new worker reusing the pid of an
+    exited one, as in restarted containers, from overwriting its snapshot. Snapshots of exited workers are merged into
+    `aggregate.json` rather than dropped, so counters never go backwards and the
+    directory does not grow with every worker ever started.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+        self._last_flush = time.monotonic()
+        self._pid = None
+        self._started = None
+        self._snapshot_name = None
+
+    def observe(self, method, route, status, duration, metrics):
+        key = f"{method} {route} {status}"
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _empty_series()
+            series["count"] += 1
+            series["duration"] += duration
+            index = bisect.bisect_left(LATENCY_BUCKETS, duration)
+            if index < len(LATENCY_BUCKETS):
+                series["buckets"][index] += 1
+            series["queries"] += metrics.queries
+            series["db_time"] += metrics.db_time
+            series["serializer_time"] += metrics.serializer_time
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self._series))
+
+    def snapshot_name(self):
+        """
+        Return the name of this process's snapshot file in `METRICS_DIR`.
+        """
+        pid = os.getpid()
+        if pid != self._pid:
+            # First flush of this process, or of a worker forked from a preloaded master
+            self._pid = pid
+            self._started = _process_start_time(pid)
+            self._snapshot_name = f"{pid}-{uuid.uuid4().hex}.json"
+        return self._snapshot_name
+
+    def maybe_flush(self, force=False):
+        """
+        Write this worker's snapshot to `METRICS_DIR` if the flush interval elapsed.
+        """
+        directory = getattr(settings, "METRICS_DIR", "")
+        if not directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < getattr(settings, "METRICS_FLUSH_INTERVAL", 5):
+            return
+        self._last_flush = now
+        os.makedirs(directory, exist_ok=True)
+        name = self.snapshot_name()
+        _write_json(os.path.join(directory, name), {"started": self._started, "series": self.snapshot()})
+
+    def collect(self):
+        """
+        Return the series of every worker (or of this process only without
+        `METRICS_DIR`), summed per key.
+
+        Snapshots of exited workers are first merged into the aggregate. This runs
+        under a lock on the directory, so that concurrent scrapes neither merge a
+        snapshot twice nor read the directory halfway through a merge.
+        """
+        directory = getattr(settings, "METRICS_DIR", "")
+        if not directory:
+            return self.snapshot()
+
+        self.maybe_flush(force=True)
+        with _directory_lock(directory) as locked:
+            aggregate = _read_json(os.path.join(directory, AGGREGATE_FILE)) or {"merged": [], "series": {}}
+            if locked:
+                aggregate = self._merge_exited(directory, aggregate)
+            totals = {}
+            _add_series(totals, aggregate["series"])
+            for name in os.listdir(directory):
+                match = _SNAPSHOT_NAME.fullmatch(name)
+                if match is None or name in aggregate["merged"]:
+                    continue
+                snapshot = _worker_snapshot(os.path.join(directory, name), match[2])
+                if snapshot is not None:
+                    _add_series(totals, snapshot[1])
+        return totals
+
+    def _merge_exited(self, directory, aggregate):
+        """
+        Add the snapshots of exited workers to the aggregate, then remove them.
+
+        The aggregate lists the snapshots it includes until they are removed, so a
+        crash between writing it and removing them does not count them twice.
+        """
+        names, exited = [], []
+        for name in os.listdir(directory):
+            match = _SNAPSHOT_NAME.fullmatch(name)
+            if match is None:
+                continue
+            names.append(name)
+            if name in aggregate["merged"]:
+                continue
+            snapshot = _worker_snapshot(os.path.join(directory, name), match[2])
+            if snapshot is None:
+                continue
+            started, series = snapshot
+            if match[2] is None or not _is_running(int(match[1]), started):
+                _add_series(aggregate["series"], series)
+                exited.append(name)
+        if exited:
+            aggregate["merged"] = [name for name in aggregate["merged"] if name in names] + exited
+            _write_json(os.path.join(directory, AGGREGATE_FILE), aggregate)
+        for name in aggregate["merged"]:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+        return aggregate
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+
+registry = MetricsRegistry()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(series):
+    """
+    Render collected series in the Prometheus text exposition format.
+    """
+    histogram, queries, db_time, serializer_time = [], [], [], []
+    for key in sorted(series):
+        method, route, status = key.split(" ", 2)
+        data = series[key]
+        labels = f'method="{_escape(method)}",route="{_escape(route)}",status="{_escape(status)}"'
+
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, data["buckets"]):
+            cumulative += count
+            histogram.append(f'api_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        histogram.append(f'api_request_duration_seconds_bucket{{{labels},le="+Inf"}} {data["count"]}')
+        histogram.append(f"api_request_duration_seconds_sum{{{labels}}} {data['duration']}")
+        histogram.append(f"api_request_duration_seconds_count{{{labels}}} {data['count']}")
+        queries.append(f"api_db_queries_total{{{labels}}} {data['queries']}")
+        db_time.append(f"api_db_duration_seconds_total{{{labels}}} {data['db_time']}")
+        serializer_time.append(f"api_serializer_duration_seconds_total{{{labels}}} {data['serializer_time']}")
+
+    lines = [
+        "# HELP api_request_duration_seconds Request latency by route.",
+        "# TYPE api_request_duration_seconds histogram",
+        *histogram,
+        "# HELP api_db_queries_total Database queries issued by requests.",
+        "# TYPE api_db_queries_total counter",
+        *queries,
+        "# HELP api_db_duration_seconds_total Time spent executing database queries.",
+        "# TYPE api_db_duration_seconds_total counter",
+        *db_time,
+        "# HELP api_serializer_duration_seconds_total Time spent serializing responses.",
+        "# TYPE api_serializer_duration_seconds_total counter",
+        *serializer_time,
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def render_response_cache_stats(stats):
+    """
+    Render the response cache counters (see `api.response_cache`) in the Prometheus
+    text exposition format.
+    """
+    lines = [
+        "# HELP api_response_cache_requests_total Cacheable requests by cache result.",
+        "# TYPE api_response_cache_requests_total counter",
+        *(f'api_response_cache_requests_total{{result="{result}"}} {count}' for result, count in stats.items()),
+    ]
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    Record latency, query count, database time and serializer time of every request.
+
+    The timings are aggregated per URL name (e.g. `healthrecords-detail`) into
+    `registry` and returned to the client in a `Server-Timing` header. Streaming
+    responses are measured until the view returns, not until the stream ends.
+    Works both under WSGI and, without a thread hop, under ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._observe(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._observe(request, response, metrics, time.perf_counter() - start)
+
+    def _observe(self, request, response, metrics, duration):
+        match = getattr(request, "resolver_match", None)
+        # URL names are stable labels; router-generated routes are regexes
+        route = (match.view_name or match.route) if match is not None else "<unmatched>"
+        registry.observe(request.method, route, response.status_code, duration, metrics)
+
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+                f"serializer;dur={metrics.serializer_time * 1000:.1f}",
+                f"total;dur={duration * 1000:.1f}",
+            ]
+        )
+        return response
+
+
+class MetricsView(APIView):
+    """
+    GET /metrics
+    ------------
+    Prometheus scrape endpoint. Admin users only; accepts HTTP Basic auth so that a
+    Prometheus `basic_auth` scrape config can be used instead of short-lived JWTs.
+
+    Returns:
+        200 OK with metrics in the Prometheus text format,
+        401/403 if the user is not an admin.
+    """
+
+    authentication_classes = [RoleAwareJWTAuthentication, BasicAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(
+            render_prometheus(registry.collect()) + render_response_cache_stats(response_cache_stats()),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-18 07:05
+
+from django.db import migrations, models
+
+
+def remove_duplicate_assignments(apps, schema_editor):
+    """
+    Keep only the oldest assignment of each doctor/patient pair so that the unique
+    constraint can be created.
+    """
+    DoctorPatientAssignment = apps.get_model('api', 'DoctorPatientAssignment')
+    keep = (
+        DoctorPatientAssignment.objects.values('doctor', 'patient')
+        .annotate(keep_id=models.Min('id'))
+        .values_list('keep_id', flat=True)
+    )
+    DoctorPatientAssignment.objects.exclude(id__in=list(keep)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='annotation',
+            index=models.Index(fields=['record', 'created_at'], name='annotation_record_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='annotation',
+            index=models.Index(fields=['doctor', 'created_at'], name='annotation_doctor_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthrecord',
+            index=models.Index(fields=['patient', 'created_at'], name='record_patient_created_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_assignments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='doctorpatientassignment',
+            constraint=models.UniqueConstraint(fields=('doctor', 'patient'), name='unique_doctor_patient_assignment'),
+        ),
+    ]
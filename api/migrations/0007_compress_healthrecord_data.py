@@ -0,0 +1,74 @@
+from django.db import migrations, models
+
+import api.fields
+
+
+BATCH_SIZE = 1000
+
+
+def compress_data(apps, schema_editor):
+    """
+    Copy every record's text into the compressed column, in batches.
+    """
+    HealthRecord = apps.get_model('api', 'HealthRecord')
+    batch = []
+    for record in HealthRecord.objects.only('id', 'data').iterator(chunk_size=BATCH_SIZE):
+        record.data_compressed = record.data
+        batch.append(record)
+        if len(batch) >= BATCH_SIZE:
+            HealthRecord.objects.bulk_update(batch, ['data_compressed'])
+            batch = []
+    if batch:
+        HealthRecord.objects.bulk_update(batch, ['data_compressed'])
+
+
+def decompress_data(apps, schema_editor):
+    """
+    Copy the compressed column back into plain text, in batches.
+    """
+    HealthRecord = apps.get_model('api', 'HealthRecord')
+    batch = []
+    for record in HealthRecord.objects.only('id', 'data_compressed').iterator(chunk_size=BATCH_SIZE):
+        record.data = record.data_compressed
+        batch.append(record)
+        if len(batch) >= BATCH_SIZE:
+            HealthRecord.objects.bulk_update(batch, ['data'])
+            batch = []
+    if batch:
+        HealthRecord.objects.bulk_update(batch, ['data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_record_change_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthrecord',
+            name='data_compressed',
+            field=api.fields.CompressedTextField(null=True),
+        ),
+        # Nullable so that the migration can be reversed on a populated table
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='data',
+            field=models.TextField(null=True),
+        ),
+        migrations.RunPython(compress_data, decompress_data),
+        migrations.RemoveField(
+            model_name='healthrecord',
+            name='data',
+        ),
+        migrations.RenameField(
+            model_name='healthrecord',
+            old_name='data_compressed',
+            new_name='data',
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='data',
+            field=api.fields.CompressedTextField(),
+        ),
+    ]
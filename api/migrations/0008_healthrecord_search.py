@@ -0,0 +1,50 @@
+from django.db import migrations
+
+
+# Kept in sync with api.search.SEARCH_TABLE
+SEARCH_TABLE = "api_healthrecord_search"
+
+
+def create_search_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(
+            f"CREATE TABLE {SEARCH_TABLE} ("
+            "record_id bigint PRIMARY KEY REFERENCES api_healthrecord (id) "
+            "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "patient_id bigint NOT NULL, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX healthrecord_search_document_idx ON {SEARCH_TABLE} USING GIN (document)"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX healthrecord_search_patient_idx ON {SEARCH_TABLE} (patient_id)"
+        )
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+            "patient_id UNINDEXED, data, comments, tokenize = 'porter unicode61')"
+        )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ("postgresql", "sqlite"):
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text index of health records and their annotations.
+
+    The index is filled by `api.search` signal handlers; existing records are indexed
+    with `python manage.py rebuild_search_index`.
+    """
+
+    dependencies = [
+        ("api", "0007_compress_healthrecord_data"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
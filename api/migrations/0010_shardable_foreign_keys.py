@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Drop the database constraints of the health data's foreign keys to patients and
+    doctors, which live on another database once the health data is sharded.
+    """
+
+    dependencies = [
+        ('api', '0009_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='annotation',
+            name='doctor',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='api.doctor'),
+        ),
+        migrations.AlterField(
+            model_name='healthrecord',
+            name='patient',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='records', to='api.patient'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 08:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_shardable_foreign_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=32)),
+                ('timestamp', models.DateTimeField()),
+                ('value', models.FloatField()),
+                ('patient', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='vitals', to='api.patient')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('patient', 'code', 'timestamp'), name='unique_patient_vital_timestamp')],
+            },
+        ),
+        migrations.CreateModel(
+            name='VitalRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=32)),
+                ('start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField()),
+                ('total', models.FloatField()),
+                ('minimum', models.FloatField()),
+                ('minimum_at', models.DateTimeField()),
+                ('maximum', models.FloatField()),
+                ('maximum_at', models.DateTimeField()),
+                ('patient', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='vital_rollups', to='api.patient')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('patient', 'code', 'start'), name='unique_patient_vital_rollup')],
+            },
+        ),
+    ]
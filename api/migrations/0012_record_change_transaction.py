@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_vitals'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='recordchange',
+            name='recordchange_patient_id_idx',
+        ),
+        migrations.AddField(
+            model_name='recordchange',
+            name='transaction_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='recordchange',
+            index=models.Index(fields=['patient_id', 'transaction_id', 'id'], name='recordchange_patient_txn_idx'),
+        ),
+    ]
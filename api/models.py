@@ -1,6 +1,10 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser, Group, Permission
 
+from api.fields import CompressedTextField
+from api.sharding import ShardedQuerySet
+
 
 class User(AbstractUser):
     """
@@ -17,6 +21,8 @@ class User(AbstractUser):
     email = models.EmailField(unique=True)
     first_name = models.CharField(max_length=150, blank=False)
     last_name = models.CharField(max_length=150, blank=False)
+    # Bumped whenever the role or role profile changes, invalidating role claims in tokens
+    profile_version = models.PositiveIntegerField(default=0)
 
     EMAIL_FIELD = "email"
     REQUIRED_FIELDS = ["email", "first_name", "last_name"]
@@ -37,6 +43,24 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.role})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        user._loaded_role = user.__dict__.get("role")
+        return user
+
+    def save(self, *args, **kwargs):
+        """
+        Save the user, bumping `profile_version` if the role changed since it was loaded.
+        """
+        loaded_role = getattr(self, "_loaded_role", None)
+        if loaded_role is not None and loaded_role != self.role:
+            self.profile_version += 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "profile_version"}
+        super().save(*args, **kwargs)
+        self._loaded_role = self.role
+
 
 class Patient(models.Model):
     """
@@ -71,21 +95,93 @@ class Doctor(models.Model):
 class HealthRecord(models.Model):
     """
     Represents a health record associated with a patient.
+
+    Stored on the patient's shard when the health data is sharded (see `api.sharding`).
     """
 
+    # No database constraint: with `HEALTH_DATA_SHARDS` records live on a shard,
+    # patients on the primary
     patient = models.ForeignKey(
-        Patient, on_delete=models.CASCADE, related_name="records"
+        Patient, on_delete=models.CASCADE, related_name="records", db_constraint=False
     )
-    data = models.TextField()
+    data = CompressedTextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["patient", "created_at"], name="record_patient_created_idx"),
+        ]
+
     def __str__(self):
         return (
             f"HealthRecord for {self.patient.user.username} ({self.created_at.date()})"
         )
 
 
+class VitalObservation(models.Model):
+    """
+    One reading of a vital sign (e.g. heart rate, LOINC code 8867-4) pushed by a device.
+
+    Stored on the patient's shard like health records. A reading is identified by its
+    patient, code and timestamp, so a device resending a batch does not duplicate it.
+    """
+
+    # No database constraint, see HealthRecord.patient
+    patient = models.ForeignKey(
+        Patient, on_delete=models.CASCADE, related_name="vitals", db_constraint=False
+    )
+    code = models.CharField(max_length=32)
+    timestamp = models.DateTimeField()
+    value = models.FloatField()
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Also the index of the range queries of a patient's series
+            models.UniqueConstraint(
+                fields=["patient", "code", "timestamp"], name="unique_patient_vital_timestamp"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.code}={self.value} for patient {self.patient_id} at {self.timestamp}"
+
+
+class VitalRollup(models.Model):
+    """
+    Summary of a patient's readings of one vital sign over one hour, refreshed when
+    readings are ingested, so that long ranges are charted without reading every
+    reading (see `api.vitals.series`).
+    """
+
+    # No database constraint, see HealthRecord.patient
+    patient = models.ForeignKey(
+        Patient, on_delete=models.CASCADE, related_name="vital_rollups", db_constraint=False
+    )
+    code = models.CharField(max_length=32)
+    start = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    total = models.FloatField()
+    minimum = models.FloatField()
+    minimum_at = models.DateTimeField()
+    maximum = models.FloatField()
+    maximum_at = models.DateTimeField()
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["patient", "code", "start"], name="unique_patient_vital_rollup"),
+        ]
+
+    def __str__(self):
+        return f"{self.code} rollup for patient {self.patient_id} at {self.start}"
+
+
 class DoctorPatientAssignment(models.Model):
     """
     Tracks the assignment relationship between doctors and patients.
@@ -99,6 +195,13 @@ class DoctorPatientAssignment(models.Model):
     )
     assigned_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["doctor", "patient"], name="unique_doctor_patient_assignment"
+            ),
+        ]
+
     def __str__(self):
         return f"{self.doctor.user.username} -> {self.patient.user.username}"
 
@@ -111,9 +214,99 @@ class Annotation(models.Model):
     record = models.ForeignKey(
         HealthRecord, on_delete=models.CASCADE, related_name="annotations"
     )
-    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
+    # Stored on the record's shard, away from the doctor (see HealthRecord.patient)
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, db_constraint=False)
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["record", "created_at"], name="annotation_record_created_idx"),
+            models.Index(fields=["doctor", "created_at"], name="annotation_doctor_created_idx"),
+        ]
+
     def __str__(self):
         return f"Annotation by {self.doctor.user.username} on {self.record.id}"
+
+
+class EmailOutbox(models.Model):
+    """
+    Outgoing email queued in the same transaction as the change that triggered it.
+    Delivered asynchronously by the `send_outbox_emails` management command.
+
+    Rows sharing a `group_key` are coalesced into a single digest message, listing
+    each row's `digest_item`.
+    """
+
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("sent", "Sent"),
+        ("failed", "Failed"),
+    )
+
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    group_key = models.CharField(max_length=100, blank=True)
+    digest_item = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_status_next_idx"),
+            models.Index(fields=["group_key", "status"], name="outbox_group_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"Email to {self.to_email} ({self.status})"
+
+
+class RecordChange(models.Model):
+    """
+    Append-only change log of health records, used for delta sync.
+
+    Every create, update or delete of a record or of one of its annotations appends a
+    row; deletes of the record itself are kept as tombstones (`deleted=True`). Rows
+    are read in commit order, by writing transaction then id, and the position of the
+    last row read is part of the sync token handed to clients (see `api.sync`).
+    """
+
+    patient_id = models.BigIntegerField()
+    record_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    # Set to `api.sync.TransactionId()` when logging a change
+    transaction_id = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["patient_id", "transaction_id", "id"], name="recordchange_patient_txn_idx"),
+        ]
+
+    def __str__(self):
+        action = "deleted" if self.deleted else "changed"
+        return f"Record {self.record_id} {action} ({self.id})"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of a bulk import file, updated in the same transaction as each imported
+    chunk so that a crashed import resumes after the last committed line.
+    """
+
+    path = models.CharField(max_length=500, unique=True)
+    offset = models.BigIntegerField(default=0)
+    imported = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.path} at byte {self.offset}"
@@ -1,12 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from api.models import DoctorPatientAssignment
+from django.utils import timezone
+
+from api.models import DoctorPatientAssignment, EmailOutbox
+
+
+ASSIGNMENT_GROUP_KEY = "assignment:doctor:{doctor_id}"
 
 
 @receiver(post_save, sender=DoctorPatientAssignment)
 def notify_doctor_assignment(sender, instance, created, **kwargs):
     """
-    Sends an email notification to the doctor when a new patient is assigned to the doctor.
+    Queues an email notification to the doctor when a new patient is assigned to the doctor.
+
+    The email is written to the outbox in the same transaction as the assignment and
+    delivered later by the `send_outbox_emails` worker, so the request never waits on SMTP.
 
     Params:
         sender (Model): The model class.
@@ -17,17 +30,178 @@ def notify_doctor_assignment(sender, instance, created, **kwargs):
     if created:
         doctor_user = instance.doctor.user
         patient_name = instance.patient.user.get_full_name()
+        queue_assignment_email(instance.doctor_id, doctor_user.email, patient_name)
+
+
+def queue_assignment_email(doctor_id, to_email, patient_name):
+    """
+    Write the "new patient assigned" email for a doctor to the outbox.
+
+    With `NOTIFICATION_DIGEST_WINDOW` > 0 the email is held back for that many seconds
+    and grouped with the doctor's other assignment emails into one digest.
+
+    Params:
+        doctor_id (int): Primary key of the Doctor being notified.
+        to_email (str): The doctor's email address.
+        patient_name (str): Full name of the assigned patient.
+    Returns:
+        The created EmailOutbox row.
+    """
+    subject = "New patient assigned"
+    message = (
+        f"Patient {patient_name} has been assigned to you. "
+        "Please log in to the application for more information."
+    )
+
+    window = settings.NOTIFICATION_DIGEST_WINDOW
+    if window <= 0:
+        return EmailOutbox.objects.create(to_email=to_email, subject=subject, body=message)
+
+    return EmailOutbox.objects.create(
+        to_email=to_email,
+        subject=subject,
+        body=message,
+        group_key=ASSIGNMENT_GROUP_KEY.format(doctor_id=doctor_id),
+        digest_item=patient_name,
+        next_attempt_at=timezone.now() + timedelta(seconds=window),
+    )
+
+
+def queue_assignment_digest(doctor_id, to_email, patient_names):
+    """
+    Write a single outbox email telling a doctor about several new patients at once.
+    Used by the bulk assignment endpoints, which bypass `post_save`.
+
+    Params:
+        doctor_id (int): Primary key of the Doctor being notified.
+        to_email (str): The doctor's email address.
+        patient_names (list[str]): Full names of the assigned patients.
+    Returns:
+        The created EmailOutbox row, or None if there is nothing to notify.
+    """
+    if not patient_names:
+        return None
+    if len(patient_names) == 1:
+        return queue_assignment_email(doctor_id, to_email, patient_names[0])
+
+    subject, body = _assignment_digest(patient_names)
+    return EmailOutbox.objects.create(to_email=to_email, subject=subject, body=body)
+
+
+def send_pending_emails(batch_size=None, max_attempts=None):
+    """
+    Deliver one batch of due outbox emails over a single SMTP connection.
 
-        subject = "New patient assigned"
-        message = (
-            f"Patient {patient_name} has been assigned to you. "
-            "Please log in to the application for more information."
+    Rows are locked with `SKIP LOCKED` where the database supports it, so several
+    workers can drain the outbox concurrently. Once any row of a group is due, every
+    pending row of that group is sent as one digest message. Failed sends are retried
+    with exponential backoff until `max_attempts` is reached, then marked as failed.
+
+    Params:
+        batch_size (int): Maximum number of due rows to pick. Defaults to OUTBOX_BATCH_SIZE.
+        max_attempts (int): Attempts before giving up. Defaults to OUTBOX_MAX_ATTEMPTS.
+    Returns:
+        (int, int): Number of messages sent and number of failed attempts.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+    sent = failed = 0
+
+    with transaction.atomic():
+        now = timezone.now()
+        pending = EmailOutbox.objects.select_for_update(skip_locked=True).filter(status="pending")
+        batch = list(
+            pending.filter(next_attempt_at__lte=now).order_by("next_attempt_at", "id")[:batch_size]
         )
+        if not batch:
+            return sent, failed
+
+        group_keys = {email.group_key for email in batch if email.group_key}
+        if group_keys:
+            batch += list(
+                pending.filter(group_key__in=group_keys)
+                .exclude(id__in=[email.id for email in batch])
+                .order_by("id")
+            )
+        groups = _group_emails(batch)
 
-        # Send email using built-in User.email_user method
-        doctor_user.email_user(subject, message, from_email=None)
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as e:
+            # The connection itself could not be opened, retry the whole batch later
+            for emails in groups:
+                _schedule_retry(emails, e, now, max_attempts)
+            failed = len(groups)
+        else:
+            try:
+                for emails in groups:
+                    try:
+                        connection.send_messages([_build_message(emails, connection)])
+                    except Exception as e:
+                        _schedule_retry(emails, e, now, max_attempts)
+                        failed += 1
+                    else:
+                        for email in emails:
+                            email.status = "sent"
+                            email.sent_at = now
+                            email.attempts += 1
+                        sent += 1
+            finally:
+                connection.close()
 
-        # Log to server output for debug
-        print(
-            f"📧 Email sent to {doctor_user.email} notifying assignment of patient '{patient_name}'."
+        EmailOutbox.objects.bulk_update(
+            batch, ["status", "attempts", "next_attempt_at", "last_error", "sent_at"]
         )
+
+    return sent, failed
+
+
+def _group_emails(emails):
+    """
+    Split outbox rows into the lists that are delivered as one message each.
+    """
+    groups = {}
+    for email in emails:
+        groups.setdefault(email.group_key or f"email:{email.id}", []).append(email)
+    return list(groups.values())
+
+
+def _build_message(emails, connection):
+    """
+    Build a single message for a group of outbox rows, as a digest if there are several.
+    """
+    first = emails[0]
+    if len(emails) == 1:
+        return EmailMessage(first.subject, first.body, to=[first.to_email], connection=connection)
+
+    subject, body = _assignment_digest([email.digest_item for email in emails])
+    return EmailMessage(subject, body, to=[first.to_email], connection=connection)
+
+
+def _assignment_digest(patient_names):
+    """
+    Subject and body of an email listing several newly assigned patients.
+    """
+    items = "\n".join(f"- {name}" for name in patient_names)
+    subject = f"{len(patient_names)} new patients assigned"
+    body = (
+        "The following patients have been assigned to you:\n"
+        f"{items}\n\n"
+        "Please log in to the application for more information."
+    )
+    return subject, body
+
+
+def _schedule_retry(emails, error, now, max_attempts):
+    """
+    Record a failed attempt and push the next one back exponentially.
+    """
+    for email in emails:
+        email.attempts += 1
+        email.last_error = str(error)
+        if email.attempts >= max_attempts:
+            email.status = "failed"
+        else:
+            delay = settings.OUTBOX_RETRY_BACKOFF * 2 ** (email.attempts - 1)
+            email.next_attempt_at = now + timedelta(seconds=delay)
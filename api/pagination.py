@@ -0,0 +1,174 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a `(timestamp, id)` key.
+
+    Each page is fetched with a `WHERE (timestamp, id) > (cursor)` condition instead
+    of an OFFSET, and no COUNT(*) is issued, so deep pages cost the same as the first
+    one. Cursors are opaque base64 tokens that stay valid while rows are inserted.
+
+    Query params:
+        - cursor: Opaque cursor taken from a previous `next`/`previous` link.
+        - page_size: Optional page size, capped at `max_page_size`.
+    """
+
+    ordering = ("created_at", "id")
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    invalid_cursor_message = "Invalid cursor."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self._page_queryset(queryset, request)
+        return self._set_page(list(queryset[: self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Async counterpart of `paginate_queryset`, fetching the page with the async ORM.
+        """
+        queryset = self._page_queryset(queryset, request)
+        return self._set_page([item async for item in queryset[: self.page_size + 1]])
+
+    def _page_queryset(self, queryset, request):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.reverse, self.position = self.decode_cursor(request)
+
+        field, tiebreaker = self.ordering
+        if self.reverse:
+            queryset = queryset.order_by(f"-{field}", f"-{tiebreaker}")
+        else:
+            queryset = queryset.order_by(field, tiebreaker)
+
+        if self.position is not None:
+            value, key = self.position
+            lookup = "lt" if self.reverse else "gt"
+            queryset = queryset.filter(
+                Q(**{f"{field}__{lookup}": value})
+                | Q(**{field: value, f"{tiebreaker}__{lookup}": key})
+            )
+        return queryset
+
+    def _set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next = self.position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_data(self, data):
+        """
+        Wrap a serialized page with its `next`/`previous` links.
+        """
+        return OrderedDict(
+            [
+                ("next", self.get_next_link()),
+                ("previous", self.get_previous_link()),
+                ("results", data),
+            ]
+        )
+
+    def get_page_size(self, request):
+        """
+        Returns the requested page size, falling back to the default on bad input.
+        """
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(reverse=False, item=self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(reverse=True, item=self.page[0])
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def decode_cursor(self, request):
+        """
+        Decode the cursor query param into a `(reverse, position)` pair.
+
+        Raises:
+            NotFound: If the cursor cannot be decoded.
+        Returns:
+            (bool, tuple | None): Direction and `(timestamp, id)` position.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return False, None
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            value = parse_datetime(payload["p"][0])
+            key = int(payload["p"][1])
+            reverse = bool(payload["r"])
+        except (TypeError, ValueError, KeyError, IndexError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, (value, key)
+
+    def encode_cursor(self, reverse, item):
+        """
+        Build a page URL whose cursor points just past `item`.
+        """
+        field, tiebreaker = self.ordering
+        payload = {
+            "r": int(reverse),
+            "p": [getattr(item, field).isoformat(), getattr(item, tiebreaker)],
+        }
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(payload, separators=(",", ":")).encode("ascii")
+        ).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class AssignmentPagination(KeysetPagination):
+    """
+    Keyset pagination for doctor-patient assignments, ordered by assignment time.
+    """
+
+    ordering = ("assigned_at", "id")
@@ -0,0 +1,32 @@
+import codecs
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from api.renderers import FastJSONRenderer, orjson
+
+
+class FastJSONParser(JSONParser):
+    """
+    Drop-in replacement of DRF's `JSONParser` decoding UTF-8 bodies with orjson when it
+    is installed.
+
+    Bodies orjson rejects are parsed again by the stdlib parser, so invalid JSON gets
+    the same error message as before and what only the stdlib accepts (integers beyond
+    64 bits, NaN when `STRICT_JSON` is off) still parses.
+    """
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != "utf-8":
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
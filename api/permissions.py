@@ -1,5 +1,8 @@
 from rest_framework import permissions
 
+from api.auth.authentication import resolve_role
+from api.cache import get_assigned_patient_ids
+
 
 class IsPatientOwner(permissions.BasePermission):
     """
@@ -8,10 +11,8 @@ class IsPatientOwner(permissions.BasePermission):
     """
 
     def has_object_permission(self, request, view, obj):
-        return (
-            hasattr(request.user, "patient_profile")
-            and obj.patient == request.user.patient_profile
-        )
+        patient = resolve_role(request.user).patient
+        return patient is not None and obj.patient_id == patient.id
 
 
 class IsDoctorAssignedToPatient(permissions.BasePermission):
@@ -21,6 +22,5 @@ class IsDoctorAssignedToPatient(permissions.BasePermission):
     """
 
     def has_object_permission(self, request, view, obj):
-        return hasattr(request.user, "doctor_profile") and obj.patient in [
-            a.patient for a in request.user.doctor_profile.assigned_patients.all()
-        ]
+        doctor = resolve_role(request.user).doctor
+        return doctor is not None and obj.patient_id in get_assigned_patient_ids(doctor.id)
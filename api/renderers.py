@@ -0,0 +1,65 @@
+import decimal
+import json
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # Optional: fall back to the stdlib encoder
+    orjson = None
+
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    """
+    orjson `default` hook converting types the same way DRF's `JSONEncoder` does.
+    """
+    if isinstance(obj, decimal.Decimal):
+        # DRF writes decimals as floats; keep the stdlib float formatting (1e-05, not 1e-5)
+        if not hasattr(orjson, "Fragment"):
+            raise TypeError("orjson < 3.9 cannot embed preformatted values")
+        return orjson.Fragment(json.dumps(float(obj), allow_nan=False))
+    return _encoder.default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Drop-in replacement of DRF's `JSONRenderer` encoding with orjson when it is installed.
+
+    Datetimes, dates, times, decimals and every other non-JSON type still go through
+    DRF's `JSONEncoder.default`, and U+2028/U+2029 are escaped as DRF does, so the
+    output is byte-for-byte the same as `JSONRenderer`'s. Whatever the fast path cannot
+    render identically falls back to the stdlib encoder: indented output (browsable API,
+    `; indent=` media types), non-compact or ASCII-only settings, non-string keys and
+    integers beyond 64 bits.
+
+    Known differences of the fast path, for floats only (our serializers emit none):
+    floats outside [1e-4, 1e16) are written as `1e16` rather than `1e+16`, and NaN and
+    infinities are written as null instead of raising.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data,
+                default=_default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
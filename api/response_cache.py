@@ -0,0 +1,246 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from api.db_routing import reads_use_replicas
+from api.models import Annotation, DoctorPatientAssignment, HealthRecord
+
+
+VERSION_KEY = "api:data_version:{scope}"
+RESPONSE_KEY = "api:response:{user_id}:{digest}"
+STATS_KEY = "api:response_cache:{result}"
+RESULTS = ("hit", "miss", "coalesced")
+
+# Seconds between two checks of a waiting request for the response being built
+POLL_INTERVAL = 0.01
+
+
+def patient_scope(patient_id):
+    """
+    Version scope of everything shown about a patient: records and their annotations.
+    """
+    return f"patient:{patient_id}"
+
+
+def doctor_scope(doctor_id):
+    """
+    Version scope of a doctor's annotations and assignments.
+    """
+    return f"doctor:{doctor_id}"
+
+
+def get_versions(scopes):
+    """
+    Return the current data version of each scope.
+
+    A scope without a version (never bumped, or evicted) gets a fresh one based on
+    the clock rather than 0, so it can never take a value it had before and match a
+    response cached for older data.
+
+    Params:
+        scopes (list[str]): Scopes built with `patient_scope`/`doctor_scope`.
+    Returns:
+        dict: Version per scope.
+    """
+    keys = {VERSION_KEY.format(scope=scope): scope for scope in scopes}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        cache.add(key, time.time_ns(), None)
+        versions[key] = cache.get(key)
+    return {scope: versions[key] for key, scope in keys.items()}
+
+
+def bump_versions(*scopes):
+    """
+    Invalidate every cached response depending on the given scopes, in O(1) per scope:
+    the responses are not deleted, their keys just stop matching.
+
+    Versions are bumped immediately and again once the surrounding transaction
+    commits, so a concurrent reader cannot cache the pre-commit state under the
+    new version.
+    """
+    keys = [VERSION_KEY.format(scope=scope) for scope in set(scopes)]
+    if not keys:
+        return
+
+    def bump():
+        for key in keys:
+            try:
+                cache.incr(key)
+            except ValueError:
+                # No version yet: the next reader starts a fresh one
+                pass
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def response_cache_key(request, scopes):
+    """
+    Cache key of the response to `request`, for its user and the current versions of
+    the scopes the response depends on.
+    """
+    versions = get_versions(scopes)
+    digest = hashlib.sha256(
+        "|".join(
+            [request.get_full_path(), *(f"{scope}={versions[scope]}" for scope in sorted(versions))]
+        ).encode("utf-8")
+    ).hexdigest()
+    return RESPONSE_KEY.format(user_id=request.user.pk, digest=digest)
+
+
+def _count(result):
+    key = STATS_KEY.format(result=result)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def response_cache_stats():
+    """
+    Return the number of cache hits, misses and coalesced misses (requests that waited
+    for a concurrent request building the same response) since the cache was cleared.
+    """
+    counts = cache.get_many([STATS_KEY.format(result=result) for result in RESULTS])
+    return {result: counts.get(STATS_KEY.format(result=result), 0) for result in RESULTS}
+
+
+def _entry(response):
+    if response.status_code != 200:
+        return None
+    return {
+        "data": response.data,
+        "etag": response.get("ETag"),
+        "last_modified": response.get("Last-Modified"),
+    }
+
+
+def _response(request, entry, result):
+    last_modified = entry["last_modified"]
+    not_modified = get_conditional_response(
+        request._request,
+        etag=entry["etag"],
+        last_modified=parse_http_date_safe(last_modified) if last_modified else None,
+    )
+    response = not_modified if not_modified is not None else Response(entry["data"])
+    if entry["etag"]:
+        response["ETag"] = entry["etag"]
+    if last_modified:
+        response["Last-Modified"] = last_modified
+    response["X-Cache"] = result.upper()
+    return response
+
+
+def cached_response(request, scopes, build):
+    """
+    Return the response to a GET request from the per-user response cache, building
+    and caching it on a miss.
+
+    Only the serialized data and validators of 200 responses are cached; they are
+    rendered again for each request, so content negotiation still applies. Concurrent
+    misses on the same key are deduplicated: one request builds the response while the
+    others wait up to `RESPONSE_CACHE_LOCK_TIMEOUT` for it to appear in the cache.
+    Responses built from a replica may lack writes not replicated yet, which their
+    version keys cannot tell, so they are only cached for `RESPONSE_CACHE_REPLICA_TIMEOUT`.
+
+    Params:
+        request (Request): The current request.
+        scopes (list[str]): Version scopes of the data the response shows. Responses
+            are not cached without scopes.
+        build (callable): Builds the response on a miss.
+    Returns:
+        Response: With an `X-Cache` header of HIT, MISS or COALESCED.
+    """
+    if not scopes:
+        return build()
+
+    key = response_cache_key(request, scopes)
+    entry = cache.get(key)
+    if entry is not None:
+        _count("hit")
+        return _response(request, entry, "hit")
+
+    lock_key = f"{key}:lock"
+    if not cache.add(lock_key, 1, settings.RESPONSE_CACHE_LOCK_TIMEOUT):
+        deadline = time.monotonic() + settings.RESPONSE_CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None:
+                _count("coalesced")
+                return _response(request, entry, "coalesced")
+            if cache.get(lock_key) is None:
+                # The other request finished without caching (e.g. an error response)
+                break
+
+    try:
+        # A lagging replica may build old data under the new versions: cache it briefly
+        if reads_use_replicas():
+            timeout = settings.RESPONSE_CACHE_REPLICA_TIMEOUT
+        else:
+            timeout = settings.RESPONSE_CACHE_TIMEOUT
+        response = build()
+        entry = _entry(response)
+        if entry is not None:
+            cache.set(key, entry, timeout)
+    finally:
+        cache.delete(lock_key)
+    _count("miss")
+    response["X-Cache"] = "MISS"
+    return response
+
+
+@receiver(post_save, sender=HealthRecord)
+@receiver(post_delete, sender=HealthRecord)
+def bump_record_version(sender, instance, raw=False, **kwargs):
+    """
+    Invalidate the cached responses showing the record's patient.
+    """
+    if raw:
+        return
+    bump_versions(patient_scope(instance.patient_id))
+
+
+@receiver(post_save, sender=Annotation)
+@receiver(post_delete, sender=Annotation)
+def bump_annotation_versions(sender, instance, raw=False, **kwargs):
+    """
+    Invalidate the cached responses showing the annotated patient or the annotating
+    doctor's annotations.
+    """
+    if raw:
+        return
+    if Annotation.record.is_cached(instance):
+        patient_id = instance.record.patient_id
+    else:
+        patient_id = (
+            HealthRecord.objects.using(instance._state.db)
+            .filter(pk=instance.record_id)
+            .values_list("patient_id", flat=True)
+            .first()
+        )
+    scopes = [doctor_scope(instance.doctor_id)]
+    if patient_id is not None:
+        scopes.append(patient_scope(patient_id))
+    bump_versions(*scopes)
+
+
+@receiver(post_save, sender=DoctorPatientAssignment)
+@receiver(post_delete, sender=DoctorPatientAssignment)
+def bump_assignment_versions(sender, instance, raw=False, **kwargs):
+    """
+    Invalidate the cached responses of both sides of an assignment.
+    """
+    if raw:
+        return
+    bump_versions(doctor_scope(instance.doctor_id), patient_scope(instance.patient_id))
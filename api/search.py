@@ -0,0 +1,212 @@
+import re
+from collections import defaultdict
+
+from django.db import NotSupportedError, connections, router
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.models import Annotation, HealthRecord
+from api.sharding import run_on_shards, shard_for_patient, shards
+
+
+# Created by migration 0008: a tsvector table with a GIN index on PostgreSQL and an
+# FTS5 virtual table (rowid = record id) on SQLite.
+SEARCH_TABLE = "api_healthrecord_search"
+SEARCH_CONFIG = "english"
+
+
+def _connection(write, using=None):
+    # The index lives next to the records: on their shard when the data is sharded
+    if using is not None:
+        return connections[using]
+    alias = router.db_for_write(HealthRecord) if write else router.db_for_read(HealthRecord)
+    return connections[alias or "default"]
+
+
+def _fts5_query(query):
+    """
+    Turn free text into an FTS5 query matching all words, so user input can never be
+    a syntax error.
+    """
+    return " ".join(f'"{word}"' for word in re.findall(r"\w+", query))
+
+
+def index_records(record_ids, using=None):
+    """
+    (Re)index the text of health records and of their annotations.
+
+    `HealthRecord.data` is stored compressed, so documents are built from the
+    decompressed Python values rather than by the database.
+
+    Params:
+        record_ids (iterable[int]): Records to index; missing ones are skipped.
+        using (str): Database holding the records, if known (else every shard is read).
+    """
+    record_ids = list(record_ids)
+    if not record_ids:
+        return
+
+    comments = defaultdict(list)
+    for record_id, comment in Annotation.objects.using(using).filter(record_id__in=record_ids).values_list(
+        "record_id", "comment"
+    ):
+        comments[record_id].append(comment)
+    rows = [
+        (record.id, record.patient_id, record.data, "\n".join(comments[record.id]))
+        for record in HealthRecord.objects.using(using).filter(pk__in=record_ids).only("id", "patient_id", "data")
+    ]
+
+    _write_documents(rows)
+
+
+def index_created_records(records):
+    """
+    Index records just created in bulk (e.g. with `bulk_create`), from their
+    in-memory values and without reloading them; new records have no annotations.
+
+    Params:
+        records (iterable[HealthRecord]): Saved records with their `data` loaded.
+    """
+    _write_documents([(record.pk, record.patient_id, record.data, "") for record in records])
+
+
+def _write_documents(rows):
+    """
+    Insert or replace `(record_id, patient_id, data, comments)` index rows, on the
+    shard of each row's patient.
+    """
+    by_shard = defaultdict(list)
+    for row in rows:
+        by_shard[shard_for_patient(row[1])].append(row)
+    for alias, shard_rows in by_shard.items():
+        _write_shard_documents(_connection(write=True, using=alias), shard_rows)
+
+
+def _write_shard_documents(connection, rows):
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (record_id, patient_id, document) VALUES "
+                f"(%s, %s, setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'A') "
+                f"|| setweight(to_tsvector('{SEARCH_CONFIG}', %s), 'B')) "
+                "ON CONFLICT (record_id) DO UPDATE "
+                "SET patient_id = EXCLUDED.patient_id, document = EXCLUDED.document",
+                rows,
+            )
+        elif connection.vendor == "sqlite":
+            record_ids = [row[0] for row in rows]
+            placeholders = ", ".join(["%s"] * len(record_ids))
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", record_ids)
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, patient_id, data, comments) VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+
+
+def remove_records(record_ids, using=None):
+    """
+    Drop health records from the search index.
+
+    Params:
+        record_ids (iterable[int]): Records to drop.
+        using (str): Database holding the records, if known (else every shard).
+    """
+    record_ids = list(record_ids)
+    if not record_ids:
+        return
+    placeholders = ", ".join(["%s"] * len(record_ids))
+    for alias in [using] if using is not None or not shards() else shards():
+        connection = _connection(write=True, using=alias)
+        key = {"postgresql": "record_id", "sqlite": "rowid"}.get(connection.vendor)
+        if key is None:
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE {key} IN ({placeholders})", record_ids)
+
+
+def search_records(patient_ids, query, limit):
+    """
+    Find the health records of the given patients matching a text query.
+
+    Matches in the record's data rank above matches in its annotations. With sharded
+    health data, the shards of the patients are searched concurrently and their best
+    hits merged.
+
+    Params:
+        patient_ids (iterable[int]): Patients whose records are visible to the caller.
+        query (str): Free text; every word must match.
+        limit (int): Maximum number of hits.
+    Returns:
+        list[(int, float)]: Record ids and their rank (higher is better), best first.
+    Raises:
+        NotSupportedError: If the database has no full-text search backend.
+    """
+    patient_ids = list(patient_ids)
+    if not patient_ids or not re.search(r"\w", query):
+        return []
+
+    by_shard = defaultdict(list)
+    for patient_id in patient_ids:
+        by_shard[shard_for_patient(patient_id)].append(patient_id)
+    hits = run_on_shards(lambda alias: _search_shard(alias, by_shard[alias], query, limit), by_shard)
+    if len(hits) == 1:
+        return hits[0]
+    return sorted((hit for shard_hits in hits for hit in shard_hits), key=lambda hit: (hit[1], hit[0]), reverse=True)[:limit]
+
+
+def _search_shard(using, patient_ids, query, limit):
+    connection = _connection(write=False, using=using)
+    placeholders = ", ".join(["%s"] * len(patient_ids))
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                f"SELECT record_id, ts_rank(document, query) AS rank "
+                f"FROM {SEARCH_TABLE}, websearch_to_tsquery('{SEARCH_CONFIG}', %s) query "
+                f"WHERE document @@ query AND patient_id IN ({placeholders}) "
+                "ORDER BY rank DESC, record_id DESC LIMIT %s",
+                [query, *patient_ids, limit],
+            )
+        elif connection.vendor == "sqlite":
+            # bm25() is lower for better matches; negate it so both backends sort alike
+            cursor.execute(
+                f"SELECT rowid, -bm25({SEARCH_TABLE}, 0, 2.0, 1.0) AS rank "
+                f"FROM {SEARCH_TABLE} "
+                f"WHERE {SEARCH_TABLE} MATCH %s AND patient_id IN ({placeholders}) "
+                "ORDER BY rank DESC, rowid DESC LIMIT %s",
+                [_fts5_query(query), *patient_ids, limit],
+            )
+        else:
+            raise NotSupportedError(f"Full-text search is not available on {connection.vendor}.")
+        return [(record_id, float(rank)) for record_id, rank in cursor.fetchall()]
+
+
+@receiver(post_save, sender=HealthRecord)
+def index_saved_record(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Index a created or updated health record.
+    """
+    if raw:
+        return
+    if created:
+        index_created_records([instance])
+    else:
+        index_records([instance.pk], using=instance._state.db)
+
+
+@receiver(post_delete, sender=HealthRecord)
+def unindex_deleted_record(sender, instance, **kwargs):
+    """
+    Remove a deleted health record from the index.
+    """
+    remove_records([instance.pk], using=instance._state.db)
+
+
+@receiver(post_save, sender=Annotation)
+@receiver(post_delete, sender=Annotation)
+def index_annotated_record(sender, instance, raw=False, **kwargs):
+    """
+    Reindex a record when one of its annotations changes.
+    """
+    if raw:
+        return
+    index_records([instance.record_id], using=instance._state.db)
@@ -0,0 +1,606 @@
+import contextvars
+import functools
+import hashlib
+import heapq
+import itertools
+import operator
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import DEFAULT_DB_ALIAS, NotSupportedError, connections, models, transaction
+from django.db.models import Count, F, Max, Min, OrderBy, Sum
+from django.db.models.query import FlatValuesListIterable, ModelIterable, ValuesIterable
+from django.db.models.signals import post_migrate, pre_delete
+from django.dispatch import receiver
+
+
+# Models whose rows live on the shards, with the lookup of their patient
+SHARD_KEYS = {
+    "api.healthrecord": "patient",
+    "api.annotation": "record__patient",
+    "api.vitalobservation": "patient",
+    "api.vitalrollup": "patient",
+}
+
+# Rows created on the n-th shard get ids from (n + 1) * SHARD_ID_RANGE on, so ids stay
+# unique across shards and keep their value when resharding moves a row.
+SHARD_ID_RANGE = 1 << 48
+
+_executor = None
+
+
+def shards():
+    """
+    Return the aliases of the databases holding the health data, or an empty list
+    when it is not sharded.
+    """
+    return settings.HEALTH_DATA_SHARDS
+
+
+def is_sharded(model):
+    """
+    Return whether the rows of `model` live on the shards.
+    """
+    return model._meta.label_lower in SHARD_KEYS
+
+
+def jump_hash(key, buckets):
+    """
+    Jump consistent hash (Lamping & Veach): map a 64-bit key to one of `buckets`
+    buckets. Going from n to n + 1 buckets only moves keys to the new bucket, 1/(n + 1)
+    of them.
+    """
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        candidate = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def shard_for_patient(patient_id):
+    """
+    Return the alias of the shard holding a patient's records, annotations and vitals, or None
+    when the data is not sharded.
+
+    The shard only depends on the patient id and on the number of shards, so every
+    process agrees on it without a lookup. Shards must therefore only be appended to
+    `HEALTH_DATA_SHARDS`, followed by `manage.py reshard`.
+    """
+    aliases = shards()
+    if not aliases:
+        return None
+    return aliases[_bucket(patient_id, len(aliases))]
+
+
+@functools.lru_cache(maxsize=65536)
+def _bucket(patient_id, buckets):
+    digest = hashlib.blake2b(str(patient_id).encode("ascii"), digest_size=8).digest()
+    return jump_hash(int.from_bytes(digest, "big"), buckets)
+
+
+def shard_for_instance(instance):
+    """
+    Return the shard holding `instance` (a patient, health record, annotation or vital
+    observation), or None if it cannot be told without a query.
+    """
+    aliases = shards()
+    if not aliases:
+        return None
+    if is_sharded(type(instance)) and instance._state.db in aliases:
+        return instance._state.db
+
+    label = instance._meta.label_lower
+    if label == "api.patient":
+        return shard_for_patient(instance.pk)
+    if label in ("api.healthrecord", "api.vitalobservation", "api.vitalrollup") and instance.patient_id is not None:
+        return shard_for_patient(instance.patient_id)
+    if label == "api.annotation":
+        record = instance._meta.get_field("record")
+        if record.is_cached(instance):
+            return shard_for_instance(record.get_cached_value(instance))
+    return None
+
+
+def run_on_shards(function, aliases):
+    """
+    Call `function(alias)` for each shard and return the results, in order.
+
+    The calls run concurrently on a pool of `SHARD_FANOUT_WORKERS` threads with their
+    own connections, so a fan-out takes about as long as its slowest shard. They run
+    one after the other in the calling thread while one of the shards is in a
+    transaction, whose uncommitted rows other connections would not see.
+    """
+    global _executor
+    aliases = list(aliases)
+    if (
+        len(aliases) < 2
+        or settings.SHARD_FANOUT_WORKERS < 2
+        or any(connections[alias].in_atomic_block for alias in aliases)
+    ):
+        return [function(alias) for alias in aliases]
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(settings.SHARD_FANOUT_WORKERS, thread_name_prefix="shard-fanout")
+    # Each call runs in a copy of the caller's context (request metrics, replica routing)
+    futures = [
+        _executor.submit(contextvars.copy_context().run, _run_on_shard, function, alias)
+        for alias in aliases
+    ]
+    return [future.result() for future in futures]
+
+
+def _run_on_shard(function, alias):
+    try:
+        return function(alias)
+    finally:
+        # Worker threads never see request_finished, which closes connections otherwise
+        connections[alias].close_if_unusable_or_obsolete()
+
+
+@contextmanager
+def atomic(patient_ids=None):
+    """
+    Like `transaction.atomic()`, spanning `default` and the shards holding the given
+    patients' data (every shard if None).
+
+    The databases commit one after the other once the block succeeds. This is not a
+    two-phase commit: a crash between two commits can leave them out of step.
+    """
+    aliases = [DEFAULT_DB_ALIAS]
+    if patient_ids is None:
+        aliases += shards()
+    else:
+        aliases += filter(None, (shard_for_patient(patient_id) for patient_id in patient_ids))
+    with ExitStack() as stack:
+        for alias in dict.fromkeys(aliases):
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+def reserve_id_range(alias):
+    """
+    Move the id sequences of the sharded tables of shard `alias` to the start of its
+    id range (see `SHARD_ID_RANGE`), unless they are already past it.
+    """
+    start = (shards().index(alias) + 1) * SHARD_ID_RANGE
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        for label in SHARD_KEYS:
+            table = apps.get_model(label)._meta.db_table
+            if connection.vendor == "postgresql":
+                cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+                sequence = cursor.fetchone()[0]
+                cursor.execute(f"SELECT last_value FROM {sequence}")
+                if cursor.fetchone()[0] < start:
+                    cursor.execute("SELECT setval(%s, %s, false)", [sequence, start])
+            elif connection.vendor == "sqlite":
+                cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, start - 1])
+                elif row[0] < start - 1:
+                    cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s", [start - 1, table])
+            else:
+                raise NotSupportedError(f"Cannot reserve id ranges on {connection.vendor}.")
+
+
+def _compare(values, others, descending):
+    for value, other, reverse in zip(values, others, descending):
+        if value == other:
+            continue
+        # NULLs sort last, like on PostgreSQL
+        if value is None:
+            result = 1
+        elif other is None:
+            result = -1
+        else:
+            result = -1 if value < other else 1
+        return -result if reverse else result
+    return 0
+
+
+def _sort_key(ordering):
+    getters = [getter for getter, _ in ordering]
+    key = functools.cmp_to_key(functools.partial(_compare, descending=[descending for _, descending in ordering]))
+    return lambda row: key([getter(row) for getter in getters])
+
+
+def _combine(aggregate, values):
+    values = [value for value in values if value is not None]
+    if isinstance(aggregate, Count):
+        # A row lives on one shard only, so even distinct counts add up
+        return sum(values)
+    if not values:
+        return None
+    if isinstance(aggregate, Max):
+        return max(values)
+    if isinstance(aggregate, Min):
+        return min(values)
+    return sum(values)
+
+
+class ShardedQuerySet(models.QuerySet):
+    """
+    QuerySet of a model whose rows live on the shards (see `SHARD_KEYS`).
+
+    Without `HEALTH_DATA_SHARDS` it is a plain QuerySet. Otherwise, unless a database
+    is picked with `using()`, it routes itself:
+
+    - Filters on the patient (`patient`, `patient_id__in`, `record__patient`, ...)
+      restrict it to the shards of those patients, related managers to the shard of
+      their instance. Other querysets read every shard.
+    - Reads spanning several shards run concurrently (`run_on_shards`) and their rows
+      are merged in the queryset's ordering before slicing, so `order_by(...)[:n]`
+      returns the first n rows of all shards. Counts and aggregates are combined.
+    - `select_related()` only joins tables of the same shard; other relations (the
+      doctor, the patient) are prefetched from their own database instead.
+    - `create()`, `bulk_create()` and `bulk_update()` write each row to its shard.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._patient_ids = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._patient_ids = self._patient_ids
+        return clone
+
+    def __and__(self, other):
+        combined = super().__and__(other)
+        if combined is not self and combined is not other:
+            if self._patient_ids is None or other._patient_ids is None:
+                combined._patient_ids = self._patient_ids if other._patient_ids is None else other._patient_ids
+            else:
+                combined._patient_ids = self._patient_ids & other._patient_ids
+        return combined
+
+    def __or__(self, other):
+        combined = super().__or__(other)
+        if combined is not self and combined is not other:
+            if self._patient_ids is None or other._patient_ids is None:
+                combined._patient_ids = None
+            else:
+                combined._patient_ids = self._patient_ids | other._patient_ids
+        return combined
+
+    __xor__ = __or__
+
+    def filter(self, *args, **kwargs):
+        clone = super().filter(*args, **kwargs)
+        patient_ids = self._lookup_patient_ids(kwargs)
+        if patient_ids is not None:
+            clone._patient_ids = patient_ids if clone._patient_ids is None else clone._patient_ids & patient_ids
+        return clone
+
+    def _lookup_patient_ids(self, lookups):
+        key = SHARD_KEYS[self.model._meta.label_lower]
+        patient_ids = None
+        for lookup, value in lookups.items():
+            if lookup in (key, f"{key}_id", f"{key}__id", f"{key}__pk"):
+                values = [value]
+            elif lookup in (f"{key}__in", f"{key}_id__in", f"{key}__id__in", f"{key}__pk__in"):
+                if isinstance(value, models.QuerySet):
+                    continue
+                values = value
+            else:
+                continue
+            try:
+                found = {int(getattr(value, "pk", value)) for value in values}
+            except (TypeError, ValueError):
+                continue
+            patient_ids = found if patient_ids is None else patient_ids & found
+        return patient_ids
+
+    def _shard_aliases(self):
+        """
+        Return the shards this queryset reads, or None if it is not routed by shard.
+        """
+        aliases = shards()
+        if not aliases or self._db is not None:
+            return None
+        if self._patient_ids is not None:
+            targets = {shard_for_patient(patient_id) for patient_id in self._patient_ids}
+            return [alias for alias in aliases if alias in targets]
+        instance = self._hints.get("instance")
+        alias = shard_for_instance(instance) if instance is not None else None
+        return [alias] if alias is not None else list(aliases)
+
+    @property
+    def db(self):
+        if self._db is None:
+            aliases = self._shard_aliases()
+            if aliases is not None and len(aliases) == 1:
+                return aliases[0]
+        return super().db
+
+    def _shard_of(self, obj):
+        alias = shard_for_instance(obj)
+        if alias is None:
+            raise ValueError(f"Cannot tell the shard of {obj!r}: set its patient or record.")
+        return alias
+
+    def _shard_local(self):
+        """
+        Return this queryset with `select_related()` restricted to the relations stored
+        on the same shard, prefetching the others.
+        """
+        related = self.query.select_related
+        if not isinstance(related, dict):
+            return self
+        local, remote = self._split_related(self.model, related, "")
+        if not remote:
+            return self
+
+        queryset = self._chain()
+        queryset.query.select_related = local or False
+        roots = {path for path, _ in remote}
+        names, defer = queryset.query.deferred_loading
+        names = {name for name in names if not any(name.startswith(f"{root}__") for root in roots)}
+        if not defer:
+            # .only() must keep the foreign keys the prefetches follow
+            names |= roots
+        queryset.query.deferred_loading = (frozenset(names), defer)
+        return queryset.prefetch_related(*(lookup for _, lookups in remote for lookup in lookups))
+
+    @classmethod
+    def _split_related(cls, model, related, prefix):
+        """
+        Split a `select_related` tree into the joins local to the shard and a list of
+        `(relation path, prefetch lookups)` for the relations stored elsewhere.
+        """
+        local, remote = {}, []
+        for name, nested in related.items():
+            path = f"{prefix}{name}"
+            related_model = model._meta.get_field(name).related_model
+            if is_sharded(related_model):
+                local[name], nested_remote = cls._split_related(related_model, nested, f"{path}__")
+                remote += nested_remote
+            else:
+                remote.append((path, list(cls._related_paths(nested, path))))
+        return local, remote
+
+    @classmethod
+    def _related_paths(cls, related, path):
+        if not related:
+            yield path
+        for name, nested in related.items():
+            yield from cls._related_paths(nested, f"{path}__{name}")
+
+    def _merge_ordering(self):
+        """
+        Return `(getter, descending)` pairs sorting rows of several shards like the
+        database would, or an empty list if the queryset is unordered.
+        """
+        query = self.query
+        ordering = query.order_by or (self.model._meta.ordering if query.default_ordering else ())
+        columns = []
+        for item in ordering:
+            if isinstance(item, str):
+                if item == "?":
+                    return []
+                name, descending = item.lstrip("-"), item.startswith("-")
+            elif isinstance(item, OrderBy) and isinstance(item.expression, F):
+                name, descending = item.expression.name, item.descending
+            elif isinstance(item, F):
+                name, descending = item.name, False
+            else:
+                raise NotSupportedError(f"Cannot merge shards ordered by {item!r}.")
+            columns.append((self._row_getter(name), descending == query.standard_ordering))
+        return columns
+
+    def _row_getter(self, name):
+        if "__" in name:
+            raise NotSupportedError(f"Cannot merge shards ordered by {name!r}.")
+        if issubclass(self._iterable_class, ModelIterable):
+            if name == "pk":
+                return operator.attrgetter(self.model._meta.pk.attname)
+            try:
+                return operator.attrgetter(self.model._meta.get_field(name).attname)
+            except FieldDoesNotExist:
+                # An annotation
+                return operator.attrgetter(name)
+        if issubclass(self._iterable_class, ValuesIterable):
+            return operator.itemgetter(name)
+        fields = list(self._fields or [field.attname for field in self.model._meta.concrete_fields])
+        if name not in fields:
+            raise NotSupportedError(f"Cannot merge shards ordered by {name!r}, which is not selected.")
+        if issubclass(self._iterable_class, FlatValuesListIterable):
+            return lambda row: row
+        return operator.itemgetter(fields.index(name))
+
+    def _fetch_from_shards(self, aliases):
+        queryset = self._shard_local()
+        if len(aliases) == 1:
+            return list(queryset.using(aliases[0]))
+
+        low, high = queryset.query.low_mark, queryset.query.high_mark
+        if queryset.query.is_sliced:
+            # Every shard may hold the first rows: fetch up to `high` from each, then slice
+            queryset = queryset._chain()
+            queryset.query.clear_limits()
+            queryset.query.set_limits(high=high)
+        rows = list(itertools.chain.from_iterable(
+            run_on_shards(lambda alias: list(queryset.using(alias)), aliases)
+        ))
+        ordering = self._merge_ordering()
+        if ordering:
+            rows.sort(key=_sort_key(ordering))
+        return rows[low:high]
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            aliases = self._shard_aliases()
+            if aliases is not None:
+                self._result_cache = self._fetch_from_shards(aliases)
+                # Each shard prefetched the related objects of its own rows
+                self._prefetch_done = True
+        super()._fetch_all()
+
+    def iterator(self, chunk_size=None):
+        aliases = self._shard_aliases()
+        if aliases is None:
+            return super().iterator(chunk_size)
+        if self.query.is_sliced:
+            return iter(self._fetch_from_shards(aliases))
+
+        queryset = self._shard_local()
+        if queryset._prefetch_related_lookups and chunk_size is None:
+            chunk_size = 2000
+        iterators = [queryset.using(alias).iterator(chunk_size) for alias in aliases]
+        ordering = self._merge_ordering()
+        if not ordering:
+            return itertools.chain.from_iterable(iterators)
+        return heapq.merge(*iterators, key=_sort_key(ordering))
+
+    def count(self):
+        aliases = self._shard_aliases()
+        if aliases is None or self._result_cache is not None:
+            return super().count()
+        if self.query.is_sliced:
+            return len(self)
+        return sum(run_on_shards(lambda alias: self.using(alias).count(), aliases))
+
+    def exists(self):
+        aliases = self._shard_aliases()
+        if aliases is None or self._result_cache is not None:
+            return super().exists()
+        return any(run_on_shards(lambda alias: self.using(alias).exists(), aliases))
+
+    def aggregate(self, *args, **kwargs):
+        aliases = self._shard_aliases()
+        if aliases is None:
+            return super().aggregate(*args, **kwargs)
+        if len(aliases) == 1:
+            return self.using(aliases[0]).aggregate(*args, **kwargs)
+
+        for arg in args:
+            kwargs[arg.default_alias] = arg
+        for aggregate in kwargs.values():
+            if not isinstance(aggregate, (Count, Max, Min, Sum)):
+                raise NotSupportedError(f"Cannot combine {aggregate!r} across shards.")
+        results = run_on_shards(lambda alias: self.using(alias).aggregate(**kwargs), aliases)
+        return {
+            name: _combine(aggregate, [result[name] for result in results])
+            for name, aggregate in kwargs.items()
+        }
+
+    def update(self, **kwargs):
+        aliases = self._shard_aliases()
+        if aliases is None:
+            return super().update(**kwargs)
+        return sum(self.using(alias).update(**kwargs) for alias in aliases)
+
+    update.alters_data = True
+
+    def delete(self):
+        aliases = self._shard_aliases()
+        if aliases is None:
+            return super().delete()
+        total, per_model = 0, Counter()
+        for alias in aliases:
+            deleted, counts = self.using(alias).delete()
+            total += deleted
+            per_model.update(counts)
+        self._result_cache = None
+        return total, dict(per_model)
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def create(self, **kwargs):
+        if not shards() or self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        self._for_write = True
+        obj.save(force_insert=True, using=self._shard_of(obj))
+        return obj
+
+    create.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if not shards() or self._db is not None:
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        groups = defaultdict(list)
+        for obj in objs:
+            groups[self._shard_of(obj)].append(obj)
+        for alias, group in groups.items():
+            self.using(alias).bulk_create(group, *args, **kwargs)
+        return objs
+
+    bulk_create.alters_data = True
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if not shards() or self._db is not None:
+            return super().bulk_update(objs, fields, batch_size=batch_size)
+        groups = defaultdict(list)
+        for obj in objs:
+            groups[self._shard_of(obj)].append(obj)
+        return sum(
+            self.using(alias).bulk_update(group, fields, batch_size=batch_size) for alias, group in groups.items()
+        )
+
+    bulk_update.alters_data = True
+
+
+class ShardRouter:
+    """
+    Route the health records, annotations and vitals of a patient to the patient's shard.
+
+    Querysets of these models route themselves (see `ShardedQuerySet`); the router
+    covers model instances: saving a record or an annotation and following a relation
+    to one. Everything else is left to the next router, so it must come first in
+    `DATABASE_ROUTERS`.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is None or not is_sharded(model):
+            return None
+        return shard_for_instance(instance)
+
+    def db_for_write(self, model, **hints):
+        return self.db_for_read(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = shards()
+        if not aliases or not (is_sharded(type(obj1)) or is_sharded(type(obj2))):
+            return None
+        # Health data may reference rows of the primary, not rows of another shard
+        return not (obj1._state.db in aliases and obj2._state.db in aliases and obj1._state.db != obj2._state.db)
+
+
+@receiver(post_migrate)
+def reserve_shard_id_range(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Give a newly migrated shard its own id range.
+    """
+    if sender.label == "api" and using in shards():
+        reserve_id_range(using)
+
+
+@receiver(pre_delete, sender="api.Patient")
+def delete_patient_health_data(sender, instance, **kwargs):
+    """
+    Delete a deleted patient's records and vitals from their shard, which the deletion
+    cascade (run on the patient's database) does not reach.
+    """
+    if shards():
+        instance.records.all().delete()
+        instance.vitals.all().delete()
+        instance.vital_rollups.all().delete()
+
+
+@receiver(pre_delete, sender="api.Doctor")
+def delete_doctor_annotations(sender, instance, **kwargs):
+    """
+    Delete a deleted doctor's annotations from every shard.
+    """
+    if shards():
+        instance.annotation_set.all().delete()
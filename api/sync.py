@@ -0,0 +1,199 @@
+import base64
+import binascii
+import hashlib
+import json
+
+from django.db import NotSupportedError, connections
+from django.db.models import BigIntegerField, Func, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from api.models import Annotation, HealthRecord, RecordChange
+
+
+class TransactionId(Func):
+    """
+    Id of the transaction writing a change-log row, which orders the log by commit.
+
+    On PostgreSQL, ids are allocated at insert time but rows become visible at commit,
+    so a row can appear below ids a client already synced past. Readers therefore
+    order the log by (transaction, id) and only read the transactions older than every
+    transaction still in progress (see `_horizon`), none of which can still commit
+    rows. SQLite serializes write transactions, so the id alone is commit-ordered and
+    every row logs transaction 0.
+    """
+
+    arity = 0
+    output_field = BigIntegerField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"The change log is not supported on {connection.vendor}.")
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template="pg_current_xact_id()::text::bigint", **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template="0", **extra_context)
+
+
+def get_changes(patient_ids, token, limit):
+    """
+    Collect the records of the given patients that changed after a sync token.
+
+    Reads at most `limit` change-log rows through the `(patient_id, transaction_id, id)`
+    index, so the cost is proportional to the number of changes rather than to the
+    history size.
+
+    A token is only valid for the set of patients it was issued for: when a doctor is
+    assigned or unassigned a patient, the changes are read from the start and `reset`
+    tells the client to drop its copy first, so it gets the older records of new
+    patients and loses those of former ones.
+
+    Params:
+        patient_ids (list[int]): Patients whose records are visible to the caller.
+        token (str): Sync token returned by a previous call (empty for everything).
+        limit (int): Maximum number of change-log rows to consume.
+    Raises:
+        ValueError: If the token cannot be decoded.
+    Returns:
+        (list[int], list[int], str, bool, bool): Ids of changed records, ids of deleted
+        records, the next sync token, whether more changes are pending and whether
+        the client must reset its copy.
+    """
+    position, reset = _decode_token(token, patient_ids)
+
+    changes = RecordChange.objects.filter(patient_id__in=patient_ids)
+    # Computed before reading the rows, so every transaction below it is visible to the read
+    horizon = _horizon(changes.db)
+    if horizon is not None:
+        changes = changes.filter(transaction_id__lt=horizon)
+    if position is not None:
+        transaction_id, change_id = position
+        changes = changes.filter(
+            Q(transaction_id__gt=transaction_id) | Q(transaction_id=transaction_id, id__gt=change_id)
+        )
+    rows = list(
+        changes.order_by("transaction_id", "id").values_list("transaction_id", "id", "record_id", "deleted")[
+            : limit + 1
+        ]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest = {}
+    for _, _, record_id, deleted in rows:
+        latest[record_id] = deleted
+
+    changed = [record_id for record_id, deleted in latest.items() if not deleted]
+    deleted = [record_id for record_id, deleted in latest.items() if deleted]
+    if rows:
+        position = rows[-1][:2]
+    return changed, deleted, _encode_token(position, patient_ids), has_more, reset
+
+
+def _horizon(using):
+    """
+    Oldest transaction still in progress on PostgreSQL: change-log rows of older
+    transactions are all committed (or never will be). None elsewhere.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+        return cursor.fetchone()[0]
+
+
+def _scope(patient_ids):
+    digest = hashlib.blake2b(",".join(map(str, sorted(patient_ids))).encode("ascii"), digest_size=8)
+    return digest.hexdigest()
+
+
+def _encode_token(position, patient_ids):
+    payload = {"p": list(position) if position is not None else None, "s": _scope(patient_ids)}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode("ascii")).decode("ascii")
+
+
+def _decode_token(token, patient_ids):
+    """
+    Decode a sync token into a `(transaction_id, id)` position, or None for the start.
+
+    Returns:
+        (tuple | None, bool): The position and whether the client must reset its copy.
+    """
+    if not token:
+        return None, False
+    # Plain change-log ids, issued before tokens were scoped
+    if token.isdigit():
+        return None, True
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        position = payload["p"]
+        if position is not None:
+            position = (int(position[0]), int(position[1]))
+        scope = payload["s"]
+    except (TypeError, ValueError, KeyError, IndexError, UnicodeEncodeError, binascii.Error):
+        raise ValueError("Invalid sync token.")
+    if scope != _scope(patient_ids):
+        return None, True
+    return position, False
+
+
+def log_record_changes(records, deleted=False):
+    """
+    Append change-log rows for records written without model signals (e.g. `bulk_create`).
+    """
+    RecordChange.objects.bulk_create(
+        [
+            RecordChange(
+                patient_id=record.patient_id, record_id=record.pk, deleted=deleted, transaction_id=TransactionId()
+            )
+            for record in records
+        ]
+    )
+
+
+@receiver(post_save, sender=HealthRecord)
+def log_record_save(sender, instance, raw=False, **kwargs):
+    """
+    Log a created or updated health record.
+    """
+    if raw:
+        return
+    RecordChange.objects.create(
+        patient_id=instance.patient_id, record_id=instance.pk, transaction_id=TransactionId()
+    )
+
+
+@receiver(post_delete, sender=HealthRecord)
+def log_record_delete(sender, instance, **kwargs):
+    """
+    Keep a tombstone for a deleted health record.
+    """
+    RecordChange.objects.create(
+        patient_id=instance.patient_id, record_id=instance.pk, deleted=True, transaction_id=TransactionId()
+    )
+
+
+@receiver(post_save, sender=Annotation)
+@receiver(post_delete, sender=Annotation)
+def log_annotation_change(sender, instance, raw=False, **kwargs):
+    """
+    Log an annotation change as a change of its record, so syncing clients re-fetch
+    the record with its current annotations.
+    """
+    if raw:
+        return
+    if Annotation.record.is_cached(instance):
+        patient_id = instance.record.patient_id
+    else:
+        patient_id = (
+            HealthRecord.objects.using(instance._state.db)
+            .filter(pk=instance.record_id)
+            .values_list("patient_id", flat=True)
+            .first()
+        )
+    if patient_id is not None:
+        RecordChange.objects.create(
+            patient_id=patient_id, record_id=instance.record_id, transaction_id=TransactionId()
+        )
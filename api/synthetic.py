@@ -0,0 +1,213 @@
+import datetime
+import math
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from api import sharding
+from api.models import Annotation, Doctor, DoctorPatientAssignment, HealthRecord, Patient, User, VitalObservation
+from api.search import index_records
+from api.sync import log_record_changes
+from api.vitals.series import refresh_rollups
+
+
+LAB_TESTS = [
+    ("Hemoglobin", "g/dL", 12.0, 17.5),
+    ("White blood cell count", "10^9/L", 4.0, 11.0),
+    ("Platelet count", "10^9/L", 150, 400),
+    ("Glucose, fasting", "mg/dL", 70, 130),
+    ("Creatinine", "mg/dL", 0.6, 1.3),
+    ("Sodium", "mmol/L", 135, 145),
+    ("Potassium", "mmol/L", 3.5, 5.1),
+    ("Total cholesterol", "mg/dL", 140, 260),
+    ("HbA1c", "%", 4.5, 8.5),
+]
+NOTES = [
+    "Patient reports mild headache in the mornings, no visual disturbances.",
+    "Blood pressure measured twice at rest, see readings below.",
+    "Continue current medication, re-evaluate in three months.",
+    "No known drug allergies. Non-smoker. Occasional alcohol consumption.",
+    "Advised low sodium diet and 30 minutes of daily physical activity.",
+]
+COMMENTS = [
+    "Results within normal range.",
+    "Repeat fasting glucose in two weeks.",
+    "Start metformin 500 mg twice daily.",
+    "Refer to cardiology for follow-up.",
+    "Potassium slightly elevated, review medication.",
+    "Discussed lifestyle changes with the patient.",
+]
+SPECIALTIES = ["General practice", "Cardiology", "Endocrinology", "Nephrology", "Internal medicine"]
+FIRST_NAMES = ["Ada", "Alan", "Grace", "Linus", "Marie", "Nikola", "Rosalind", "Tim", "Barbara", "Edsger"]
+LAST_NAMES = ["Lovelace", "Turing", "Hopper", "Torvalds", "Curie", "Tesla", "Franklin", "Lee", "Liskov", "Dijkstra"]
+
+# LOINC code of the heart rate readings generated as vitals
+HEART_RATE_CODE = "8867-4"
+
+# Every synthetic user can log in with this password (hashed once, not per user)
+SYNTHETIC_PASSWORD = "synthetic-pass-123"
+
+
+def synthetic_record(rng):
+    """
+    Build a free-text note followed by a pasted lab report, like the records we store.
+    """
+    lines = rng.sample(NOTES, k=rng.randint(1, len(NOTES)))
+    lines.append(f"Blood pressure: {rng.randint(100, 160)}/{rng.randint(60, 100)} mmHg")
+    lines.append("LABORATORY REPORT")
+    for name, unit, low, high in rng.sample(LAB_TESTS, k=rng.randint(4, len(LAB_TESTS))):
+        value = round(rng.uniform(low * 0.8, high * 1.2), 1)
+        flag = "H" if value > high else "L" if value < low else ""
+        lines.append(f"{name:<28}{value:>8} {unit:<8} ref {low}-{high} {flag}")
+    return "\n".join(lines)
+
+
+def _users(rng, role, prefix, start, count, password):
+    return [
+        User(
+            username=f"{prefix}-{role}-{i}",
+            email=f"{prefix}-{role}-{i}@example.com",
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            role=role,
+            password=password,
+        )
+        for i in range(start, start + count)
+    ]
+
+
+def generate_dataset(
+    patients,
+    doctors,
+    records,
+    annotations_per_record=0.5,
+    doctors_per_patient=2,
+    vitals_per_patient=0,
+    batch_size=5000,
+    seed=0,
+    prefix="synth",
+    log=None,
+):
+    """
+    Fill the database with a reproducible synthetic clinical dataset using bulk inserts.
+
+    Creates doctors, patients, assignments (each patient gets `doctors_per_patient`
+    doctors), records spread uniformly over patients and annotations written by one
+    of the record's doctors, per-minute heart rate readings up to the current minute,
+    plus a `<prefix>-admin` superuser. All users share the
+    password `SYNTHETIC_PASSWORD`. Records are written in batches of `batch_size`
+    together with their change-log and search-index rows, so memory stays bounded.
+
+    Params:
+        patients (int): Number of patients.
+        doctors (int): Number of doctors.
+        records (int): Number of health records.
+        annotations_per_record (float): Average number of annotations per record.
+        doctors_per_patient (int): Assigned doctors per patient.
+        vitals_per_patient (int): Heart rate readings per patient.
+        batch_size (int): Rows per `bulk_create` call.
+        seed (int): Random seed; the same seed produces the same dataset.
+        prefix (str): Username prefix, so several datasets can coexist.
+        log (callable): Optional progress callback taking a message.
+    Returns:
+        dict: Number of rows created per model.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    password = make_password(SYNTHETIC_PASSWORD)
+    counts = dict.fromkeys(
+        ["users", "doctors", "patients", "assignments", "records", "annotations", "vitals"], 0
+    )
+
+    with transaction.atomic():
+        User.objects.create_superuser(
+            username=f"{prefix}-admin", email=f"{prefix}-admin@example.com", password=SYNTHETIC_PASSWORD
+        )
+        counts["users"] += 1
+
+    doctor_ids, patient_ids = [], []
+    for role, total, ids in (("doctor", doctors, doctor_ids), ("patient", patients, patient_ids)):
+        for start in range(0, total, batch_size):
+            with transaction.atomic():
+                users = User.objects.bulk_create(
+                    _users(rng, role, prefix, start, min(batch_size, total - start), password)
+                )
+                if role == "doctor":
+                    profiles = Doctor.objects.bulk_create(
+                        [Doctor(user=user, specialties=rng.choice(SPECIALTIES)) for user in users]
+                    )
+                else:
+                    profiles = Patient.objects.bulk_create(
+                        [Patient(user=user, health_insurance_number=f"INS{user.pk:012d}") for user in users]
+                    )
+            ids.extend(profile.pk for profile in profiles)
+            counts["users"] += len(users)
+            counts[f"{role}s"] += len(profiles)
+        log(f"Created {len(ids)} {role}s.")
+
+    # Each patient's doctors, also used to pick who annotates their records
+    care_team = {}
+    if doctor_ids:
+        for start in range(0, len(patient_ids), batch_size):
+            assignments = []
+            for patient_id in patient_ids[start:start + batch_size]:
+                team = rng.sample(doctor_ids, k=min(doctors_per_patient, len(doctor_ids)))
+                care_team[patient_id] = team
+                assignments.extend(
+                    DoctorPatientAssignment(doctor_id=doctor_id, patient_id=patient_id) for doctor_id in team
+                )
+            DoctorPatientAssignment.objects.bulk_create(assignments)
+            counts["assignments"] += len(assignments)
+        log(f"Created {counts['assignments']} assignments.")
+
+    for start in range(0, records if patient_ids else 0, batch_size):
+        with sharding.atomic():
+            batch = HealthRecord.objects.bulk_create(
+                [
+                    HealthRecord(patient_id=rng.choice(patient_ids), data=synthetic_record(rng))
+                    for _ in range(min(batch_size, records - start))
+                ]
+            )
+            annotations = []
+            for record in batch:
+                team = care_team.get(record.patient_id)
+                if not team:
+                    continue
+                count = int(annotations_per_record) + (rng.random() < annotations_per_record % 1)
+                annotations.extend(
+                    Annotation(record=record, doctor_id=rng.choice(team), comment=rng.choice(COMMENTS))
+                    for _ in range(count)
+                )
+            Annotation.objects.bulk_create(annotations)
+            # bulk_create bypasses the signals maintaining the change log and search index
+            log_record_changes(batch)
+            index_records(record.pk for record in batch)
+        counts["records"] += len(batch)
+        counts["annotations"] += len(annotations)
+        log(f"Created {counts['records']} records.")
+
+    end = timezone.now().replace(second=0, microsecond=0)
+    for patient_id in patient_ids if vitals_per_patient else []:
+        resting = rng.uniform(55, 85)
+        for start in range(0, vitals_per_patient, batch_size):
+            with sharding.atomic([patient_id]):
+                vitals = VitalObservation.objects.bulk_create(
+                    [
+                        VitalObservation(
+                            patient_id=patient_id,
+                            code=HEART_RATE_CODE,
+                            timestamp=end - datetime.timedelta(minutes=minute),
+                            # Daily rhythm plus noise
+                            value=round(resting + 10 * math.sin(minute * math.pi / 720) + rng.gauss(0, 3), 1),
+                        )
+                        for minute in range(start, min(start + batch_size, vitals_per_patient))
+                    ]
+                )
+                refresh_rollups(patient_id, vitals)
+        counts["vitals"] += vitals_per_patient
+    if vitals_per_patient:
+        log(f"Created {counts['vitals']} vitals.")
+
+    return counts
@@ -0,0 +1,64 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """
+    Test mixin that enforces a maximum number of SQL queries per request.
+
+    Usage:
+        class MyTests(QueryBudgetMixin, APITestCase):
+            def test_list(self):
+                with self.assertQueryBudget(5):
+                    self.client.get(url)
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget, using=DEFAULT_DB_ALIAS):
+        """
+        Fail if the wrapped block executes more than `budget` queries.
+
+        Params:
+            budget (int): Maximum number of queries allowed.
+            using (str): Database alias to capture queries on.
+        """
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = "\n".join(
+                f"{i}. {query['sql']}"
+                for i, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(
+                f"{executed} queries executed, budget is {budget}.\nCaptured queries were:\n{queries}"
+            )
+
+    def assertFlatQueryBudget(self, request, grow, budget):
+        """
+        Assert that `request()` stays within `budget` queries and that its query count
+        does not change after `grow()` has added more rows to the result set.
+
+        `request()` is called once beforehand so that per-instance caches (e.g. the
+        profile of a force-authenticated user) do not skew the comparison.
+
+        Params:
+            request (callable): Performs the request under test and returns the response.
+            grow (callable): Adds more rows that `request()` is expected to return.
+            budget (int): Maximum number of queries allowed per request.
+        """
+        request()
+        with self.assertQueryBudget(budget) as before:
+            request()
+        grow()
+        with self.assertQueryBudget(budget) as after:
+            request()
+
+        self.assertEqual(
+            len(before.captured_queries),
+            len(after.captured_queries),
+            "Query count grows with the size of the result set.",
+        )
@@ -0,0 +1,32 @@
+from asgiref.sync import sync_to_async
+from rest_framework.test import APITestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from api.models import User
+
+
+class UserDetailTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        self.client.force_authenticate(self.user)
+
+    def test_conditional_get(self):
+        url = reverse("user_detail")
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.put(url, {"first_name": "Ana"})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["first_name"], "Ana")
+
+    async def test_async_detail_matches_sync_view(self):
+        expected = await sync_to_async(self.client.get)(reverse("user_detail"))
+        headers = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        response = await self.async_client.get(reverse("user_detail_async"), headers=headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), expected.json())
+        self.assertEqual(response["ETag"], expected["ETag"])
@@ -1,8 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import UserDetailView
+from .views import UserDetailView, async_user_detail
 
 
 urlpatterns = [
     path('', UserDetailView.as_view(), name='user_detail'),
+    path('async/', async_user_detail, name='user_detail_async'),
 ]
\ No newline at end of file
@@ -4,9 +4,18 @@ from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.exceptions import ValidationError
 
+from api.asynchronous import async_api_view, render_json
+from api.conditional import make_etag, not_modified_response, set_validators
 from .serializers import UserSerializer
 
 
+def user_etag(user):
+    """
+    ETag of the profile fields returned by the user detail views.
+    """
+    return make_etag(user.pk, user.username, user.email, user.first_name, user.last_name, user.role)
+
+
 class UserDetailView(APIView):
     """
     API view for authenticated users to manage their profile.
@@ -22,9 +31,15 @@ class UserDetailView(APIView):
     def get(self, request):
         """
         Retrieve details of the currently authenticated user.
+
+        Answers 304 Not Modified when the client's ETag matches the current profile.
         """
+        etag = user_etag(request.user)
+        not_modified = not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
         serializer = UserSerializer(request.user)
-        return Response(serializer.data)
+        return set_validators(Response(serializer.data), etag)
 
     def put(self, request):
         """
@@ -57,3 +72,21 @@ class UserDetailView(APIView):
 
         request.user.delete()
         return Response({"detail": "User deleted and logged out."}, status=status.HTTP_204_NO_CONTENT)
+
+
+@async_api_view()
+async def async_user_detail(request):
+    """
+    GET /user_detail/async/
+    -----------------------
+    Async variant of `UserDetailView.get`, for ASGI deployments.
+
+    Returns:
+        200 OK with the user's details,
+        304 Not Modified if the client's ETag matches the current profile.
+    """
+    etag = user_etag(request.user)
+    not_modified = not_modified_response(request, etag)
+    if not_modified is not None:
+        return not_modified
+    return set_validators(render_json(UserSerializer(request.user).data), etag)
@@ -0,0 +1,20 @@
+import math
+
+from rest_framework import serializers
+from api.models import VitalObservation
+
+
+class VitalObservationSerializer(serializers.ModelSerializer):
+    """
+    Serializer for one reading of the VitalObservation model.
+    The patient is the authenticated user, never part of the payload.
+    """
+
+    class Meta:
+        model = VitalObservation
+        fields = ["code", "timestamp", "value"]
+
+    def validate_value(self, value):
+        if not math.isfinite(value):
+            raise serializers.ValidationError("A finite number is required.")
+        return value
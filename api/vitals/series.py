@@ -0,0 +1,328 @@
+import datetime
+import itertools
+import math
+from collections import defaultdict
+
+from django.db import NotSupportedError
+from django.db.models import FloatField, Func, Q
+
+from api.models import VitalObservation, VitalRollup
+
+try:
+    import numpy as np
+except ImportError:  # Optional: fall back to pure Python, much slower on long series
+    np = None
+
+
+METHODS = ("lttb", "min", "max", "mean")
+
+# Width of the rollups, in seconds
+ROLLUP_SECONDS = 3600
+# Series spanning at least this many rollups per returned point are computed from rollups
+ROLLUPS_PER_POINT = 4
+
+
+class Epoch(Func):
+    """
+    Seconds since the Unix epoch of a datetime expression, as a float.
+
+    Lets series be read as plain floats instead of datetimes, which are far slower to
+    build. Precise to the microsecond on PostgreSQL, rounded to the millisecond on
+    SQLite (whose julianday() is off by a few microseconds).
+    """
+
+    arity = 1
+    output_field = FloatField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"Vitals series are not supported on {connection.vendor}.")
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template="EXTRACT(EPOCH FROM %(expressions)s)::double precision", **extra_context
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template="ROUND((julianday(%(expressions)s) - 2440587.5) * 86400.0, 3)", **extra_context
+        )
+
+
+def load_series(queryset):
+    """
+    Read the timestamps (epoch seconds) and values of vital observations, in time order.
+
+    Params:
+        queryset (QuerySet): Observations of one patient and code.
+    Returns:
+        (array, array): NumPy arrays, or lists without NumPy.
+    """
+    rows = queryset.order_by("timestamp").values_list(Epoch("timestamp"), "value")
+    if np is None:
+        timestamps, values = [], []
+        for timestamp, value in rows:
+            timestamps.append(timestamp)
+            values.append(value)
+        return timestamps, values
+    pairs = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.float64).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def load_rollups(queryset):
+    """
+    Read hourly rollups in time order, with their times as epoch seconds.
+
+    Returns:
+        tuple: Columns `start`, `count`, `total`, `minimum`, `minimum_at`, `maximum`
+        and `maximum_at`, as NumPy arrays or lists without NumPy.
+    """
+    rows = queryset.order_by("start").values_list(
+        Epoch("start"), "count", "total", "minimum", Epoch("minimum_at"), "maximum", Epoch("maximum_at")
+    )
+    if np is None:
+        return tuple(map(list, zip(*rows))) or ([],) * 7
+    return tuple(np.fromiter(itertools.chain.from_iterable(rows), dtype=np.float64).reshape(-1, 7).T)
+
+
+def refresh_rollups(patient_id, observations):
+    """
+    Recompute the hourly rollups of the hours of newly ingested readings from the
+    readings stored for those hours, which also covers readings ingested before and
+    resent duplicates. Only the touched hours are read, one range per run of
+    consecutive hours. Callers serialize concurrent refreshes of a patient, otherwise
+    each would rebuild the same hour from its own snapshot.
+
+    Params:
+        patient_id (int): Patient of the readings.
+        observations (list[VitalObservation]): The ingested readings.
+    """
+    hours = defaultdict(set)
+    for observation in observations:
+        hours[observation.code].add(_hour(observation.timestamp))
+
+    rollups = []
+    for code, starts in hours.items():
+        summaries = {}
+        readings = VitalObservation.objects.filter(
+            _hour_ranges(sorted(starts)), patient_id=patient_id, code=code
+        ).values_list("timestamp", "value")
+        for timestamp, value in readings:
+            start = _hour(timestamp)
+            rollup = summaries.get(start)
+            if rollup is None:
+                summaries[start] = VitalRollup(
+                    patient_id=patient_id, code=code, start=start, count=1, total=value,
+                    minimum=value, minimum_at=timestamp, maximum=value, maximum_at=timestamp,
+                )
+                continue
+            rollup.count += 1
+            rollup.total += value
+            if value < rollup.minimum:
+                rollup.minimum, rollup.minimum_at = value, timestamp
+            if value > rollup.maximum:
+                rollup.maximum, rollup.maximum_at = value, timestamp
+        rollups.extend(summaries.values())
+
+    VitalRollup.objects.bulk_create(
+        rollups,
+        update_conflicts=True,
+        unique_fields=["patient", "code", "start"],
+        update_fields=["count", "total", "minimum", "minimum_at", "maximum", "maximum_at"],
+    )
+
+
+def _hour_ranges(starts):
+    """
+    Return a filter on `timestamp` matching the hours starting at `starts` (sorted),
+    merging consecutive hours into one range.
+    """
+    hour = datetime.timedelta(seconds=ROLLUP_SECONDS)
+    ranges = []
+    for start in starts:
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = start + hour
+        else:
+            ranges.append([start, start + hour])
+    condition = Q()
+    for start, end in ranges:
+        condition |= Q(timestamp__gte=start, timestamp__lt=end)
+    return condition
+
+
+def _hour(timestamp):
+    return datetime.datetime.fromtimestamp(
+        timestamp.timestamp() // ROLLUP_SECONDS * ROLLUP_SECONDS, datetime.timezone.utc
+    )
+
+
+def _datetime(seconds):
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc)
+
+
+def downsample_range(observations, rollups, start, end, points, method):
+    """
+    Reduce the readings of one vital sign over [start, end) to at most `points`
+    points for charting.
+
+    Short ranges are computed from the readings. Ranges of at least
+    `ROLLUPS_PER_POINT` hours per point are computed from hourly rollups instead,
+    reading a few thousand rows rather than up to a few hundred thousand: the range is
+    widened to whole hours, buckets are a whole number of hours wide, and LTTB runs
+    on the minimum and maximum reading of each hour (MinMaxLTTB), which preserves the
+    same extremes as LTTB on every reading.
+
+    Params:
+        observations (QuerySet): Readings of the patient and vital sign.
+        rollups (QuerySet): Rollups of the same patient and vital sign.
+        start, end (datetime): Bounds of the range.
+        points (int): Maximum number of points returned (at least 3).
+        method (str): "lttb" keeps the readings that best preserve the shape of the
+            series (Largest-Triangle-Three-Buckets); "min", "max" and "mean" aggregate
+            equal-width time buckets, timestamped with their start.
+    Returns:
+        (float, float, int, list[(float, float)]): Bounds of the range actually used
+        and number of readings in it, then the points; times are epoch seconds.
+    """
+    start, end = start.timestamp(), end.timestamp()
+    if end - start < ROLLUPS_PER_POINT * points * ROLLUP_SECONDS:
+        timestamps, values = load_series(
+            observations.filter(timestamp__gte=_datetime(start), timestamp__lt=_datetime(end))
+        )
+        if method == "lttb":
+            return start, end, len(timestamps), lttb(timestamps, values, points)
+        return start, end, len(timestamps), bucket_aggregates(
+            timestamps, values, start, (end - start) / points, points, method
+        )
+
+    start = start // ROLLUP_SECONDS * ROLLUP_SECONDS
+    end = -(-end // ROLLUP_SECONDS) * ROLLUP_SECONDS
+    starts, counts, totals, minimums, minimum_at, maximums, maximum_at = load_rollups(
+        rollups.filter(start__gte=_datetime(start), start__lt=_datetime(end))
+    )
+    count = int(sum(counts))
+    if method == "lttb":
+        timestamps, values = _extremes(minimum_at, minimums, maximum_at, maximums)
+        return start, end, count, lttb(timestamps, values, points)
+
+    width = math.ceil((end - start) / points / ROLLUP_SECONDS) * ROLLUP_SECONDS
+    buckets = math.ceil((end - start) / width)
+    if method == "mean":
+        return start, end, count, bucket_aggregates(starts, totals, start, width, buckets, method, counts)
+    values = minimums if method == "min" else maximums
+    return start, end, count, bucket_aggregates(starts, values, start, width, buckets, method)
+
+
+def _extremes(minimum_at, minimums, maximum_at, maximums):
+    """
+    Merge the minimum and maximum readings of rollups into one series in time order,
+    keeping single-reading hours once.
+    """
+    if np is None:
+        pairs = list(zip(minimum_at, minimums))
+        pairs += [(at, value) for at, value, low_at in zip(maximum_at, maximums, minimum_at) if at != low_at]
+        pairs.sort()
+        return [at for at, _ in pairs], [value for _, value in pairs]
+    distinct = maximum_at != minimum_at
+    timestamps = np.concatenate((minimum_at, maximum_at[distinct]))
+    values = np.concatenate((minimums, maximums[distinct]))
+    order = np.argsort(timestamps, kind="stable")
+    return timestamps[order], values[order]
+
+
+def bucket_aggregates(timestamps, values, start, width, buckets, method, counts=None):
+    """
+    Return the minimum, maximum or mean value of each non-empty bucket of `buckets`
+    buckets of `width` seconds from `start`.
+
+    With `counts`, each value is the sum of that many readings (rollup totals), and
+    means are weighted accordingly.
+    """
+    if np is None:
+        groups = {}
+        for index, timestamp in enumerate(timestamps):
+            groups.setdefault(min(int((timestamp - start) // width), buckets - 1), []).append(index)
+        if method == "mean":
+            return [
+                (
+                    start + bucket * width,
+                    math.fsum(values[i] for i in group) / (sum(counts[i] for i in group) if counts else len(group)),
+                )
+                for bucket, group in groups.items()
+            ]
+        reduce = min if method == "min" else max
+        return [(start + bucket * width, reduce(values[i] for i in group)) for bucket, group in groups.items()]
+
+    if not len(timestamps):
+        return []
+    index = np.minimum(((timestamps - start) // width).astype(np.int64), buckets - 1)
+    if method == "mean":
+        sizes = np.bincount(index, weights=counts, minlength=buckets)
+        sums = np.bincount(index, weights=values, minlength=buckets)
+        filled = np.flatnonzero(sizes)
+        aggregates = sums[filled] / sizes[filled]
+    else:
+        # Timestamps are sorted, so each bucket is a contiguous run of the series
+        starts = np.flatnonzero(np.diff(index, prepend=-1))
+        filled = index[starts]
+        aggregates = (np.minimum if method == "min" else np.maximum).reduceat(values, starts)
+    return list(zip((start + filled * width).tolist(), aggregates.tolist()))
+
+
+def _lttb_bounds(count, threshold):
+    # Bucket i of the points between the first and the last spans [bounds[i], bounds[i + 1]);
+    # the last point is a bucket of its own
+    every = (count - 2) / (threshold - 2)
+    return [int(i * every) + 1 for i in range(threshold - 2)] + [count - 1, count]
+
+
+def lttb(timestamps, values, threshold):
+    """
+    Downsample a series to `threshold` points with Largest-Triangle-Three-Buckets
+    (Steinarsson, 2013), which keeps peaks and troughs that averaging would flatten.
+
+    The first and last points are kept. Every other bucket keeps the point forming the
+    largest triangle with the point kept in the previous bucket and the average of the
+    next bucket. With NumPy, all bucket averages are computed at once with
+    `add.reduceat` and the triangle areas of each bucket in one vectorized operation.
+    """
+    count = len(timestamps)
+    if count <= threshold:
+        if np is None:
+            return list(zip(timestamps, values))
+        return list(zip(timestamps.tolist(), values.tolist()))
+
+    bounds = _lttb_bounds(count, threshold)
+    if np is None:
+        # Relative timestamps keep the areas precise
+        origin = timestamps[0]
+        x = [timestamp - origin for timestamp in timestamps]
+        selected, a = [0], 0
+        for i in range(threshold - 2):
+            next_start, next_stop = bounds[i + 1], bounds[i + 2]
+            average_x = math.fsum(x[next_start:next_stop]) / (next_stop - next_start)
+            average_y = math.fsum(values[next_start:next_stop]) / (next_stop - next_start)
+            x_a, y_a = x[a], values[a]
+            a = max(
+                range(bounds[i], bounds[i + 1]),
+                key=lambda j: abs((x_a - average_x) * (values[j] - y_a) - (x_a - x[j]) * (average_y - y_a)),
+            )
+            selected.append(a)
+        selected.append(count - 1)
+        return [(timestamps[j], values[j]) for j in selected]
+
+    x = timestamps - timestamps[0]
+    bounds = np.array(bounds)
+    sizes = np.diff(bounds)
+    averages_x = np.add.reduceat(x, bounds[:-1]) / sizes
+    averages_y = np.add.reduceat(values, bounds[:-1]) / sizes
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1], a = 0, count - 1, 0
+    for i in range(threshold - 2):
+        start, stop = bounds[i], bounds[i + 1]
+        x_a, y_a = x[a], values[a]
+        areas = np.abs(
+            (x_a - averages_x[i + 1]) * (values[start:stop] - y_a) - (x_a - x[start:stop]) * (averages_y[i + 1] - y_a)
+        )
+        a = start + int(areas.argmax())
+        selected[i + 1] = a
+    return list(zip(timestamps[selected].tolist(), values[selected].tolist()))
@@ -0,0 +1,237 @@
+import datetime
+import math
+from unittest import mock, skipIf
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from api.models import Doctor, DoctorPatientAssignment, Patient, User, VitalObservation, VitalRollup
+from api.vitals import series
+
+
+HEART_RATE = "8867-4"
+
+
+class VitalIngestTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        self.patient = Patient.objects.create(user=self.user)
+        self.url = reverse("vitals-list")
+        self.observations = [
+            {"code": HEART_RATE, "timestamp": f"2025-01-01T08:{minute:02d}:00Z", "value": 60 + minute}
+            for minute in range(10)
+        ]
+
+    def test_ingest_is_idempotent(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(self.url, {"observations": self.observations}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {"received": 10})
+
+        # A resent batch does not duplicate readings
+        response = self.client.post(self.url, {"observations": self.observations[5:]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(VitalObservation.objects.filter(patient=self.patient).count(), 10)
+
+        rollup = VitalRollup.objects.get(patient=self.patient)
+        self.assertEqual((rollup.count, rollup.total, rollup.minimum, rollup.maximum), (10, 645.0, 60.0, 69.0))
+        self.assertEqual(rollup.maximum_at.isoformat(), "2025-01-01T08:09:00+00:00")
+
+    def test_invalid_batch_is_rejected(self):
+        self.client.force_authenticate(self.user)
+        invalid = self.observations + [{"code": HEART_RATE, "timestamp": "yesterday", "value": "NaN"}]
+        response = self.client.post(self.url, {"observations": invalid}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data["observations"][10]), {"timestamp", "value"})
+        self.assertFalse(VitalObservation.objects.exists())
+
+        response = self.client.post(self.url, {"observations": "60 bpm"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_only_patients_ingest(self):
+        doctor = User.objects.create_user(username="doc1", password="pass123", email="testd@test.com", role="doctor")
+        Doctor.objects.create(user=doctor)
+        self.client.force_authenticate(doctor)
+        response = self.client.post(self.url, {"observations": self.observations}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class VitalSeriesTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        self.patient = Patient.objects.create(user=self.user)
+        self.doctor_user = User.objects.create_user(username="doc1", password="pass123", email="testd@test.com", role="doctor")
+        self.doctor = Doctor.objects.create(user=self.doctor_user)
+        self.url = reverse("vitals-series")
+
+        # A day of per-minute readings with a spike at noon
+        self.start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        VitalObservation.objects.bulk_create(
+            VitalObservation(
+                patient=self.patient,
+                code=HEART_RATE,
+                timestamp=self.start + datetime.timedelta(minutes=minute),
+                value=180.0 if minute == 720 else 60.0 + minute % 10,
+            )
+            for minute in range(1440)
+        )
+        self.params = {"code": HEART_RATE, "start": "2025-01-01T00:00:00Z", "end": "2025-01-02T00:00:00Z"}
+
+    def test_lttb_keeps_shape(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url, {**self.params, "points": 100})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 1440)
+
+        points = response.data["points"]
+        self.assertEqual(len(points), 100)
+        self.assertEqual(points[0], ["2025-01-01T00:00:00Z", 60.0])
+        self.assertEqual(points[-1], ["2025-01-01T23:59:00Z", 69.0])
+        self.assertIn(["2025-01-01T12:00:00Z", 180.0], points)
+
+    def test_bucket_aggregates(self):
+        self.client.force_authenticate(self.user)
+        for method, expected in (("min", 60.0), ("max", 180.0), ("mean", 66.5)):
+            response = self.client.get(self.url, {**self.params, "points": 24, "method": method})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data["points"]), 24)
+            self.assertEqual(response.data["points"][12][0], "2025-01-01T12:00:00Z")
+            self.assertAlmostEqual(response.data["points"][12][1], expected)
+
+    def test_doctor_needs_assignment(self):
+        self.client.force_authenticate(self.doctor_user)
+        response = self.client.get(self.url, self.params)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {**self.params, "patient": self.patient.id})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        DoctorPatientAssignment.objects.create(doctor=self.doctor, patient=self.patient)
+        cache.clear()
+        response = self.client.get(self.url, {**self.params, "patient": self.patient.id, "points": 2000})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["points"]), 1440)
+
+    def test_invalid_parameters(self):
+        self.client.force_authenticate(self.user)
+        for params in (
+            {"start": self.params["start"]},
+            {**self.params, "method": "median"},
+            {**self.params, "points": 2},
+            {**self.params, "start": "tomorrow"},
+            {**self.params, "start": self.params["end"]},
+        ):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class VitalRollupSeriesTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="pat1", password="pass123", email="testp@test.com", role="patient")
+        self.patient = Patient.objects.create(user=self.user)
+        self.url = reverse("vitals-series")
+
+        # Three days of per-minute readings with a spike at 09:20 on the second day
+        start = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+        self.client.force_authenticate(self.user)
+        observations = [
+            {
+                "code": HEART_RATE,
+                "timestamp": (start + datetime.timedelta(minutes=minute)).isoformat(),
+                "value": 180.0 if minute == 2000 else 60.0 + minute % 10,
+            }
+            for minute in range(4320)
+        ]
+        response = self.client.post(reverse("vitals-list"), {"observations": observations}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.params = {"code": HEART_RATE, "start": "2025-01-01T00:30:00Z", "end": "2025-01-03T23:30:00Z"}
+
+    def test_long_range_uses_rollups(self):
+        self.assertEqual(VitalRollup.objects.count(), 72)
+        for method, expected in (("min", 60.0), ("max", 180.0), ("mean", 64.5 + 120 / 360)):
+            response = self.client.get(self.url, {**self.params, "points": 12, "method": method})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            # The range is widened to whole hours, in buckets of whole hours
+            self.assertEqual(response.data["start"], "2025-01-01T00:00:00Z")
+            self.assertEqual(response.data["end"], "2025-01-04T00:00:00Z")
+            self.assertEqual(response.data["count"], 4320)
+            self.assertEqual(len(response.data["points"]), 12)
+            self.assertEqual(response.data["points"][5][0], "2025-01-02T06:00:00Z")
+            self.assertAlmostEqual(response.data["points"][5][1], expected)
+
+    def test_lttb_on_rollups_keeps_spike(self):
+        response = self.client.get(self.url, {**self.params, "points": 12})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["points"]), 12)
+        self.assertIn(["2025-01-02T09:20:00Z", 180.0], response.data["points"])
+
+    def test_ingest_refreshes_only_touched_hours(self):
+        # A stale rollup between the two touched hours is left alone
+        VitalRollup.objects.filter(start="2025-01-02T00:00:00Z").update(count=0)
+        observations = [
+            {"code": HEART_RATE, "timestamp": "2025-01-01T05:10:30Z", "value": 20.0},
+            {"code": HEART_RATE, "timestamp": "2025-01-03T20:10:30Z", "value": 200.0},
+        ]
+        response = self.client.post(reverse("vitals-list"), {"observations": observations}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        rollups = VitalRollup.objects.filter(patient=self.patient)
+        early = rollups.get(start="2025-01-01T05:00:00Z")
+        self.assertEqual((early.count, early.minimum, early.maximum), (61, 20.0, 69.0))
+        late = rollups.get(start="2025-01-03T20:00:00Z")
+        self.assertEqual((late.count, late.minimum, late.maximum), (61, 60.0, 200.0))
+        self.assertEqual(rollups.get(start="2025-01-02T00:00:00Z").count, 0)
+
+
+class DownsamplingTests(SimpleTestCase):
+
+    def make_series(self, count):
+        timestamps = [1.7e9 + 60 * i for i in range(count)]
+        values = [math.sin(i / 50) * 20 + 70 + (i % 7) for i in range(count)]
+        if series.np is not None:
+            return series.np.array(timestamps), series.np.array(values)
+        return timestamps, values
+
+    def test_lttb(self):
+        timestamps, values = self.make_series(5000)
+        points = series.lttb(timestamps, values, 300)
+        self.assertEqual(len(points), 300)
+        self.assertEqual(points[0], (timestamps[0], values[0]))
+        self.assertEqual(points[-1], (timestamps[-1], values[-1]))
+        self.assertEqual([timestamp for timestamp, _ in points], sorted({timestamp for timestamp, _ in points}))
+        # Short series are returned as they are
+        self.assertEqual(len(series.lttb(timestamps[:10], values[:10], 300)), 10)
+
+    def test_bucket_aggregates(self):
+        timestamps, values = list(range(10)), [float(value) for value in range(10)]
+        if series.np is not None:
+            timestamps, values = series.np.array(timestamps, dtype=float), series.np.array(values)
+        self.assertEqual(series.bucket_aggregates(timestamps, values, 0, 5, 4, "min"), [(0, 0), (5, 5)])
+        self.assertEqual(series.bucket_aggregates(timestamps, values, 0, 5, 4, "max"), [(0, 4), (5, 9)])
+        self.assertEqual(series.bucket_aggregates(timestamps, values, 0, 5, 4, "mean"), [(0, 2), (5, 7)])
+
+    @skipIf(series.np is None, "NumPy is not installed")
+    def test_numpy_matches_python(self):
+        timestamps, values = self.make_series(5000)
+        vectorized = [series.lttb(timestamps, values, 200)] + [
+            series.bucket_aggregates(timestamps, values, timestamps[0], 1500, 200, method)
+            for method in ("min", "max", "mean")
+        ]
+        with mock.patch.object(series, "np", None):
+            timestamps, values = timestamps.tolist(), values.tolist()
+            python = [series.lttb(timestamps, values, 200)] + [
+                series.bucket_aggregates(timestamps, values, timestamps[0], 1500, 200, method)
+                for method in ("min", "max", "mean")
+            ]
+            for points, expected in zip(python, vectorized):
+                self.assertEqual([timestamp for timestamp, _ in points], [timestamp for timestamp, _ in expected])
+                for (_, value), (_, expected_value) in zip(points, expected):
+                    self.assertAlmostEqual(value, expected_value)
@@ -0,0 +1,10 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import VitalObservationViewSet
+
+router = DefaultRouter()
+router.register("", VitalObservationViewSet, basename="vitals")
+
+urlpatterns = [
+    path("", include(router.urls)),
+]
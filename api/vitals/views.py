@@ -0,0 +1,191 @@
+import datetime
+
+from django.utils import timezone
+from rest_framework import viewsets, permissions, serializers, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+
+from api import sharding
+from api.models import Patient, VitalObservation, VitalRollup
+from .serializers import VitalObservationSerializer
+from .series import METHODS, downsample_range, refresh_rollups
+from api.auth.authentication import resolve_role
+from api.auth.views import require_patient
+from api.cache import get_assigned_patient_ids
+
+
+class VitalObservationViewSet(viewsets.GenericViewSet):
+    """
+    ViewSet for the vital signs pushed by patients' devices.
+
+    - `POST /vitals/` stores a batch of the authenticated patient's readings.
+    - `GET /vitals/series/?code=` returns one vital sign of a patient over a time
+      range, downsampled for charting.
+    - Patients read their own vitals, doctors those of their **assigned patients**.
+    """
+
+    serializer_class = VitalObservationSerializer
+    stateless_auth = True
+    permission_classes = [permissions.IsAuthenticated]
+    ingest_max_observations = 50000
+    ingest_batch_size = 5000
+    series_points = 300
+    max_series_points = 5000
+    series_range = datetime.timedelta(days=1)
+
+    def get_queryset(self):
+        """
+        Filter vitals based on user type, like health records:
+        - Patients see their own vitals.
+        - Doctors see the vitals of assigned patients.
+        - Others get nothing.
+        """
+        role = resolve_role(self.request.user)
+
+        if role.patient is not None:
+            return VitalObservation.objects.filter(patient=role.patient)
+
+        if role.doctor is not None:
+            assigned_patients = get_assigned_patient_ids(role.doctor.id)
+            return VitalObservation.objects.filter(patient_id__in=assigned_patients)
+
+        return VitalObservation.objects.none()
+
+    def create(self, request):
+        """
+        Store a batch of the authenticated patient's vital readings.
+
+        The batch is validated as a whole, then written with `bulk_create` in batches
+        of `ingest_batch_size` inside one transaction, along with the hourly rollups
+        of the hours it covers. Readings already stored (same code and timestamp) are
+        skipped, so a device can safely resend a batch whose response it did not receive.
+        The patient row is locked first, so concurrent batches of a patient refresh their
+        rollups one after the other and each sees the readings of the previous one.
+
+        Request body:
+            - observations: list of objects with `code`, `timestamp` and `value`.
+
+        Returns:
+            201 Created with the number of `received` readings,
+            400 Bad Request if `observations` is not a list, is too long or has an
+            invalid item,
+            403 Forbidden if the user is not a patient.
+        """
+        patient = require_patient(request.user)
+        items = request.data.get("observations") if isinstance(request.data, dict) else None
+        if not isinstance(items, list):
+            raise ValidationError({"observations": "Expected a list of observations."})
+        if len(items) > self.ingest_max_observations:
+            raise ValidationError(
+                {"observations": f"At most {self.ingest_max_observations} observations per request."}
+            )
+
+        serializer = self.get_serializer(data=items, many=True)
+        if not serializer.is_valid():
+            raise ValidationError({"observations": serializer.errors})
+        observations = [VitalObservation(patient=patient, **item) for item in serializer.validated_data]
+        with sharding.atomic([patient.id]):
+            Patient.objects.select_for_update().get(pk=patient.id)
+            VitalObservation.objects.bulk_create(
+                observations, batch_size=self.ingest_batch_size, ignore_conflicts=True
+            )
+            refresh_rollups(patient.id, observations)
+        return Response({"received": len(observations)}, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=["get"])
+    def series(self, request):
+        """
+        Return one vital sign of a patient over a time range, downsampled for charting.
+
+        Readings are read as plain floats, without building model instances, and
+        reduced with NumPy when it is installed. Long ranges are computed from hourly
+        rollups and widened to whole hours (see `api.vitals.series`), so a year of
+        per-minute readings comes back as a few hundred points without reading every
+        reading. Timestamps are returned to the millisecond.
+
+        Query params:
+            - code: Code of the vital sign (e.g. LOINC 8867-4 for heart rate), required.
+            - patient: Patient id, required for doctors (must be an assigned patient).
+            - start, end: ISO 8601 datetimes bounding the range [start, end); `end`
+              defaults to now and `start` to one day before `end`.
+            - points: Maximum number of points returned (default 300, at most 5000).
+            - method: `lttb` (default) keeps the readings that best preserve the
+              shape of the series; `min`, `max` and `mean` aggregate equal-width
+              time buckets.
+
+        Returns:
+            200 OK with the range actually used, the `count` of readings in it and
+            the downsampled `points` as `[timestamp, value]` pairs,
+            400 Bad Request if a parameter is missing or invalid,
+            403 Forbidden if the doctor is not assigned to the patient.
+        """
+        role = resolve_role(request.user)
+        queryset = self.get_queryset()
+
+        code = request.query_params.get("code", "").strip()
+        if not code:
+            raise ValidationError({"code": "'code' parameter is missing."})
+
+        if role.patient is not None:
+            patient_id = role.patient.id
+        else:
+            patient_id = request.query_params.get("patient")
+            if not patient_id:
+                raise ValidationError({"patient": "'patient' parameter is missing."})
+            try:
+                patient_id = int(patient_id)
+            except ValueError:
+                raise ValidationError({"patient": "'patient' must be an integer."})
+            if role.doctor is None or patient_id not in get_assigned_patient_ids(role.doctor.id):
+                raise PermissionDenied("You are not assigned to this patient.")
+
+        timestamp_field = serializers.DateTimeField()
+        end = self._datetime_param(request, "end", timestamp_field) or timezone.now()
+        start = self._datetime_param(request, "start", timestamp_field) or end - self.series_range
+        if start >= end:
+            raise ValidationError({"start": "'start' must be before 'end'."})
+
+        try:
+            points = int(request.query_params.get("points", self.series_points))
+        except ValueError:
+            raise ValidationError({"points": "'points' must be an integer."})
+        if points < 3:
+            raise ValidationError({"points": "'points' must be at least 3."})
+        points = min(points, self.max_series_points)
+
+        method = request.query_params.get("method", "lttb")
+        if method not in METHODS:
+            raise ValidationError({"method": f"'method' must be one of {', '.join(METHODS)}."})
+
+        start, end, count, series = downsample_range(
+            queryset.filter(patient_id=patient_id, code=code),
+            VitalRollup.objects.filter(patient_id=patient_id, code=code),
+            start,
+            end,
+            points,
+            method,
+        )
+        return Response(
+            {
+                "patient": patient_id,
+                "code": code,
+                "method": method,
+                "start": self._timestamp(start, timestamp_field),
+                "end": self._timestamp(end, timestamp_field),
+                "count": count,
+                "points": [[self._timestamp(seconds, timestamp_field), value] for seconds, value in series],
+            }
+        )
+
+    def _datetime_param(self, request, name, field):
+        value = request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            return field.run_validation(value)
+        except ValidationError as exc:
+            raise ValidationError({name: exc.detail})
+
+    def _timestamp(self, seconds, field):
+        return field.to_representation(datetime.datetime.fromtimestamp(round(seconds, 3), datetime.timezone.utc))